@@ -0,0 +1,38 @@
+import os
+import signal
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", 1))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+keepalive = int(os.getenv("GUNICORN_KEEPALIVE", 75))
+timeout = int(os.getenv("GUNICORN_TIMEOUT", 30))
+# Heroku sends SIGKILL 30 seconds after SIGTERM, so leave room for the drain.
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", 25))
+accesslog = "-"
+
+
+# Gunicorn has no SIGTERM hook, so the worker's own handler is wrapped to
+# start the drain the moment the signal arrives.
+def post_worker_init(worker):
+    from telegram_bot import begin_drain
+
+    handle_exit = signal.getsignal(signal.SIGTERM)
+
+    def handle_term(sig, frame):
+        begin_drain()
+        handle_exit(sig, frame)
+
+    signal.signal(signal.SIGTERM, handle_term)
+
+
+def worker_int(worker):
+    from telegram_bot import begin_drain
+
+    begin_drain()
+
+
+def worker_exit(server, worker):
+    from telegram_bot import drain_budget, shutdown
+
+    shutdown(timeout=drain_budget(graceful_timeout))
@@ -1,5 +1,6 @@
 import telebot
 import os
+import time
 from flask import Flask, request
 from loguru import logger
 
@@ -9,23 +10,67 @@ from utils.process_img import process_img
 from utils.report import generate_report
 
 # from utils.practice_manager import run_practice
-from utils.db_models import Phrase
-from utils.db import firebase_connection, add_record
+from utils.db_models import Phrase, create_phrase, create_phrases
+from utils.db import connect_storage, add_record, add_records
 from utils.config_utils import get_allowed_users
 from utils.leitner import initialize_leitner
+from utils.update_queue import UpdateDispatcher
+from utils.update_dedup import SeenUpdates
+from utils.session_store import get_session_store
+from utils.outbox import Outbox, configure_session
+from utils.translation_cache import get_translation_cache
+from utils.progress_writer import get_progress_writer
+from utils.phrase_sync import get_phrase_sync
+from utils.warm_state import get_warm_state
 
 TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 HEROKU_APP_NAME = os.getenv("HEROKU_APP_NAME")
+UPDATE_PROCESSING_MODE = os.getenv("UPDATE_PROCESSING_MODE", "async")
 ALLOWED_USERS = get_allowed_users()
-bot = telebot.TeleBot(TOKEN, parse_mode="Markdown")
-db_client = firebase_connection()
+bot = telebot.TeleBot(TOKEN, parse_mode="Markdown", threaded=False)
+configure_session(pool_size=int(os.getenv("TELEGRAM_POOL_SIZE", 16)))
+outbox = Outbox(
+    bot,
+    per_chat_rate=float(os.getenv("TELEGRAM_PER_CHAT_RATE", 1.0)),
+    global_rate=float(os.getenv("TELEGRAM_GLOBAL_RATE", 30.0)),
+)
+
+
+def process_update(update):
+    with outbox.turn():
+        bot.process_new_updates([update])
+
+
+dispatcher = UpdateDispatcher(
+    handler=process_update,
+    max_workers=int(os.getenv("UPDATE_WORKERS", 8)),
+    max_pending=int(os.getenv("UPDATE_MAX_PENDING", 1000)),
+)
+seen_updates = SeenUpdates(
+    max_size=int(os.getenv("UPDATE_DEDUP_MAX_SIZE", 10000)),
+    ttl_seconds=float(os.getenv("UPDATE_DEDUP_TTL", 3600)),
+    db_path=os.getenv("UPDATE_DEDUP_DB_PATH"),
+)
+db_client = connect_storage()
 leitner = initialize_leitner(usernames=ALLOWED_USERS, db_client=db_client)
 server = Flask(__name__)
-user_states = {}
-last_msg_states = {}
-add_states = {}
-last_exercise = {}
-parsed_img_states = {}
+accepting_updates = True
+drain_started_at = None
+sessions = get_session_store()
+warm_state = get_warm_state(sessions, db_client)
+if warm_state is not None:
+    warm_state.restore()
+    warm_state.start()
+SESSION_PHRASE_FIELDS = {"phrase_id", "text", "translation"}
+
+
+def save_phrase_state(namespace, key, phrase):
+    sessions.set(namespace, key, phrase.model_dump(include=SESSION_PHRASE_FIELDS))
+
+
+def load_phrase_state(namespace, key):
+    data = sessions.get(namespace, key)
+    return Phrase(**data) if data else None
 
 
 @bot.message_handler(commands=["start"])
@@ -42,7 +87,7 @@ def send_welcome(message):
 
     keyboard.add(practice_button, add_button)
 
-    bot.send_message(
+    outbox.send_message(
         message.chat.id,
         "Oh, you finally showed up! Welcome to CrankyTutorBot, where I make sure you learn—or else.",
         reply_markup=keyboard,
@@ -56,14 +101,15 @@ def handle_photo(message):
     logger.info(f"Received photo from {username}")
 
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             message, "Who do you think you are? Picture upload isn’t for you. Shoo!"
         )
         logger.warning(f"Unauthorized practice attempt by user {username}")
     else:
         try:
             msg = "On it! Let me extract the phrases for you. Just a sec. I need to concentrate. brb."
-            bot.send_message(chat_id=message.chat.id, text=msg)
+            outbox.send_message(chat_id=message.chat.id, text=msg)
+            outbox.flush()
 
             file_info = bot.get_file(message.photo[-1].file_id)
             logger.info(f"File info: {file_info}")
@@ -77,7 +123,7 @@ def handle_photo(message):
             logger.info(f"Saved file to {file_path}")
 
             result = process_img(file_path, language)
-            parsed_img_states[username] = result
+            sessions.set("parsed_img", username, result)
             response = f"I processed the picture and extracted the following phrases: {result}. Do you want to add them?"
             keyboard = telebot.types.InlineKeyboardMarkup()
             yes_button = telebot.types.InlineKeyboardButton(
@@ -88,13 +134,13 @@ def handle_photo(message):
             )
 
             keyboard.add(yes_button, no_button)
-            bot.send_message(
+            outbox.send_message(
                 chat_id=message.chat.id, text=response, reply_markup=keyboard
             )
             logger.info(f"Processed image and sent response to {username}")
         except Exception as e:
             logger.error(f"Error processing photo from {username}: {e}")
-            bot.send_message(
+            outbox.send_message(
                 chat_id=message.chat.id,
                 text="Sorry, something went wrong while processing the photo.",
             )
@@ -106,13 +152,13 @@ def get_stats(message):
     logger.info(f"Received /stats command from {username}")
 
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             message, "Who do you think you are? This feature isn’t for you. Shoo!"
         )
         logger.warning(f"Unauthorized practice attempt by user {username}")
     else:
         stats = leitner[username].get_stats()
-        bot.send_message(
+        outbox.send_message(
             chat_id=message.chat.id,
             text=stats,
         )
@@ -126,7 +172,7 @@ def get_stats(message):
     )
 
     keyboard.add(practice_button, add_button)
-    bot.send_message(
+    outbox.send_message(
         chat_id=message.chat.id,
         text="Ready for the next challenge?",
         reply_markup=keyboard,
@@ -135,7 +181,7 @@ def get_stats(message):
     image_path = generate_report(leitner[username])
 
     with open(image_path, "rb") as image:
-        bot.send_photo(chat_id=message.chat.id, photo=image)
+        outbox.send_photo(chat_id=message.chat.id, photo=image.read())
 
 
 @bot.callback_query_handler(func=lambda call: call.data == "img_send_to_db")
@@ -152,28 +198,36 @@ def img_send_to_db(call):
 
     keyboard.add(practice_button, add_more_button)
 
-    phrases = parsed_img_states.get(username)
+    phrases = sessions.get("parsed_img", username)
     if isinstance(phrases, list):
-        for phrase in phrases:
-            try:
-                new_phrase = Phrase(text=phrase)
-                add_record(
-                    username=username,
-                    data=new_phrase,
-                    db_client=db_client,
+        new_phrases = create_phrases(phrases)
+        try:
+            outcomes = add_records(
+                username=username,
+                records=new_phrases,
+                db_client=db_client,
+            )
+        except Exception as e:
+            logger.error(f"Error adding phrases for {username}: {e}")
+            outcomes = [False] * len(new_phrases)
+
+        for new_phrase, added in zip(new_phrases, outcomes):
+            if added:
+                outbox.send_message(
+                    call.from_user.id, f"Added phrase: {new_phrase.text}"
+                )
+            else:
+                outbox.send_message(
+                    call.from_user.id, f"Failed to add phrase: {new_phrase.text}"
                 )
-                bot.send_message(call.from_user.id, f"Added phrase: {phrase}")
-            except Exception as e:
-                logger.error(f"Error adding phrase for {username}: {e}")
-                bot.send_message(call.from_user.id, f"Failed to add phrase: {phrase}")
 
-        bot.send_message(
+        outbox.send_message(
             call.from_user.id,
             "Well, I did my best. I added all of them. Now, let's see if you can actually translate them under pressure.",
             reply_markup=keyboard,
         )
     else:
-        bot.send_message(
+        outbox.send_message(
             call.from_user.id,
             "Well, that was a waste of time. I didn't manage to add any phrases. What a shame.",
             reply_markup=keyboard,
@@ -184,7 +238,7 @@ def img_send_to_db(call):
 def img_fallback(call):
     username = call.from_user.username
     logger.info(f"User {username} clicked 'No' to add phrases to the database")
-    parsed_img_states[username] = None
+    sessions.delete("parsed_img", username)
     keyboard = telebot.types.InlineKeyboardMarkup()
     practice_button = telebot.types.InlineKeyboardButton(
         text="Practice", callback_data="next_practice"
@@ -193,7 +247,7 @@ def img_fallback(call):
         text="Add phrase", callback_data="add_button"
     )
     keyboard.add(practice_button, add_button)
-    bot.send_message(
+    outbox.send_message(
         call.from_user.id,
         "Fine, I won't add them. Whatever. You're the boss. For now.",
         reply_markup=keyboard,
@@ -205,7 +259,7 @@ def add(message):
     username = message.from_user.username
     logger.info(f"Received /add command from {message.from_user.username}")
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             message, "Who do you think you are? This feature isn’t for you. Shoo!"
         )
         logger.warning(
@@ -217,7 +271,7 @@ def add(message):
             f"Adding new phrase for {message.from_user.username}: {message.text}"
         )
 
-        new_phrase = Phrase(text=message.text.split("/add ")[1])
+        new_phrase = create_phrase(message.text.split("/add ")[1])
 
         add_record(
             username=username,
@@ -237,7 +291,7 @@ def add(message):
 
         keyboard.add(practice_button, add_more_button)
 
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             "Fine, added it. Next time take an image. It's faster, more efficient, and less annoying.",
             reply_markup=keyboard,
@@ -248,7 +302,7 @@ def add(message):
 def practice(message):
     username = message.from_user.username
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             message, "Who do you think you are? This feature isn’t for you. Shoo!"
         )
         logger.warning(
@@ -258,12 +312,15 @@ def practice(message):
     else:
         try:
             task = leitner[username].gen_translation_task()
+            if not isinstance(task, Phrase):
+                outbox.reply_to(message, task)
+                return
             task_text = task.translation
             task_type = "Translate"
             logger.info(f"Task generated: {task_text}")
-            bot.reply_to(message, f"{task_type}: {task}")
-            last_exercise[message.from_user.id] = task_type
-            user_states[message.from_user.id] = task
+            outbox.reply_to(message, f"{task_type}: {task}")
+            sessions.set("exercise", message.from_user.id, task_type)
+            save_phrase_state("task", message.from_user.id, task)
         except Exception as e:
             logger.error(f"Error during practice: {e}")
 
@@ -273,22 +330,22 @@ def respond_to_text(message):
     user_id = message.from_user.id
     username = message.from_user.username
     user_msg = message.text
-    task = user_states.get(user_id)
-    task_desc = last_exercise.get(user_id)
+    task = load_phrase_state("task", user_id)
+    task_desc = sessions.get("exercise", user_id)
 
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             message, "Who do you think you are? This feature isn’t for you. Shoo!"
         )
         logger.warning(f"Unauthorized practice attempt by user {username}")
         return
-    elif user_states.get(user_id):
+    elif task:
         logger.info(f"User {username} submitted translation: {user_msg}")
 
         evaluation = evaluate_task(
             user_response=user_msg, test_phrase=task.translation, task_desc=task_desc
         )
-        bot.reply_to(message, evaluation["evaluation_text"])
+        outbox.reply_to(message, evaluation["evaluation_text"])
 
         keyboard = telebot.types.InlineKeyboardMarkup(row_width=2)
 
@@ -304,23 +361,23 @@ def respond_to_text(message):
         if evaluation["evaluation_outcome"] == 1:
             success_msg = leitner[username].add_correct_answer(phrase_id=task.phrase_id)
             if success_msg:
-                bot.send_message(
+                outbox.send_message(
                     message.chat.id,
                     success_msg,
                 )
         else:
             leitner[username].add_mistake(phrase_id=task.phrase_id)
 
-        bot.send_message(
+        outbox.send_message(
             message.chat.id, "Ready for the next challenge?", reply_markup=keyboard,
         )
 
-        user_states[user_id] = None
-        last_msg_states[user_id] = task
+        sessions.delete("task", user_id)
+        save_phrase_state("last_task", user_id, task)
 
-    elif add_states.get(user_id):
+    elif sessions.get("add", user_id):
         logger.info(f"User {username} added phrase: {user_msg}")
-        new_phrase = Phrase(text=user_msg)
+        new_phrase = create_phrase(user_msg)
         add_record(
             username=username,
             data=new_phrase,
@@ -336,15 +393,15 @@ def respond_to_text(message):
         )
         keyboard.add(practice_button, add_more_button)
 
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             "Fine, added it. Next time take an image. It's faster, more efficient, and less annoying.",
             reply_markup=keyboard,
         )
-        add_states[message.from_user.id] = None
+        sessions.delete("add", message.from_user.id)
     else:
         logger.info(f"User {username} added phrase: {user_msg}")
-        new_phrase = Phrase(text=message.text.split("/add ")[1])
+        new_phrase = create_phrase(message.text.split("/add ")[1])
 
         add_record(
             username=username,
@@ -362,7 +419,7 @@ def respond_to_text(message):
         )
         keyboard.add(practice_button, add_more_button)
 
-        bot.send_message(
+        outbox.send_message(
             message.chat.id,
             f"Did you really just say {message.text}? Well, you're not in a practice session right now. Use *practice* command to start.",
             reply_markup=keyboard,
@@ -375,7 +432,7 @@ def handle_next_practice(call):
     username = call.from_user.username
     logger.info(f"User {username} clicked 'Next Practice'")
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             call, "Who do you think you are? This feature isn’t for you. Shoo!"
         )
         logger.warning(
@@ -385,12 +442,15 @@ def handle_next_practice(call):
     else:
         try:
             task = leitner[username].gen_translation_task()
+            if not isinstance(task, Phrase):
+                outbox.send_message(user_id, task)
+                return
             task_text = task.translation
             task_type = "Translate"
             logger.info(f"Task generated: {task_text}")
-            bot.send_message(user_id, f"{task_type}: {task_text}")
-            last_exercise[call.from_user.id] = task_type
-            user_states[call.from_user.id] = task
+            outbox.send_message(user_id, f"{task_type}: {task_text}")
+            sessions.set("exercise", call.from_user.id, task_type)
+            save_phrase_state("task", call.from_user.id, task)
         except Exception as e:
             logger.error(f"Error during practice: {e}")
 
@@ -414,14 +474,14 @@ def handle_explain_button(call):
     keyboard.add(add_button, next_practice_button)
 
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             call, "Who do you think you are? This feature isn’t for you. Shoo!"
         )
         logger.warning(
             f"Unauthorized practice attempt by user {call.from_user.username}"
         )
     else: 
-        last_msg = last_msg_states.get(user_id)
+        last_msg = load_phrase_state("last_task", user_id)
 
         if last_msg:
             correct_response = last_msg.text
@@ -432,24 +492,25 @@ def handle_explain_button(call):
 
             try:
                 explanation = f"Correct response: *{correct_response}*\n\n{explanation}"
-                bot.send_message(
+                outbox.send_message(
                 user_id,
                 explanation,
                 reply_markup=keyboard,
             )
+                outbox.flush()
             except Exception as e:
                 explanation = f"I don't have any good explanation for you. What a shame. But at least I can tell you that the correct answer is:*{correct_response}*. Try to remember it, okay? Even if you don't want to. Just do it."
 
                 explain_grammar.cache_clear()
 
-                bot.send_message(
+                outbox.send_message(
                 user_id,
                 explanation,
                 reply_markup=keyboard,
                 )
                 logger.error(f"Failed to generate explanation for user {username}: {e}")
         else:
-            bot.send_message(
+            outbox.send_message(
                 user_id,
                 "Something or someone terribly messed up. I can't find the last message. I'm not happy about it. But I'm not going to do anything about it. Just so you know.",
                 reply_markup=keyboard,
@@ -463,31 +524,58 @@ def handle_add_button(call):
     logger.info(f"User {username} clicked 'Add phrase' button")
 
     if username not in ALLOWED_USERS:
-        bot.reply_to(
+        outbox.reply_to(
             call, "Who do you think you are? This feature isn’t for you. Shoo!"
         )
         logger.warning(
             f"Unauthorized practice attempt by user {call.from_user.username}"
         )
     else:
-        bot.send_message(
+        outbox.send_message(
             user_id, "Provide me a phrase to work with. Don't keep it waiting."
         )
-        add_states[user_id] = 1
+        sessions.set("add", user_id, 1)
 
 
 @server.route("/" + TOKEN, methods=["POST"])
 def getMessage():
+    # A draining worker refuses updates so Telegram redelivers them.
+    if not accepting_updates:
+        return "Service Unavailable", 503
     try:
         msg = request.stream.read().decode("utf-8")
         logger.info(f"Received a new message from Telegram: {msg}")
-        bot.process_new_updates([telebot.types.Update.de_json(msg)])
+        update = telebot.types.Update.de_json(msg)
+        if update is None:
+            logger.warning("Received an empty update.")
+            return "Bad Request", 400
+
+        if not seen_updates.check_and_add(update.update_id):
+            return "!", 200
+
+        if UPDATE_PROCESSING_MODE == "sync":
+            process_update(update)
+        elif not dispatcher.submit(update):
+            seen_updates.discard(update.update_id)
+            return "Service Unavailable", 503
         return "!", 200
     except Exception as e:
         logger.error(f"Error processing the message: {e}")
         return "Internal Server Error", 500
 
 
+@server.route("/healthz")
+def readiness():
+    status = {
+        "ready": accepting_updates,
+        "pending_updates": dispatcher.pending,
+        "suppressed_duplicates": seen_updates.suppressed,
+        "translation_cache": get_translation_cache().stats(),
+        "pending_progress_writes": get_progress_writer().pending,
+    }
+    return status, 200 if accepting_updates else 503
+
+
 @server.route("/")
 def webhook():
     try:
@@ -500,6 +588,34 @@ def webhook():
         return "Internal Server Error", 500
 
 
+# Called from the worker's signal handler, so /healthz reports 503 as soon
+# as the drain starts rather than after the worker stopped serving.
+def begin_drain():
+    global accepting_updates, drain_started_at
+    if drain_started_at is None:
+        drain_started_at = time.monotonic()
+    accepting_updates = False
+
+
+# Seconds left of a graceful period that started with begin_drain, keeping
+# reserve for the final progress and warm state writes.
+def drain_budget(graceful_timeout, reserve=5.0):
+    elapsed = 0.0 if drain_started_at is None else time.monotonic() - drain_started_at
+    return max(0.0, graceful_timeout - elapsed - reserve)
+
+
+def shutdown(timeout=None):
+    begin_drain()
+    logger.info("Draining in-flight updates before shutdown...")
+    dispatcher.shutdown(timeout=timeout)
+    get_progress_writer().close()
+    phrase_sync = get_phrase_sync(db_client)
+    if phrase_sync is not None:
+        phrase_sync.close()
+    if warm_state is not None:
+        warm_state.close()
+
+
 if __name__ == "__main__":
     logger.info("Starting server...")
     server.run(host="0.0.0.0", port=int(os.environ.get("PORT", 5000)))
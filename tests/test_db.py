@@ -1,11 +1,35 @@
+import time
 import unittest
 from unittest.mock import patch, MagicMock
 
-from utils.db import get_records
-from utils.db_models import Phrase
+from firebase_admin import firestore
+from firebase_admin.exceptions import FirebaseError
+from google.api_core.exceptions import FailedPrecondition
+
+from utils import stage_summary
+from utils.db import (
+    add_records,
+    count_records,
+    get_random_record,
+    get_records,
+    get_stage_summary,
+    get_user_languages,
+    stream_records,
+    update_progress_batch,
+)
+from utils.db_models import Phrase, PhraseRecord
+from utils.firestore_storage import FirestoreBackend, sample_by_random_key
+from utils.migrations import backfill_random_keys
+from utils.phrase_cache import phrase_caches
+from utils.stage_summary import StageSummary, stage_delta
+from utils.storage import MemoryBackend
+from utils.translation_backfill import TranslationBackfill
 
 
 class TestDatabaseFunctions(unittest.TestCase):
+    def setUp(self):
+        phrase_caches.clear()
+
     @patch("utils.db.collection_class_map", {"phrases": Phrase})
     @patch("utils.db.firestore.Client")
     @patch("utils.db.get_records")
@@ -17,8 +41,434 @@ class TestDatabaseFunctions(unittest.TestCase):
             mock_doc
         ]
 
-        db_client = mock_firestore_client
+        db_client = FirestoreBackend(mock_firestore_client)
         records = get_records("test_user", db_client, "phrases")
         self.assertIsInstance(records[0], Phrase)
         self.assertEqual(records[0].text, "hello")
         self.assertEqual(records[0].translation, "hola")
+
+    def test_get_user_languages_uses_one_batched_lookup(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        alice = MagicMock(id="alice", exists=True)
+        alice.to_dict.return_value = {"language": "Czech"}
+        missing = MagicMock(id="bob", exists=False)
+        client.get_all.return_value = [alice, missing]
+
+        languages = get_user_languages(db_client, ["alice", "bob"])
+
+        self.assertEqual(languages, {"alice": "Czech"})
+        client.get_all.assert_called_once()
+        self.assertEqual(len(client.get_all.call_args.args[0]), 2)
+
+    @patch("utils.db_models.translate_to_base_lang")
+    @patch("utils.translation_backfill.get_translation_backfill")
+    def test_get_records_queues_untranslated_phrases(
+        self, mock_get_backfill, mock_translate
+    ):
+        mock_doc = MagicMock()
+        mock_doc.id = "doc1"
+        mock_doc.to_dict.return_value = {"text": "hola"}
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        client.collection.return_value.document.return_value.collection.return_value.get.return_value = [
+            mock_doc
+        ]
+
+        records = get_records("test_user", db_client, "phrases")
+        self.assertIsNone(records[0].translation)
+        self.assertTrue(records[0].needs_translation)
+        mock_translate.assert_not_called()
+        mock_get_backfill.return_value.enqueue.assert_called_once_with(
+            "test_user", records[0], db_client
+        )
+
+
+class TestTranslationBackfill(unittest.TestCase):
+    def setUp(self):
+        phrase_caches.clear()
+        self.first = Phrase(text="hola", phrase_id="p1")
+        self.second = Phrase(text="adios", phrase_id="p2")
+        self.db_client = MagicMock()
+        self.batch = [
+            (("test_user", "p1"), self.first, self.db_client),
+            (("test_user", "p2"), self.second, self.db_client),
+        ]
+        self.backfill = TranslationBackfill()
+
+    @patch("utils.translation_backfill.db.update_progress_batch")
+    @patch("utils.translation_backfill.translate_batch_to_base_lang")
+    def test_process_batch_writes_translations(self, mock_translate, mock_update):
+        mock_translate.return_value = ["hello", None]
+        mock_update.return_value = [True]
+
+        self.backfill.process_batch(self.batch)
+
+        self.assertEqual(self.first.translation, "hello")
+        self.assertIsNone(self.second.translation)
+        mock_update.assert_called_once_with("test_user", [self.first], self.db_client)
+        # The untranslated phrase waits for a later round.
+        self.assertEqual(self.backfill.pending, 1)
+        self.assertEqual(self.backfill._take_batch(), [])
+
+    @patch("utils.translation_backfill.db.update_progress_batch")
+    @patch("utils.translation_backfill.translate_batch_to_base_lang")
+    def test_failed_rounds_are_retried_with_capped_backoff(
+        self, mock_translate, mock_update
+    ):
+        self.backfill.max_backoff = 30
+        mock_translate.side_effect = RuntimeError("LLM down")
+        self.backfill.process_batch(self.batch)
+        self.assertEqual(self.backfill.pending, 2)
+
+        mock_translate.side_effect = None
+        mock_translate.return_value = ["hello", "bye"]
+        mock_update.return_value = [False, False]
+        for _ in range(5):
+            self.backfill._retry_at.clear()
+            self.backfill.process_batch(self.backfill._take_batch())
+        self.assertEqual(self.backfill.pending, 2)
+        self.assertEqual(self.backfill._attempts[("test_user", "p1")], 6)
+        self.assertLessEqual(
+            self.backfill._retry_at[("test_user", "p1")], time.time() + 30
+        )
+
+    @patch("utils.translation_backfill.get_translation_backfill")
+    def test_untranslated_inserts_are_queued(self, mock_get_backfill):
+        db_client = MemoryBackend()
+        phrase = Phrase(text="hola")
+        add_records(
+            "test_user", [phrase, Phrase(text="adios", translation="bye")], db_client
+        )
+        mock_get_backfill.return_value.enqueue.assert_called_once_with(
+            "test_user", phrase, db_client
+        )
+
+    @patch("utils.translation_backfill.db.update_progress_batch")
+    @patch("utils.translation_backfill.translate_batch_to_base_lang")
+    def test_translation_lands_on_the_cached_copy(self, mock_translate, mock_update):
+        cache = phrase_caches.get("test_user")
+        cache.load([PhraseRecord("p1", "hola", leitner_stage=1, leitner_current=True)])
+        mock_translate.return_value = ["hello"]
+        mock_update.return_value = [True]
+
+        self.backfill.process_batch(self.batch[:1])
+
+        written = mock_update.call_args.args[1][0]
+        self.assertEqual(
+            (written.translation, written.leitner_stage, written.leitner_current),
+            ("hello", 1, True),
+        )
+
+
+class TestBulkWrites(unittest.TestCase):
+    def test_add_records_commits_in_batches_with_outcomes(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        db_client.max_batch_size = 2
+        failing_batch = MagicMock()
+        failing_batch.commit.side_effect = FirebaseError("unavailable", "boom")
+        client.batch.side_effect = [MagicMock(), failing_batch, MagicMock()]
+        phrases = [
+            Phrase(text=f"frase {i}", translation=f"phrase {i}") for i in range(5)
+        ]
+
+        outcomes = add_records("test_user", phrases, db_client)
+
+        self.assertEqual(outcomes, [True, True, False, False, True])
+        self.assertEqual(client.batch.call_count, 3)
+        # Two phrases plus the stage summary increments.
+        self.assertEqual(failing_batch.set.call_count, 3)
+
+
+class TestProgressUpdates(unittest.TestCase):
+    def test_only_changed_fields_are_sent_with_increments(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        batch = client.batch.return_value
+        phrase = Phrase(text="hola", translation="hello", leitner_stage=2)
+        phrase.add_correct_answer()
+        phrase.add_correct_answer()
+
+        self.assertEqual(
+            update_progress_batch("test_user", [phrase], db_client), [True]
+        )
+
+        _, fields = batch.update.call_args[0]
+        self.assertEqual(
+            set(fields), {"leitner_stage", "correct_answers", "updated_at"}
+        )
+        self.assertEqual(fields["leitner_stage"], 4)
+        self.assertIsInstance(fields["correct_answers"], firestore.Increment)
+        self.assertEqual(fields["correct_answers"].value, 2)
+        self.assertEqual(phrase.pop_changes(), {})
+
+    def test_unchanged_phrases_are_not_written(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        phrase = Phrase(text="hola", translation="hello")
+        self.assertEqual(
+            update_progress_batch("test_user", [phrase], db_client), [True]
+        )
+        client.batch.assert_not_called()
+
+    def test_failed_update_keeps_changes_for_retry(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        client.batch.return_value.commit.side_effect = FirebaseError(
+            "unavailable", "boom"
+        )
+        phrase = Phrase(text="hola", translation="hello")
+        phrase.add_mistake()
+
+        self.assertEqual(
+            update_progress_batch("test_user", [phrase], db_client), [False]
+        )
+        self.assertEqual(
+            phrase.pop_changes(), {"leitner_stage": (0, 1), "mistakes": (0, 1)}
+        )
+
+
+class TestRandomSampling(unittest.TestCase):
+    def make_doc(self, doc_id, data):
+        doc = MagicMock()
+        doc.id = doc_id
+        doc.to_dict.return_value = data
+        return doc
+
+    @patch("utils.firestore_storage.random.random", return_value=0.5)
+    def test_sample_uses_single_range_query(self, _):
+        query = MagicMock()
+        doc = self.make_doc("p1", {})
+        query.where.return_value.order_by.return_value.limit.return_value.get.return_value = [
+            doc
+        ]
+
+        self.assertIs(sample_by_random_key(query), doc)
+        query.where.assert_called_once_with("random_key", ">=", 0.5)
+        query.where.return_value.order_by.return_value.limit.assert_called_once_with(1)
+
+    def test_sample_wraps_around_to_smallest_key(self):
+        query = MagicMock()
+        doc = self.make_doc("p1", {})
+        query.where.return_value.order_by.return_value.limit.return_value.get.side_effect = [
+            [],
+            [doc],
+        ]
+
+        self.assertIs(sample_by_random_key(query), doc)
+        self.assertEqual(query.where.call_args_list[1].args, ("random_key", ">=", 0))
+
+    @patch("utils.db.PHRASE_CACHE_ENABLED", False)
+    def test_get_random_record_falls_back_to_scan_without_keys(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        ref = (
+            client.collection.return_value.document.return_value.collection.return_value
+        )
+        ref.where.return_value.order_by.return_value.limit.return_value.get.return_value = []
+        ref.get.return_value = [
+            self.make_doc("p1", {"text": "hola", "translation": "hello"})
+        ]
+
+        record = get_random_record("test_user", db_client, "phrases")
+        self.assertEqual(record.phrase_id, "p1")
+        ref.get.assert_called_once()
+
+    @patch("utils.db.PHRASE_CACHE_ENABLED", False)
+    def test_get_random_record_scans_when_index_is_missing(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        ref = client.collection.return_value.document.return_value.collection.return_value.where.return_value
+        ref.where.return_value.order_by.return_value.limit.return_value.get.side_effect = FailedPrecondition(
+            "The query requires an index."
+        )
+        ref.get.return_value = [
+            self.make_doc("p1", {"text": "hola", "translation": "hello"})
+        ]
+
+        record = get_random_record(
+            "test_user", db_client, "phrases", "leitner_stage", 5
+        )
+        self.assertEqual(record.phrase_id, "p1")
+
+    def test_backfill_random_keys_skips_migrated_phrases(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        docs = [
+            self.make_doc("p1", {"text": "hola"}),
+            self.make_doc("p2", {"text": "adios", "random_key": 0.3}),
+            self.make_doc("p3", {"text": "gracias", "random_key": None}),
+        ]
+        phrases_ref = (
+            client.collection.return_value.document.return_value.collection.return_value
+        )
+        phrases_ref.select.return_value.order_by.return_value.limit.return_value.get.return_value = docs
+
+        self.assertEqual(backfill_random_keys("test_user", db_client), 2)
+        batch = client.batch.return_value
+        self.assertEqual(
+            [call.args[0] for call in batch.update.call_args_list],
+            [docs[0].reference, docs[2].reference],
+        )
+        batch.commit.assert_called_once()
+        phrases_ref.select.assert_called_once_with(["random_key"])
+
+
+class TestStreaming(unittest.TestCase):
+    def make_doc(self, doc_id, data):
+        doc = MagicMock()
+        doc.id = doc_id
+        doc.to_dict.return_value = data
+        return doc
+
+    def test_stream_records_pages_with_cursor(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        ref = (
+            client.collection.return_value.document.return_value.collection.return_value
+        )
+        page_query = ref.order_by.return_value.limit.return_value
+        first_page = [self.make_doc(f"p{i}", {"text": f"frase {i}"}) for i in range(2)]
+        last_page = [self.make_doc("p2", {"text": "frase 2"})]
+        page_query.get.return_value = first_page
+        page_query.start_after.return_value.get.return_value = last_page
+
+        records = stream_records("test_user", db_client, "phrases", page_size=2)
+        self.assertEqual([record.phrase_id for record in records], ["p0", "p1", "p2"])
+        ref.order_by.assert_called_once_with("__name__")
+        page_query.start_after.assert_called_once_with(first_page[1])
+
+    @patch("utils.db.PHRASE_CACHE_ENABLED", False)
+    def test_projection_selects_fields_and_skips_backfill(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        ref = (
+            client.collection.return_value.document.return_value.collection.return_value
+        )
+        ref.select.return_value.get.return_value = [
+            self.make_doc("p1", {"text": "hola", "leitner_stage": 2})
+        ]
+
+        with patch("utils.translation_backfill.get_translation_backfill") as backfill:
+            records = get_records(
+                "test_user", db_client, "phrases", fields=["text", "leitner_stage"]
+            )
+
+        ref.select.assert_called_once_with(["text", "leitner_stage"])
+        self.assertEqual(records[0].leitner_stage, 2)
+        backfill.assert_not_called()
+
+
+class TestStageSummary(unittest.TestCase):
+    def setUp(self):
+        stage_summary._summaries.clear()
+        phrase_caches.clear()
+
+    def test_stage_delta(self):
+        self.assertEqual(stage_delta(None, False, 0, False), {"total": 1, "stage_0": 1})
+        self.assertEqual(
+            stage_delta(4, True, 5, False),
+            {"stage_4": -1, "stage_5": 1, "active": -1},
+        )
+        self.assertEqual(stage_delta(2, True, 2, True), {})
+
+    def test_inserts_increment_summary_in_same_batch(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        batch = client.batch.return_value
+        stage_summary.store_summary(
+            "test_user", StageSummary(total=1, stages=[1, 0, 0, 0, 0, 0])
+        )
+        phrases = [Phrase(text="hola"), Phrase(text="adios")]
+
+        add_records("test_user", phrases, db_client)
+        add_records("test_user", phrases, db_client)
+
+        fields = batch.set.call_args_list[2].args[1]
+        self.assertEqual(fields["total"].value, 2)
+        self.assertEqual(fields["stage_0"].value, 2)
+        self.assertEqual(batch.set.call_args_list[2].kwargs, {"merge": True})
+        # Rewriting persisted phrases does not count them again.
+        self.assertEqual(batch.set.call_count, 6)
+        self.assertEqual(set(batch.set.call_args.args[1]), {"version"})
+        summary = get_stage_summary("test_user", db_client)
+        self.assertEqual((summary.total, summary.stages[0]), (3, 3))
+
+    def test_progress_moves_phrase_between_stages(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        stage_summary.store_summary(
+            "test_user", StageSummary(total=1, stages=[0, 0, 0, 0, 1, 0], active=1)
+        )
+        phrase = Phrase(text="hola", leitner_stage=4, leitner_current=True)
+        phrase.add_correct_answer()
+
+        update_progress_batch("test_user", [phrase], db_client)
+
+        summary = get_stage_summary("test_user", db_client)
+        self.assertEqual(summary.stages, [0, 0, 0, 0, 0, 1])
+        self.assertEqual(summary.active, 0)
+
+    @patch.object(FirestoreBackend, "count_records", return_value=4)
+    def test_unreconciled_summary_is_recomputed(self, mock_count):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        doc = client.collection.return_value.document.return_value.collection.return_value.document.return_value.get.return_value
+        doc.exists = True
+        doc.to_dict.return_value = {"stage_1": -1, "stage_2": 1}
+
+        summary = get_stage_summary("test_user", db_client)
+
+        self.assertEqual(summary.total, 4)
+        self.assertEqual(mock_count.call_count, 8)
+        self.assertIs(get_stage_summary("test_user", db_client), summary)
+
+    def set_summary_document(self, client, data):
+        doc = client.collection.return_value.document.return_value.collection.return_value.document.return_value.get.return_value
+        doc.exists = True
+        doc.to_dict.return_value = data
+
+    def test_expired_summary_is_read_again(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        self.set_summary_document(
+            client, {"total": 2, "stage_0": 2, "version": 5, "reconciled_at": 1}
+        )
+        self.assertEqual(get_stage_summary("test_user", db_client).total, 2)
+
+        # Another worker added a phrase.
+        self.set_summary_document(
+            client, {"total": 3, "stage_0": 3, "version": 6, "reconciled_at": 1}
+        )
+        self.assertEqual(count_records("test_user", db_client, "phrases"), 2)
+        with patch("utils.stage_summary.time.monotonic", return_value=1e12):
+            summary = get_stage_summary("test_user", db_client)
+        self.assertEqual((summary.total, summary.version), (3, 6))
+
+    def test_own_writes_advance_the_cached_version(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        self.set_summary_document(
+            client, {"total": 0, "version": 5, "reconciled_at": 1}
+        )
+        get_stage_summary("test_user", db_client)
+        add_records("test_user", [Phrase(text="hola")], db_client)
+
+        summary = get_stage_summary("test_user", db_client)
+        self.assertEqual((summary.total, summary.stages[0]), (1, 1))
+        self.assertEqual(summary.version, 6)
+
+    def test_summary_from_another_worker_rechecks_phrase_cache(self):
+        client = MagicMock()
+        db_client = FirestoreBackend(client)
+        cache = phrase_caches.get("test_user")
+        cache.load([])
+        cache.db_version = 5
+        self.set_summary_document(
+            client, {"total": 1, "version": 7, "reconciled_at": 1}
+        )
+
+        get_stage_summary("test_user", db_client)
+
+        self.assertFalse(cache.verified)
@@ -0,0 +1,294 @@
+import time
+import unittest
+from unittest.mock import patch
+
+from utils import db
+from utils.db import add_records
+from utils.db_models import Phrase, PhraseRecord
+from utils.leitner import (
+    DEFAULT_LEVEL,
+    REFILL_FAILED_MESSAGE,
+    STAGE_INTERVALS,
+    TRANSLATIONS_PENDING_MESSAGE,
+    Leitner,
+    LeitnerRegistry,
+    ReviewScheduler,
+)
+from utils.phrase_cache import UserPhraseCache, phrase_caches
+from utils.phrase_reservoir import phrase_reservoir
+from utils.storage import MemoryBackend
+
+
+class TestLeitnerRegistry(unittest.TestCase):
+    def setUp(self):
+        self.backend = MemoryBackend()
+        self.backend.set_user("alice", {"language": "Czech"})
+        self.backend.set_user("bob", {"language": "German"})
+
+    @patch("utils.leitner.get_user_languages", wraps=db.get_user_languages)
+    def test_users_are_built_on_first_access(self, mock_languages):
+        registry = LeitnerRegistry(["alice", "bob"], self.backend)
+        self.assertIn("alice", registry)
+        self.assertNotIn("mallory", registry)
+        mock_languages.assert_not_called()
+
+        alice = registry["alice"]
+        self.assertIsInstance(alice, Leitner)
+        self.assertEqual(alice.user_language, "Czech")
+        self.assertIs(registry["alice"], alice)
+        mock_languages.assert_called_once_with(self.backend, ["alice"])
+        with self.assertRaises(KeyError):
+            registry["mallory"]
+
+    @patch.object(phrase_reservoir, "warm")
+    @patch("utils.leitner.get_user_languages", wraps=db.get_user_languages)
+    def test_prewarm_looks_up_languages_once(self, mock_languages, mock_warm):
+        registry = LeitnerRegistry(["alice", "bob"], self.backend)
+        registry.prewarm(max_workers=2)
+        mock_languages.assert_called_once_with(self.backend, ["alice", "bob"])
+        self.assertEqual(registry["bob"].user_language, "German")
+        self.assertEqual(mock_languages.call_count, 1)
+        self.assertEqual(
+            {call.args[0] for call in mock_warm.call_args_list}, {"Czech", "German"}
+        )
+
+
+class TestReviewScheduler(unittest.TestCase):
+    def test_pops_earliest_and_skips_rescheduled_entries(self):
+        scheduler = ReviewScheduler()
+        scheduler.schedule("a", 30)
+        scheduler.schedule("b", 10)
+        scheduler.schedule("c", 20)
+        scheduler.schedule("b", 40)
+        scheduler.remove("c")
+        self.assertEqual(len(scheduler), 2)
+        self.assertEqual(scheduler.pop(), "a")
+        self.assertEqual(scheduler.pop(), "b")
+        self.assertIsNone(scheduler.pop())
+
+
+class TestLeitnerScheduling(unittest.TestCase):
+    def setUp(self):
+        phrase_caches.clear()
+        self.backend = MemoryBackend()
+        now = time.time()
+        self.later = Phrase(
+            text="pozdeji",
+            translation="later",
+            leitner_stage=3,
+            leitner_current=True,
+            next_review_at=now + 3600,
+        )
+        self.due = Phrase(
+            text="ted",
+            translation="now",
+            leitner_stage=2,
+            leitner_current=True,
+            next_review_at=now - 60,
+        )
+        self.mastered = Phrase(
+            text="hotovo",
+            translation="done",
+            leitner_stage=5,
+            next_review_at=now - 120,
+        )
+        add_records("alice", [self.later, self.due, self.mastered], self.backend)
+        self.leitner = Leitner("alice", self.backend, "Czech")
+
+    def test_serves_phrases_in_due_order_including_refreshers(self):
+        served = [self.leitner.next_due_phrase().phrase_id for _ in range(3)]
+        # Unanswered phrases come back after a short backoff, ahead of
+        # phrases due an hour from now.
+        self.assertEqual(
+            served,
+            [self.mastered.phrase_id, self.due.phrase_id, self.mastered.phrase_id],
+        )
+
+    def test_cached_deck_stays_in_record_form(self):
+        self.leitner.sync_scheduler()
+        self.leitner.next_due_phrase()
+        self.assertTrue(
+            all(
+                isinstance(entry, PhraseRecord)
+                for entry in phrase_caches.peek("alice")._phrases.values()
+            )
+        )
+
+    def test_scheduler_follows_cache_updates_without_rescanning(self):
+        self.leitner.sync_scheduler()
+        fresh = Phrase(
+            text="novy", translation="new", leitner_stage=1, leitner_current=True
+        )
+        add_records("alice", [fresh], self.backend)
+        with patch.object(UserPhraseCache, "entries") as mock_entries:
+            served = self.leitner.next_due_phrase()
+        mock_entries.assert_not_called()
+        self.assertEqual(served.phrase_id, fresh.phrase_id)
+
+    def test_updates_keep_a_served_phrase_backed_off(self):
+        phrase = self.leitner.next_due_phrase()
+        backoff = self.leitner.scheduler._due_at[phrase.phrase_id]
+        self.assertGreater(backoff, time.time())
+        self.leitner.phrases.put(self.leitner.phrases.get(phrase.phrase_id))
+        self.assertEqual(self.leitner.scheduler._due_at[phrase.phrase_id], backoff)
+
+    @patch("utils.leitner.get_progress_writer")
+    def test_refresher_spread_stays_in_memory_until_reviewed(self, mock_writer):
+        unscheduled = Phrase(text="stary", translation="old", leitner_stage=5)
+        add_records("bob", [unscheduled], self.backend)
+        leitner = Leitner("bob", self.backend, "Czech")
+        leitner.sync_scheduler()
+        due_at = leitner.scheduler._due_at[unscheduled.phrase_id]
+        self.assertGreater(due_at, time.time())
+        mock_writer.assert_not_called()
+        stored = self.backend.get_records("bob", "phrases")[0]
+        self.assertIsNone(stored.get("next_review_at"))
+
+        # Updates that store no review time keep the drawn one.
+        leitner.phrases.put(leitner.phrases.get(unscheduled.phrase_id))
+        self.assertEqual(leitner.scheduler._due_at[unscheduled.phrase_id], due_at)
+
+        leitner.add_correct_answer(unscheduled.phrase_id)
+        recorded = mock_writer.return_value.record.call_args.args[1]
+        self.assertGreater(recorded.next_review_at, time.time())
+
+    @patch("utils.db.PHRASE_CACHE_ENABLED", False)
+    @patch("utils.leitner.get_progress_writer")
+    def test_uncached_users_keep_their_deck_in_a_cache_of_their_own(self, _):
+        leitner = Leitner("alice", self.backend, "Czech")
+        self.assertEqual(
+            {phrase.phrase_id for phrase in leitner.active_phrases},
+            {self.later.phrase_id, self.due.phrase_id},
+        )
+        self.assertEqual(leitner.phrases.count("leitner_stage", 5), 1)
+        leitner.add_correct_answer(self.due.phrase_id)
+        self.assertEqual(leitner.phrases.get(self.due.phrase_id).leitner_stage, 3)
+        self.assertIsNot(leitner.phrases, phrase_caches.peek("alice"))
+
+    @patch("utils.leitner.get_progress_writer")
+    def test_grading_schedules_next_review_from_stage(self, _):
+        phrase = self.leitner.next_due_phrase()
+        while phrase.phrase_id != self.due.phrase_id:
+            phrase = self.leitner.next_due_phrase()
+        before = time.time()
+        self.leitner.add_correct_answer(self.due.phrase_id)
+        phrase = self.leitner.phrases.get(self.due.phrase_id)
+        self.assertEqual(phrase.leitner_stage, 3)
+        self.assertGreaterEqual(phrase.next_review_at, before + STAGE_INTERVALS[3])
+        self.assertIn(self.due.phrase_id, self.leitner.scheduler)
+
+    @patch("utils.leitner.get_progress_writer")
+    def test_mistake_on_served_refresher_reactivates_it(self, _):
+        phrase = self.leitner.next_due_phrase()
+        self.assertEqual(phrase.phrase_id, self.mastered.phrase_id)
+        self.leitner.add_mistake(self.mastered.phrase_id)
+        phrase = self.leitner.phrases.get(self.mastered.phrase_id)
+        self.assertEqual(phrase.leitner_stage, 1)
+        self.assertTrue(phrase.leitner_current)
+        self.assertIn(phrase, self.leitner.active_phrases)
+
+    @patch("utils.leitner.Leitner.request_refill")
+    @patch("utils.leitner.get_progress_writer")
+    def test_mastering_a_phrase_drops_it_from_active(self, _, mock_refill):
+        self.leitner.sync_scheduler()
+        phrase = self.leitner.phrases.get(self.later.phrase_id)
+        phrase.leitner_stage = 4
+        self.leitner.phrases.put(phrase)
+        message = self.leitner.add_correct_answer(self.later.phrase_id)
+        self.assertIn("mastered", message)
+        self.assertNotIn(
+            self.later.phrase_id,
+            [phrase.phrase_id for phrase in self.leitner.active_phrases],
+        )
+        self.assertIsNone(self.leitner.add_correct_answer(self.later.phrase_id))
+        mock_refill.assert_called_once()
+
+
+class TestLeitnerRefill(unittest.TestCase):
+    def setUp(self):
+        phrase_caches.clear()
+        self.backend = MemoryBackend()
+        backlog = [
+            Phrase(text=f"veta {i}", translation=f"sentence {i}") for i in range(40)
+        ]
+        add_records("alice", backlog, self.backend)
+        self.leitner = Leitner("alice", self.backend, "Czech")
+
+    def tearDown(self):
+        phrase_reservoir.clear()
+
+    @patch("utils.translation_backfill.get_translation_backfill")
+    def test_untranslated_active_phrases_are_not_asked(self, _):
+        backend = MemoryBackend()
+        pending = [
+            Phrase(text=f"veta {i}", leitner_stage=1, leitner_current=True)
+            for i in range(30)
+        ]
+        add_records("bob", pending, backend)
+        leitner = Leitner("bob", backend, "Czech")
+        self.assertEqual(leitner.gen_translation_task(), TRANSLATIONS_PENDING_MESSAGE)
+
+    def test_first_practice_waits_for_the_initial_refill(self):
+        task = self.leitner.gen_translation_task()
+        self.assertIsInstance(task, Phrase)
+        self.assertEqual(len(self.leitner.active_phrases), 30)
+        self.assertIn(task.phrase_id, self.leitner.scheduler)
+
+    @patch.object(phrase_reservoir, "request_refill")
+    def test_first_practice_reports_a_failed_refill(self, _):
+        leitner = Leitner("carol", MemoryBackend(), "Czech")
+        self.assertEqual(leitner.gen_translation_task(), REFILL_FAILED_MESSAGE)
+
+    @patch("utils.leitner.Leitner.request_refill")
+    def test_practice_below_low_water_mark_refills_in_background(self, mock_refill):
+        self.leitner.activate_phrases_from_backlog(10)
+        task = self.leitner.gen_translation_task()
+        mock_refill.assert_called_once()
+        mock_refill.return_value.result.assert_not_called()
+        self.assertIn(task, self.leitner.active_phrases)
+
+    @patch.object(phrase_reservoir, "request_refill")
+    def test_generation_joins_the_shared_reservoir_refill(self, mock_request):
+        mock_request.return_value.result.side_effect = lambda: phrase_reservoir.add(
+            "Czech", DEFAULT_LEVEL, [("Veta 1", "dup"), ("nova", "new")]
+        )
+        with patch("utils.leitner.get_records", wraps=db.get_records) as mock_get:
+            added = self.leitner.generate_and_add_new_phrases(2)
+        mock_request.assert_any_call("Czech", DEFAULT_LEVEL, force=True)
+        self.assertEqual([phrase.text for phrase in added], ["nova"])
+        mock_get.assert_not_called()
+        self.assertIn("nova", phrase_caches.peek("alice").texts)
+
+    @patch.object(phrase_reservoir, "min_size", 30)
+    @patch("utils.phrase_reservoir.translate_batch_to_base_lang")
+    @patch("utils.phrase_reservoir.generate_phrase_texts")
+    def test_generation_runs_when_the_reservoir_holds_only_owned_phrases(
+        self, mock_generate, mock_translate
+    ):
+        phrase_reservoir.add(
+            "Czech", DEFAULT_LEVEL, [(f"veta {i}", f"s {i}") for i in range(40)]
+        )
+        mock_generate.return_value = ["nova"]
+        mock_translate.return_value = ["new"]
+        added = self.leitner.generate_and_add_new_phrases(10)
+        mock_generate.assert_called_once()
+        self.assertEqual([phrase.text for phrase in added], ["nova"])
+
+    @patch.object(phrase_reservoir, "request_refill")
+    def test_refill_draws_what_the_backlog_lacks_from_the_reservoir(self, _):
+        backend = MemoryBackend()
+        backlog = [Phrase(text="a", translation="a"), Phrase(text="b", translation="b")]
+        add_records("bob", backlog, backend)
+        phrase_reservoir.add(
+            "Czech",
+            DEFAULT_LEVEL,
+            [("A", "a")] + [(f"nova {i}", f"new {i}") for i in range(30)],
+        )
+        leitner = Leitner("bob", backend, "Czech")
+        self.assertEqual(leitner.refill(), 30)
+        self.assertEqual(leitner.refill(), 0)
+        # The user already has "a", so it stays for other users.
+        self.assertEqual(
+            phrase_reservoir.take("Czech", DEFAULT_LEVEL, 5),
+            [("A", "a"), ("nova 28", "new 28"), ("nova 29", "new 29")],
+        )
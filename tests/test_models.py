@@ -0,0 +1,20 @@
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import pytest
+
+from utils import models
+
+
+@patch.dict(models._models, clear=True)
+@patch("utils.models.GoogleModel.configure")
+def test_get_model_builds_each_client_once(mock_configure):
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        instances = list(pool.map(lambda _: models.get_model("google"), range(32)))
+    assert all(instance is instances[0] for instance in instances)
+    mock_configure.assert_called_once()
+
+
+def test_get_model_rejects_unknown_type():
+    with pytest.raises(ValueError):
+        models.get_model("unknown")
@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock, patch
+
+from telebot.apihelper import ApiTelegramException
+
+from utils.outbox import MAX_MESSAGE_LENGTH, Outbox, OutgoingMessage, coalesce
+
+
+def test_coalesce_merges_texts_until_a_keyboard():
+    keyboard = object()
+    messages = [
+        OutgoingMessage(chat_id=1, text="Evaluation", reply_to_message_id=10),
+        OutgoingMessage(chat_id=1, text="Success!"),
+        OutgoingMessage(chat_id=1, text="Ready?", reply_markup=keyboard),
+        OutgoingMessage(chat_id=1, text="After keyboard"),
+    ]
+    merged = coalesce(messages)
+    assert len(merged) == 2
+    assert merged[0].text == "Evaluation\n\nSuccess!\n\nReady?"
+    assert merged[0].reply_markup is keyboard
+    assert merged[0].reply_to_message_id == 10
+    assert merged[1].text == "After keyboard"
+
+
+def test_coalesce_respects_chats_photos_and_length():
+    long_text = "x" * (MAX_MESSAGE_LENGTH - 1)
+    messages = [
+        OutgoingMessage(chat_id=1, text=long_text),
+        OutgoingMessage(chat_id=1, text="overflow"),
+        OutgoingMessage(chat_id=2, text="other chat"),
+        OutgoingMessage(chat_id=2, photo=b"png"),
+    ]
+    assert len(coalesce(messages)) == 4
+
+
+def test_turn_sends_one_call_per_merged_message():
+    bot = MagicMock()
+    outbox = Outbox(bot)
+    with outbox.turn():
+        outbox.send_message(1, "one")
+        outbox.send_message(1, "two", reply_markup="keyboard")
+        outbox.send_photo(1, b"png")
+        bot.send_message.assert_not_called()
+    bot.send_message.assert_called_once_with(1, "one\n\ntwo", reply_markup="keyboard")
+    bot.send_photo.assert_called_once_with(1, b"png")
+
+
+def test_send_outside_turn_is_immediate():
+    bot = MagicMock()
+    Outbox(bot).send_message(1, "now")
+    bot.send_message.assert_called_once_with(1, "now", reply_markup=None)
+
+
+@patch("utils.outbox.time.sleep")
+def test_rate_limit_error_is_retried(mock_sleep):
+    bot = MagicMock()
+    rate_limited = ApiTelegramException(
+        "sendMessage",
+        None,
+        {
+            "error_code": 429,
+            "description": "Too Many Requests",
+            "parameters": {"retry_after": 2},
+        },
+    )
+    bot.send_message.side_effect = [rate_limited, "sent"]
+    assert Outbox(bot)._deliver(OutgoingMessage(chat_id=1, text="hi")) == "sent"
+    mock_sleep.assert_any_call(2)
+
+
+def test_markdown_error_falls_back_to_plain_text_with_keyboard():
+    bot = MagicMock()
+    parse_error = ApiTelegramException(
+        "sendMessage",
+        None,
+        {
+            "error_code": 400,
+            "description": "Bad Request: can't parse entities: unclosed bold",
+        },
+    )
+    bot.send_message.side_effect = [parse_error, "sent"]
+    outbox = Outbox(bot)
+    with outbox.turn():
+        outbox.send_message(1, "*Evaluation")
+        outbox.send_message(1, "Ready?", reply_markup="keyboard")
+    bot.send_message.assert_called_with(
+        1, "*Evaluation\n\nReady?", reply_markup="keyboard", parse_mode=""
+    )
+
+
+def test_turn_logs_flush_failures():
+    bot = MagicMock()
+    bot.send_message.side_effect = RuntimeError("network down")
+    outbox = Outbox(bot)
+    with patch("utils.outbox.logger") as mock_logger:
+        with outbox.turn():
+            outbox.send_message(1, "hi")
+    assert any(
+        "Failed to flush" in call.args[0] for call in mock_logger.error.call_args_list
+    )
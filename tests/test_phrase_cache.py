@@ -0,0 +1,164 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from utils.db import add_records, get_records, update_progress_batch
+from utils.db_models import Phrase, PhraseRecord
+from utils.firestore_storage import FirestoreBackend
+from utils.phrase_cache import PhraseCacheRegistry, UserPhraseCache, phrase_caches
+
+
+class TestUserPhraseCache(unittest.TestCase):
+    def setUp(self):
+        self.cache = UserPhraseCache(max_entries=3)
+        self.phrases = [
+            Phrase(text="hola", leitner_stage=1, leitner_current=True),
+            Phrase(text="adios", leitner_stage=0),
+        ]
+        self.cache.load(self.phrases)
+
+    def test_queries_use_stage_and_active_indexes(self):
+        self.assertEqual(self.cache.query("leitner_current", True), [self.phrases[0]])
+        self.assertEqual(self.cache.query("leitner_stage", 0), [self.phrases[1]])
+        self.assertEqual(self.cache.count(), 2)
+
+    def test_put_moves_mutated_phrase_between_buckets(self):
+        version = self.cache.version
+        self.phrases[0].add_correct_answer()
+        self.cache.put(self.phrases[0])
+        self.assertEqual(self.cache.query("leitner_stage", 2), [self.phrases[0]])
+        self.assertEqual(self.cache.count("leitner_stage", 1), 0)
+        self.assertGreater(self.cache.version, version)
+
+    def test_listeners_hear_puts_and_removals(self):
+        heard = []
+        self.cache.subscribe(lambda phrase_id, entry: heard.append((phrase_id, entry)))
+        phrase_id = self.phrases[1].phrase_id
+        self.cache.put(self.phrases[1])
+        self.cache.remove(phrase_id)
+        self.assertEqual(heard, [(phrase_id, self.phrases[1]), (phrase_id, None)])
+
+    def test_texts_follow_puts_and_removals(self):
+        twin = Phrase(text="  Hola ")
+        self.cache.put(twin)
+        self.cache.remove(self.phrases[0].phrase_id)
+        self.assertIn("hola", self.cache.texts)
+        self.cache.remove(twin.phrase_id)
+        self.assertNotIn("hola", self.cache.texts)
+        self.assertIn("adios", self.cache.texts)
+
+    def test_exceeding_bound_disables_cache(self):
+        self.cache.put(Phrase(text="gracias"))
+        self.cache.put(Phrase(text="por favor"))
+        self.assertTrue(self.cache.oversized)
+        self.assertFalse(self.cache.loaded)
+        self.assertEqual(len(self.cache), 0)
+
+    def test_records_are_handed_out_as_phrase_copies(self):
+        cache = UserPhraseCache()
+        record = PhraseRecord("p1", "hola", translation="hi", leitner_stage=5)
+        cache.load([record])
+        self.assertEqual(cache.count("leitner_stage", 5), 1)
+        self.assertEqual(cache.export()["phrases"], [record.to_dict()])
+
+        phrase = cache.get("p1")
+        self.assertIsInstance(phrase, Phrase)
+        self.assertTrue(phrase.persisted)
+        self.assertIsInstance(cache.query("leitner_stage", 5)[0], Phrase)
+        self.assertIsNotNone(cache.random("leitner_stage", 5))
+        self.assertIs(cache._phrases["p1"], record)
+        phrase.add_mistake()
+        self.assertEqual(cache.get("p1").leitner_stage, 5)
+        self.assertEqual(
+            phrase.pop_changes(), {"leitner_stage": (5, 1), "mistakes": (0, 1)}
+        )
+
+    def test_put_keeps_unsaved_phrases_until_written(self):
+        cache = UserPhraseCache()
+        cache.load([PhraseRecord("p1", "hola", translation="hi", leitner_stage=5)])
+        phrase = cache.get("p1")
+        phrase.add_mistake()
+
+        cache.put(phrase)
+        self.assertIs(cache.get("p1"), phrase)
+        self.assertEqual(cache.count("leitner_stage", 1), 1)
+        self.assertEqual(cache.export()["phrases"][0]["leitner_stage"], 5)
+
+        # The write went through.
+        phrase.pop_changes()
+        cache.put(phrase)
+        self.assertIsInstance(cache._phrases["p1"], PhraseRecord)
+        self.assertEqual(cache._phrases["p1"].leitner_stage, 1)
+        self.assertEqual(cache._phrases["p1"].mistakes, 1)
+        self.assertIsNot(cache.get("p1"), phrase)
+
+    def test_projected_queries_leave_records_in_place(self):
+        cache = UserPhraseCache()
+        record = PhraseRecord("p1", "hola", translation="hi", leitner_stage=2)
+        cache.load([record])
+
+        projected = cache.query("leitner_stage", 2, fields=["text", "leitner_stage"])
+
+        self.assertEqual(
+            (projected[0].phrase_id, projected[0].text, projected[0].leitner_stage),
+            ("p1", "hola", 2),
+        )
+        self.assertIsNone(projected[0].translation)
+        self.assertIs(cache._phrases["p1"], record)
+
+    def test_unbounded_cache_scans_its_stored_entries(self):
+        cache = UserPhraseCache(max_entries=None)
+        record = PhraseRecord("p1", "hola", translation="hi", leitner_stage=5)
+        cache.load([record])
+        cache.put(Phrase(text="adios"))
+        self.assertFalse(cache.oversized)
+        self.assertEqual(cache.entries("leitner_stage", 5), [record])
+        self.assertEqual(len(cache.entries()), 2)
+
+    def test_registry_evicts_least_recently_used_user(self):
+        registry = PhraseCacheRegistry(max_users=2)
+        alice = registry.get("alice")
+        registry.get("bob")
+        self.assertIs(registry.get("alice"), alice)
+        registry.get("carol")
+        self.assertIsNone(registry.peek("bob"))
+        self.assertIs(registry.peek("alice"), alice)
+
+
+class TestReadThroughCache(unittest.TestCase):
+    def setUp(self):
+        phrase_caches.clear()
+        self.client = MagicMock()
+        self.db_client = FirestoreBackend(self.client)
+        doc = MagicMock()
+        doc.id = "p1"
+        doc.to_dict.return_value = {
+            "text": "hola",
+            "translation": "hello",
+            "leitner_stage": 1,
+            "leitner_current": True,
+        }
+        self.phrases_ref = self.client.collection.return_value.document.return_value.collection.return_value
+        self.phrases_ref.get.return_value = [doc]
+
+    @patch("utils.db.apply_summary_delta")
+    def test_reads_are_served_from_memory_after_load(self, _):
+        active = get_records(
+            "alice", self.db_client, "phrases", "leitner_current", True
+        )
+        self.assertEqual([phrase.phrase_id for phrase in active], ["p1"])
+        self.assertEqual(len(get_records("alice", self.db_client, "phrases")), 1)
+
+        add_records("alice", [Phrase(text="adios")], self.db_client)
+        self.assertEqual(
+            len(get_records("alice", self.db_client, "phrases", "leitner_stage", 0)),
+            1,
+        )
+
+        active[0].add_correct_answer()
+        update_progress_batch("alice", active, self.db_client)
+        self.assertEqual(
+            get_records("alice", self.db_client, "phrases", "leitner_stage", 2), active
+        )
+        self.phrases_ref.get.assert_called_once()
+        self.phrases_ref.where.assert_not_called()
+        self.phrases_ref.count.assert_not_called()
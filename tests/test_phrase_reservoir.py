@@ -0,0 +1,81 @@
+import json
+import unittest
+from unittest.mock import patch
+
+from utils.db_models import PhraseRecord
+from utils.phrase_cache import UserPhraseCache
+from utils.phrase_reservoir import PhraseReservoir, generate_phrase_texts
+
+
+class TestGeneratePhraseTexts(unittest.TestCase):
+    @patch("utils.phrase_reservoir.get_model")
+    def test_parses_json_response(self, mock_get_model):
+        mock_get_model.return_value.generate_response.return_value = json.dumps(
+            {"phrases": [" ¿Qué hora es? ", 'It\'s "fine"', 3]}
+        )
+        self.assertEqual(
+            generate_phrase_texts("Spanish", "A2", 3),
+            ["¿Qué hora es?", 'It\'s "fine"'],
+        )
+
+    @patch("utils.phrase_reservoir.get_model")
+    def test_returns_nothing_on_malformed_response(self, mock_get_model):
+        mock_get_model.return_value.generate_response.return_value = "not json"
+        self.assertEqual(generate_phrase_texts("Spanish", "A2", 3), [])
+
+
+class TestPhraseReservoir(unittest.TestCase):
+    def setUp(self):
+        self.reservoir = PhraseReservoir(min_size=0, batch_size=4, max_size=3)
+
+    @patch("utils.phrase_reservoir.translate_batch_to_base_lang")
+    @patch("utils.phrase_reservoir.generate_phrase_texts")
+    def test_refill_skips_duplicates_and_untranslated(
+        self, mock_generate, mock_translate
+    ):
+        self.reservoir.add("Czech", "A2", [("Ahoj", "Hi")])
+        mock_generate.return_value = ["ahoj ", "Dobrý den", "dobrý  den", "Nashle"]
+        mock_translate.return_value = ["Good day", None]
+        self.assertEqual(self.reservoir.refill("Czech", "A2"), 1)
+        mock_translate.assert_called_once_with(["Dobrý den", "Nashle"])
+        self.assertEqual(
+            self.reservoir.take("Czech", "A2", 5),
+            [("Ahoj", "Hi"), ("Dobrý den", "Good day")],
+        )
+
+    def test_take_leaves_excluded_phrases_and_caps_size(self):
+        self.reservoir.add(
+            "Czech", "A2", [("a", "1"), ("b", "2"), ("c", "3"), ("d", "4")]
+        )
+        self.assertEqual(self.reservoir.size("Czech", "A2"), 3)
+        self.assertEqual(
+            self.reservoir.take("Czech", "A2", 1, exclude={"b"}), [("c", "3")]
+        )
+        self.assertEqual(self.reservoir.take("Spanish", "A2", 1), [])
+        self.assertEqual(
+            self.reservoir.take("Czech", "A2", 2), [("b", "2"), ("d", "4")]
+        )
+
+    @patch("utils.phrase_reservoir.PhraseReservoir.refill", return_value=0)
+    def test_forced_refill_generates_whatever_the_pool_size(self, mock_refill):
+        reservoir = PhraseReservoir(min_size=1)
+        reservoir.add("Czech", "A2", [("a", "1"), ("b", "2")])
+        reservoir.request_refill("Czech", "A2").result()
+        mock_refill.assert_not_called()
+        reservoir.request_refill("Czech", "A2", force=True).result()
+        mock_refill.assert_called_once_with("Czech", "A2")
+
+    def test_take_skips_texts_the_phrase_cache_holds(self):
+        cache = UserPhraseCache()
+        cache.load([PhraseRecord("p1", "Cafe\u0301  STRASSE")])
+        self.reservoir.add("Czech", "A2", [("café straße", "1"), ("jiny", "2")])
+        self.assertEqual(
+            self.reservoir.take("Czech", "A2", 2, exclude=cache.texts), [("jiny", "2")]
+        )
+
+    @patch("utils.phrase_reservoir.PhraseReservoir.refill", return_value=0)
+    def test_refills_in_background_below_min_size(self, mock_refill):
+        reservoir = PhraseReservoir(min_size=2)
+        reservoir.take("Czech", "A2", 1)
+        reservoir.request_refill("Czech", "A2").result()
+        mock_refill.assert_called_with("Czech", "A2")
@@ -0,0 +1,104 @@
+import unittest
+from unittest.mock import MagicMock
+
+from utils.firestore_storage import FirestoreBackend
+from utils.phrase_cache import phrase_caches
+from utils.phrase_sync import PhraseSync
+from utils.storage import MemoryBackend
+
+
+def make_doc(doc_id, data):
+    return {**data, "phrase_id": doc_id}
+
+
+def make_change(kind, doc):
+    return (kind, doc)
+
+
+class TestPhraseSync(unittest.TestCase):
+    def setUp(self):
+        phrase_caches.clear()
+        self.sync = PhraseSync(MemoryBackend())
+        self.doc = make_doc(
+            "p1",
+            {
+                "text": "hola",
+                "translation": "hello",
+                "leitner_stage": 1,
+                "leitner_current": True,
+            },
+        )
+        self.sync.on_phrases_snapshot("alice", [self.doc], [])
+        self.cache = phrase_caches.peek("alice")
+
+    def test_first_snapshot_loads_cache(self):
+        self.assertTrue(self.cache.loaded)
+        self.assertEqual(self.cache.count("leitner_current", True), 1)
+
+    def test_remote_changes_keep_unsaved_local_fields(self):
+        phrase = self.cache.get("p1")
+        phrase.add_mistake()
+        self.cache.put(phrase)
+        remote = make_doc(
+            "p1",
+            {
+                "text": "hola",
+                "translation": "hi",
+                "leitner_stage": 3,
+                "leitner_current": True,
+                "mistakes": 0,
+            },
+        )
+
+        self.sync.on_phrases_snapshot(
+            "alice", [remote], [make_change("MODIFIED", remote)]
+        )
+
+        self.assertIs(self.cache.get("p1"), phrase)
+        self.assertEqual(phrase.translation, "hi")
+        self.assertEqual(phrase.leitner_stage, 1)
+        self.assertEqual(phrase.mistakes, 1)
+        self.assertEqual(phrase.pop_changes(), {"mistakes": (0, 1)})
+
+    def test_added_and_removed_documents(self):
+        added = make_doc("p2", {"text": "adios", "translation": "bye"})
+        self.sync.on_phrases_snapshot(
+            "alice",
+            [added],
+            [make_change("ADDED", added), make_change("REMOVED", self.doc)],
+        )
+        self.assertIsNone(self.cache.get("p1"))
+        self.assertEqual(self.cache.count("leitner_stage", 0), 1)
+
+    def test_close_unsubscribes_watches(self):
+        client = MagicMock()
+        sync = PhraseSync(FirestoreBackend(client))
+        sync.watch("alice")
+        sync.watch("alice")
+        sync.close()
+        phrases_ref = (
+            client.collection.return_value.document.return_value.collection.return_value
+        )
+        self.assertEqual(phrases_ref.on_snapshot.call_count, 1)
+        phrases_ref.on_snapshot.return_value.unsubscribe.assert_called_once()
+        phrases_ref.document.return_value.on_snapshot.return_value.unsubscribe.assert_called_once()
+
+    def test_firestore_snapshots_are_passed_as_documents(self):
+        client = MagicMock()
+        sync = PhraseSync(FirestoreBackend(client))
+        sync.watch("bob")
+        phrases_ref = (
+            client.collection.return_value.document.return_value.collection.return_value
+        )
+        on_snapshot = phrases_ref.on_snapshot.call_args.args[0]
+        doc = MagicMock(id="p1")
+        doc.to_dict.return_value = {"text": "hola", "translation": "hello"}
+
+        on_snapshot([doc], [], None)
+
+        self.assertEqual(phrase_caches.peek("bob").get("p1").text, "hola")
+
+    def test_local_backends_have_no_listeners(self):
+        sync = PhraseSync(MemoryBackend())
+        sync.watch("alice")
+        self.assertEqual(sync._watches, {})
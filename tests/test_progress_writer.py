@@ -0,0 +1,90 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from utils.db_models import Phrase
+from utils.progress_writer import ProgressWriter
+
+
+class TestProgressWriter(unittest.TestCase):
+    def setUp(self):
+        self.db_client = MagicMock()
+        self.phrase = Phrase(text="hola", translation="hello", phrase_id="p1")
+
+    @patch("utils.progress_writer.update_progress")
+    def test_sync_mode_writes_through(self, mock_update):
+        writer = ProgressWriter(mode="sync")
+        writer.record("alice", self.phrase, self.db_client)
+        mock_update.assert_called_once_with("alice", self.phrase, self.db_client)
+        self.assertEqual(writer.pending, 0)
+
+    @patch("utils.progress_writer.update_progress_batch")
+    def test_buffered_updates_are_merged_until_flush(self, mock_update_batch):
+        mock_update_batch.return_value = [True]
+        writer = ProgressWriter(flush_interval=3600)
+        self.phrase.add_correct_answer()
+        writer.record("alice", self.phrase, self.db_client)
+        self.phrase.add_correct_answer()
+        writer.record("alice", self.phrase, self.db_client)
+        mock_update_batch.assert_not_called()
+        self.assertEqual(writer.pending, 1)
+
+        self.assertEqual(writer.flush(), 1)
+        mock_update_batch.assert_called_once_with(
+            "alice", [self.phrase], self.db_client
+        )
+        self.assertEqual(writer.pending, 0)
+
+    @patch("utils.progress_writer.update_progress_batch")
+    def test_failed_writes_are_requeued(self, mock_update_batch):
+        mock_update_batch.return_value = [False]
+        writer = ProgressWriter(flush_interval=3600)
+        writer.record("alice", self.phrase, self.db_client)
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.pending, 1)
+
+    @patch("utils.progress_writer.update_progress_batch")
+    def test_a_failing_phrase_is_isolated_then_dropped(self, mock_update_batch):
+        def fail_batches_with_p1(username, phrases, db_client):
+            ok = all(phrase.phrase_id != "p1" for phrase in phrases)
+            return [ok] * len(phrases)
+
+        mock_update_batch.side_effect = fail_batches_with_p1
+        other = Phrase(text="adios", translation="bye", phrase_id="p2")
+        writer = ProgressWriter(flush_interval=3600, max_attempts=2)
+        writer.record("alice", self.phrase, self.db_client)
+        writer.record("alice", other, self.db_client)
+
+        self.assertEqual(writer.flush(), 0)
+        self.assertEqual(writer.pending, 2)
+        self.assertEqual(writer.flush(), 1)
+        mock_update_batch.assert_any_call("alice", [other], self.db_client)
+        self.assertEqual(writer.pending, 0)
+
+    @patch("utils.progress_writer.update_progress_batch")
+    def test_failed_changes_merge_into_a_newer_copy(self, mock_update_batch):
+        writer = ProgressWriter(flush_interval=3600)
+        newer = Phrase(text="hola", translation="hello", phrase_id="p1")
+
+        def fail_while_graded_again(username, phrases, db_client):
+            newer.add_correct_answer()
+            writer.record(username, newer, db_client)
+            return [False]
+
+        mock_update_batch.side_effect = fail_while_graded_again
+        self.phrase.add_mistake()
+        writer.record("alice", self.phrase, self.db_client)
+        self.assertEqual(writer.flush(), 0)
+
+        self.assertEqual(writer.pending, 1)
+        self.assertEqual(
+            newer.pop_changes(),
+            {
+                "leitner_stage": (0, 1),
+                "correct_answers": (0, 1),
+                "mistakes": (0, 1),
+            },
+        )
+
+    def test_rejects_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            ProgressWriter(mode="eventually")
@@ -0,0 +1,51 @@
+from unittest.mock import patch
+
+import pytest
+
+from utils.session_store import MemorySessionStore, SqliteSessionStore
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_store(request, tmp_path):
+    def factory(**kwargs):
+        if request.param == "memory":
+            return MemorySessionStore(**kwargs)
+        return SqliteSessionStore(path=str(tmp_path / "sessions.db"), **kwargs)
+
+    return factory
+
+
+def test_set_get_delete(make_store):
+    store = make_store()
+    store.set("task", 1, {"text": "hola", "translation": "hello"})
+    assert store.get("task", 1) == {"text": "hola", "translation": "hello"}
+    assert store.get("task", 2) is None
+    assert store.get("add", 1, default=0) == 0
+    store.delete("task", 1)
+    assert store.get("task", 1) is None
+
+
+def test_entries_expire(make_store):
+    store = make_store(ttl_seconds=10)
+    with patch("utils.session_store.time.time", return_value=1000):
+        store.set("add", 1, 1)
+        store.set("add", 2, 1, ttl=100)
+    with patch("utils.session_store.time.time", return_value=1011):
+        assert store.get("add", 1) is None
+        assert store.get("add", 2) == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    store = MemorySessionStore(max_entries=2)
+    store.set("add", 1, 1)
+    store.set("add", 2, 2)
+    store.get("add", 1)
+    store.set("add", 3, 3)
+    assert store.get("add", 1) == 1
+    assert store.get("add", 2) is None
+
+
+def test_sqlite_store_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    SqliteSessionStore(path=path).set("parsed_img", "alice", ["uno", "dos"])
+    assert SqliteSessionStore(path=path).get("parsed_img", "alice") == ["uno", "dos"]
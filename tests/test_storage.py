@@ -0,0 +1,142 @@
+import os
+import tempfile
+import unittest
+from abc import ABC, abstractmethod
+from unittest.mock import patch
+
+from utils import stage_summary
+from utils.db import (
+    add_records,
+    count_records,
+    get_random_record,
+    get_records,
+    get_stage_summary,
+    get_user_languages,
+    stream_records,
+    update_progress_batch,
+)
+from utils.db_models import Phrase
+from utils.phrase_cache import phrase_caches
+from utils.storage import MemoryBackend, SqliteBackend, StorageBackend
+
+
+class BackendContract(ABC):
+    @abstractmethod
+    def make_backend(self) -> StorageBackend:
+        pass
+
+    def setUp(self):
+        phrase_caches.clear()
+        stage_summary._summaries.clear()
+        self.backend = self.make_backend()
+        self.backend.set_user("alice", {"language": "Czech"})
+        self.phrases = [
+            Phrase(
+                text="ahoj", translation="hi", leitner_stage=1, leitner_current=True
+            ),
+            Phrase(text="nashle", translation="bye"),
+            Phrase(text="dobry den", translation="good day"),
+        ]
+        self.assertEqual(
+            add_records("alice", self.phrases, self.backend), [True, True, True]
+        )
+
+    def test_queries_filter_on_stage_and_active_flag(self):
+        active = get_records("alice", self.backend, "phrases", "leitner_current", True)
+        self.assertEqual([phrase.text for phrase in active], ["ahoj"])
+        self.assertTrue(active[0].persisted)
+        self.assertEqual(count_records("alice", self.backend, "phrases"), 3)
+        self.assertEqual(
+            count_records("alice", self.backend, "phrases", "leitner_stage", 0), 2
+        )
+        self.assertEqual(
+            len(get_records("alice", self.backend, "phrases", "leitner_stage", 0, 1)),
+            1,
+        )
+        self.assertEqual(
+            count_records("alice", self.backend, "phrases", "text", "nashle"), 1
+        )
+
+    def test_user_document_is_read_as_a_user(self):
+        users = get_records("alice", self.backend)
+        self.assertEqual([user.language for user in users], ["Czech"])
+        self.assertEqual(get_random_record("alice", self.backend).language, "Czech")
+
+    def test_progress_updates_are_persisted(self):
+        phrase = self.phrases[0]
+        phrase.add_correct_answer()
+        self.assertEqual(update_progress_batch("alice", [phrase], self.backend), [True])
+
+        stored = get_records("alice", self.backend, "phrases", "leitner_stage", 2)
+        self.assertEqual([p.phrase_id for p in stored], [phrase.phrase_id])
+        self.assertEqual(stored[0].correct_answers, 1)
+        summary = get_stage_summary("alice", self.backend)
+        self.assertEqual((summary.total, summary.stages[2]), (3, 1))
+
+    def test_updating_missing_phrase_keeps_changes(self):
+        phrase = Phrase(text="nic", translation="nothing")
+        phrase.add_mistake()
+        self.assertEqual(
+            update_progress_batch("alice", [phrase], self.backend), [False]
+        )
+        self.assertIn("mistakes", phrase.pop_changes())
+
+    def test_streaming_pages_through_matching_documents(self):
+        streamed = stream_records(
+            "alice", self.backend, "phrases", fields=["text"], page_size=2
+        )
+        self.assertEqual(
+            sorted(phrase.text for phrase in streamed),
+            ["ahoj", "dobry den", "nashle"],
+        )
+        self.assertEqual(
+            [
+                phrase.text
+                for phrase in stream_records(
+                    "alice", self.backend, "phrases", "leitner_stage", 1, page_size=1
+                )
+            ],
+            ["ahoj"],
+        )
+        documents = self.backend.stream_records(
+            "alice", "phrases", fields=["text"], page_size=2
+        )
+        self.assertEqual(set(next(documents)), {"phrase_id", "text"})
+
+    def test_random_record_and_user_languages(self):
+        record = get_random_record("alice", self.backend, "phrases", "leitner_stage", 0)
+        self.assertIn(record.text, {"nashle", "dobry den"})
+        self.assertIsNone(
+            get_random_record("alice", self.backend, "phrases", "leitner_stage", 4)
+        )
+        with patch("utils.db.get_allowed_users", return_value=["alice"]):
+            self.assertEqual(get_user_languages(self.backend), {"alice": "Czech"})
+
+
+class TestMemoryBackend(BackendContract, unittest.TestCase):
+    def make_backend(self):
+        return MemoryBackend()
+
+
+class TestSqliteBackend(BackendContract, unittest.TestCase):
+    def make_backend(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        return SqliteBackend(path=os.path.join(self.tmpdir.name, "phrases.db"))
+
+    def test_stage_and_active_filters_use_indexes(self):
+        plan = self.backend._conn.execute(
+            "EXPLAIN QUERY PLAN SELECT data FROM documents "
+            "WHERE username = ? AND collection = ? AND leitner_stage = ?",
+            ("alice", "phrases", 0),
+        ).fetchall()
+        self.assertIn("idx_documents_leitner_stage", str(plan))
+
+    def test_streaming_uses_keyset_pages(self):
+        statements = []
+        self.backend._conn.set_trace_callback(statements.append)
+        self.assertEqual(
+            len(list(self.backend.stream_records("alice", "phrases", page_size=2))), 3
+        )
+        pages = [sql for sql in statements if "phrase_id >" in sql]
+        self.assertEqual(len(pages), 2)
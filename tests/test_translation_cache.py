@@ -0,0 +1,77 @@
+from unittest.mock import patch
+
+from utils.db_models import (
+    chunk_by_token_budget,
+    translate_batch_to_base_lang,
+    translate_to_base_lang,
+)
+from utils.translation_cache import TranslationCache
+
+
+def test_cache_keys_are_normalized(tmp_path):
+    cache = TranslationCache(path=str(tmp_path / "cache.db"))
+    cache.set("Estoy  feliz. ", "English", "gpt-4o-mini", "I am happy.")
+    assert cache.get("estoy feliz.", "english", "gpt-4o-mini") == "I am happy."
+    assert cache.get("estoy feliz.", "English", "gpt-4o") is None
+    assert cache.get("estoy feliz.", "German", "gpt-4o-mini") is None
+    assert cache.stats() == {"hits": 1, "misses": 2, "hit_rate": 0.333}
+
+
+def test_cache_is_size_bounded(tmp_path):
+    cache = TranslationCache(path=str(tmp_path / "cache.db"), max_entries=10)
+    for i in range(100):
+        cache.set(f"frase {i}", "English", "gpt-4o-mini", f"phrase {i}")
+    assert cache.get("frase 99", "English", "gpt-4o-mini") == "phrase 99"
+    assert cache.get("frase 0", "English", "gpt-4o-mini") is None
+
+
+@patch("utils.db_models.get_model")
+def test_translate_to_base_lang_reuses_cached_translation(mock_get_model, tmp_path):
+    cache = TranslationCache(path=str(tmp_path / "cache.db"))
+    mock_get_model.return_value.generate_response.return_value = "I am happy."
+    with patch("utils.db_models.get_translation_cache", return_value=cache):
+        assert translate_to_base_lang("Estoy feliz.") == "I am happy."
+        assert translate_to_base_lang("estoy feliz.") == "I am happy."
+    mock_get_model.return_value.generate_response.assert_called_once()
+
+
+@patch("utils.db_models.get_model")
+def test_batch_translation_maps_results_and_falls_back(mock_get_model, tmp_path):
+    cache = TranslationCache(path=str(tmp_path / "cache.db"))
+    cache.set("uno", "English", "gpt-4o-mini", "one")
+    generate = mock_get_model.return_value.generate_response
+    generate.side_effect = [
+        '{"translations": [{"id": 1, "translation": "three"}, {"id": 0, "translation": "two"}]}',
+        '{"translations": []}',
+        "four",
+    ]
+    with patch("utils.db_models.get_translation_cache", return_value=cache):
+        translations = translate_batch_to_base_lang(
+            ["uno", "dos", "tres", "cuatro"], max_tokens=25
+        )
+    assert translations == ["one", "two", "three", "four"]
+    assert generate.call_count == 3
+    assert cache.get("tres", "English", "gpt-4o-mini") == "three"
+
+
+def test_chunk_by_token_budget():
+    assert chunk_by_token_budget(["a" * 40, "b" * 40, "c"], max_tokens=40) == [
+        [0, 1],
+        [2],
+    ]
+    assert chunk_by_token_budget([], max_tokens=40) == []
+
+
+@patch("utils.db_models.get_model")
+def test_both_paths_cache_the_same_form(mock_get_model, tmp_path):
+    cache = TranslationCache(path=str(tmp_path / "cache.db"))
+    generate = mock_get_model.return_value.generate_response
+    generate.side_effect = [
+        '{"translations": [{"id": 0, "translation": " Say \\"hi\\" "}]}',
+        ' Say "bye" ',
+    ]
+    with patch("utils.db_models.get_translation_cache", return_value=cache):
+        assert translate_batch_to_base_lang(["Di hola"]) == ["Say 'hi'"]
+        assert translate_to_base_lang("Di adios") == "Say 'bye'"
+    assert cache.get("Di hola", "English", "gpt-4o-mini") == "Say 'hi'"
+    assert cache.get("Di adios", "English", "gpt-4o-mini") == "Say 'bye'"
@@ -0,0 +1,44 @@
+from unittest.mock import patch
+
+from utils.update_dedup import SeenUpdates
+
+
+def test_duplicates_are_suppressed_and_counted():
+    seen = SeenUpdates()
+    assert seen.check_and_add(1)
+    assert not seen.check_and_add(1)
+    assert not seen.check_and_add(1)
+    assert seen.check_and_add(2)
+    assert seen.suppressed == 2
+
+
+def test_entries_expire_after_ttl():
+    seen = SeenUpdates(ttl_seconds=10)
+    with patch("utils.update_dedup.time.time", return_value=1000):
+        assert seen.check_and_add(1)
+    with patch("utils.update_dedup.time.time", return_value=1011):
+        assert seen.check_and_add(1)
+
+
+def test_store_is_bounded():
+    seen = SeenUpdates(max_size=3)
+    for update_id in range(5):
+        seen.check_and_add(update_id)
+    assert seen.check_and_add(0)
+    assert not seen.check_and_add(4)
+
+
+def test_discard_allows_redelivery():
+    seen = SeenUpdates()
+    seen.check_and_add(1)
+    seen.discard(1)
+    assert seen.check_and_add(1)
+
+
+def test_persistent_backing_is_shared(tmp_path):
+    db_path = str(tmp_path / "seen.db")
+    first = SeenUpdates(db_path=db_path)
+    second = SeenUpdates(db_path=db_path)
+    assert first.check_and_add(10)
+    assert not second.check_and_add(10)
+    assert second.suppressed == 1
@@ -0,0 +1,63 @@
+import threading
+import time
+from types import SimpleNamespace
+
+from utils.update_queue import UpdateDispatcher, update_user_key
+
+
+def make_update(update_id, user_id):
+    return SimpleNamespace(
+        update_id=update_id,
+        message=SimpleNamespace(from_user=SimpleNamespace(id=user_id)),
+        callback_query=None,
+    )
+
+
+def test_update_user_key_falls_back_to_update_id():
+    update = SimpleNamespace(update_id=7, message=None, callback_query=None)
+    assert update_user_key(update) == "update:7"
+    assert update_user_key(make_update(1, 42)) == 42
+
+
+def test_updates_for_one_user_stay_in_order():
+    processed = []
+
+    def handler(update):
+        time.sleep(0.001)
+        processed.append(update.update_id)
+
+    dispatcher = UpdateDispatcher(handler, max_workers=4)
+    for update_id in range(50):
+        assert dispatcher.submit(make_update(update_id, user_id=1))
+    assert dispatcher.shutdown(timeout=5)
+    assert processed == list(range(50))
+
+
+def test_different_users_run_in_parallel():
+    release = threading.Event()
+    started = []
+
+    def handler(update):
+        started.append(update.update_id)
+        release.wait(timeout=5)
+
+    dispatcher = UpdateDispatcher(handler, max_workers=2)
+    dispatcher.submit(make_update(1, user_id=1))
+    dispatcher.submit(make_update(2, user_id=2))
+    deadline = time.time() + 5
+    while len(started) < 2 and time.time() < deadline:
+        time.sleep(0.01)
+    assert sorted(started) == [1, 2]
+    release.set()
+    assert dispatcher.shutdown(timeout=5)
+
+
+def test_rejects_updates_when_full_or_closed():
+    release = threading.Event()
+    dispatcher = UpdateDispatcher(lambda update: release.wait(timeout=5), max_pending=2)
+    assert dispatcher.submit(make_update(1, user_id=1))
+    assert dispatcher.submit(make_update(2, user_id=1))
+    assert not dispatcher.submit(make_update(3, user_id=2))
+    release.set()
+    assert dispatcher.shutdown(timeout=5)
+    assert not dispatcher.submit(make_update(4, user_id=1))
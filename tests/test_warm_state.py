@@ -0,0 +1,114 @@
+import os
+import tempfile
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from utils.db import get_phrase_cache
+from utils.db_models import Phrase
+from utils.explain_grammar import explain_grammar
+from utils.firestore_storage import FirestoreBackend
+from utils.lru_cache import exportable_lru_cache
+from utils.phrase_cache import phrase_caches
+from utils.phrase_reservoir import phrase_reservoir
+from utils.session_store import MemorySessionStore
+from utils.warm_state import WarmState
+
+
+class TestExportableLRUCache(unittest.TestCase):
+    def test_caches_calls_and_keeps_cache_clear(self):
+        calls = []
+
+        @exportable_lru_cache(maxsize=2)
+        def double(value, factor=2):
+            calls.append(value)
+            return value * factor
+
+        self.assertEqual(double(2), 4)
+        self.assertEqual(double(2), 4)
+        double(3)
+        double(4)
+        self.assertEqual(len(double.cache.export()), 2)
+        double.cache_clear()
+        double(4)
+        self.assertEqual(calls, [2, 3, 4, 4])
+
+
+class TestWarmState(unittest.TestCase):
+    def setUp(self):
+        phrase_caches.clear()
+        explain_grammar.cache_clear()
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmpdir.cleanup)
+        self.path = os.path.join(self.tmpdir.name, "warm_state.json.gz")
+        self.client = MagicMock()
+        self.db_client = FirestoreBackend(self.client)
+
+        cache = phrase_caches.get("alice")
+        cache.db_version = 7
+        self.phrase = Phrase(
+            text="ahoj", translation="hi", leitner_stage=2, leitner_current=True
+        )
+        cache.load([self.phrase])
+        explain_grammar.cache.set("key", "Grammar: none")
+        phrase_reservoir.add("Czech", "A2", [("dobry den", "good day")])
+        self.addCleanup(phrase_reservoir.clear)
+        self.sessions = MemorySessionStore()
+        self.sessions.set("task", 1, {"text": "ahoj"})
+
+    def set_db_version(self, version):
+        summary = self.client.collection.return_value.document.return_value.collection.return_value.document.return_value
+        summary.get.return_value.exists = True
+        summary.get.return_value.to_dict.return_value = {"version": version}
+
+    def snapshot_and_restart(self):
+        self.phrase.add_mistake()
+        WarmState(self.sessions, self.db_client, path=self.path).write()
+        phrase_caches.clear()
+        explain_grammar.cache_clear()
+        phrase_reservoir.clear()
+        self.sessions = MemorySessionStore()
+        self.assertTrue(
+            WarmState(self.sessions, self.db_client, path=self.path).restore()
+        )
+
+    def test_restores_state_without_unsaved_changes(self):
+        self.snapshot_and_restart()
+        restored = phrase_caches.peek("alice").get(self.phrase.phrase_id)
+        self.assertEqual(restored.leitner_stage, 2)
+        self.assertEqual(restored.mistakes, 0)
+        self.assertTrue(restored.persisted)
+        self.assertEqual(explain_grammar.cache.get("key"), "Grammar: none")
+        self.assertEqual(phrase_reservoir.size("Czech", "A2"), 1)
+        self.assertEqual(self.sessions.get("task", 1), {"text": "ahoj"})
+
+    def test_restored_cache_is_used_when_version_matches(self):
+        self.snapshot_and_restart()
+        self.set_db_version(7)
+        cache = get_phrase_cache("alice", self.db_client)
+        self.assertEqual(cache.count("leitner_current", True), 1)
+        self.assertTrue(cache.verified)
+        phrases_ref = self.client.collection.return_value.document.return_value.collection.return_value
+        phrases_ref.get.assert_not_called()
+
+    def test_stale_cache_is_reloaded(self):
+        self.snapshot_and_restart()
+        self.set_db_version(8)
+        phrases_ref = self.client.collection.return_value.document.return_value.collection.return_value
+        phrases_ref.get.return_value = []
+        cache = get_phrase_cache("alice", self.db_client)
+        self.assertEqual(len(cache), 0)
+        phrases_ref.get.assert_called_once()
+
+    def test_ignores_unknown_snapshot_format(self):
+        with patch("utils.warm_state.SNAPSHOT_FORMAT", 0):
+            WarmState(self.sessions, self.db_client, path=self.path).write()
+        self.assertFalse(
+            WarmState(self.sessions, self.db_client, path=self.path).restore()
+        )
+
+    def test_expired_sessions_are_not_restored(self):
+        self.sessions.set("task", 2, {"text": "nashle"}, ttl=0.01)
+        time.sleep(0.02)
+        self.snapshot_and_restart()
+        self.assertIsNone(self.sessions.get("task", 2))
@@ -1,12 +1,7 @@
 import random
 from loguru import logger
 from utils import db
-import openai
-import os
-
-API_KEY = os.getenv("OPENAI_API_KEY")
-BASE_URL = os.getenv("OPENAI_BASE_URL")
-client = openai.OpenAI(api_key=API_KEY, base_url=BASE_URL)
+from utils.models import get_model
 
 
 def gen_verb_conjugation_task(username, db_client, language="English", tense="past"):
@@ -24,7 +19,7 @@ def gen_verb_conjugation_task(username, db_client, language="English", tense="pa
         Remember, your example must be in {language}."""
 
         try:
-            response = client.chat.completions.create(
+            response = get_model("openai").client.chat.completions.create(
                 model="gpt-4o-mini",
                 messages=[{"role": "user", "content": system_instruction}],
                 temperature=0.7,
@@ -48,7 +43,7 @@ def gen_verb_conjugation_task(username, db_client, language="English", tense="pa
         Remember, your example must be in {language}."""
 
         try:
-            response = client.chat.completions.create(
+            response = get_model("openai").client.chat.completions.create(
                 model="gpt-4o",
                 messages=[{"role": "user", "content": system_instruction}],
                 temperature=0.7,
@@ -1,13 +1,35 @@
 import os
-import random
-from typing import Optional, Dict, Any
+import sqlite3
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Tuple
 
 import firebase_admin
 from firebase_admin import credentials, firestore
+from google.api_core.exceptions import GoogleAPICallError
 from loguru import logger
 
 from utils.config_utils import get_allowed_users
-from utils.db_models import User, collection_class_map, BaseModel
+from utils.db_models import User, Phrase, PhraseRecord, collection_class_map, BaseModel
+from utils.phrase_cache import CacheEntry, UserPhraseCache, phrase_caches
+from utils.firestore_storage import FirestoreBackend
+from utils.storage import StorageBackend, StorageError, get_storage_backend
+from utils.stage_summary import (
+    LEITNER_STAGES,
+    StageSummary,
+    apply_summary_delta,
+    cached_summary,
+    merge_deltas,
+    phrase_write_delta,
+    store_summary,
+)
+
+
+DB_ERRORS = (
+    firebase_admin.exceptions.FirebaseError,
+    GoogleAPICallError,
+    sqlite3.Error,
+    StorageError,
+)
+PHRASE_CACHE_ENABLED = os.getenv("PHRASE_CACHE_ENABLED", "true").lower() == "true"
 
 
 def firebase_connection() -> firestore.Client:
@@ -24,106 +46,410 @@ def firebase_connection() -> firestore.Client:
         raise
 
 
-def add_record(username: str, data: BaseModel, db_client: firestore.Client) -> None:
+# The functions below take the StorageBackend returned by connect_storage as
+# db_client.
+def connect_storage() -> StorageBackend:
+    backend = os.getenv("STORAGE_BACKEND", "firestore")
+    if backend == "firestore":
+        return FirestoreBackend(firebase_connection())
+    storage = get_storage_backend(
+        backend, path=os.getenv("STORAGE_PATH", "data/phrases.db")
+    )
+    language = os.getenv("LOCAL_USER_LANGUAGE", "Spanish")
+    for username in get_allowed_users():
+        if not storage.get_records(username):
+            logger.info(f"Creating local user {username} learning {language}")
+            storage.set_user(username, {"language": language})
+    return storage
+
+
+# A full write persists every field, so pending field changes are cleared
+# and only restored if the write fails.
+def pop_changes(data: BaseModel) -> Dict[str, Tuple[Any, Any]]:
+    return data.pop_changes() if isinstance(data, Phrase) else {}
+
+
+def restore_changes(data: BaseModel, changes: Dict[str, Tuple[Any, Any]]) -> None:
+    if changes:
+        data.restore_changes(changes)
+
+
+def write_delta(data: BaseModel, changes: Dict[str, Tuple[Any, Any]]) -> Dict[str, int]:
+    if not isinstance(data, Phrase):
+        return {}
+    return phrase_write_delta(data, changes, inserted=not data.persisted)
+
+
+def mark_persisted(data: BaseModel) -> None:
+    if isinstance(data, Phrase):
+        data.mark_persisted()
+
+
+def read_user_version(username: str, db_client: StorageBackend) -> Optional[int]:
+    try:
+        data = db_client.get_summary(username)
+    except DB_ERRORS as e:
+        logger.error(f"Failed to read version of {username}. Error: {e}")
+        return None
+    return int(data.get("version", 0)) if data else 0
+
+
+def batches(items: List[Any], db_client: StorageBackend) -> Iterator[List[Any]]:
+    size = db_client.max_batch_size or len(items) or 1
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+# Each batch applies its stage counter delta to the summary document in the
+# same write; the cached summary and phrases follow only once it committed.
+def after_write(
+    username: str,
+    phrases: List[BaseModel],
+    delta: Dict[str, int],
+    db_client: StorageBackend,
+) -> None:
+    apply_summary_delta(username, delta)
+    phrase_caches.bump_db_version(username)
+    written = [data for data in phrases if isinstance(data, Phrase)]
+    phrase_caches.refresh(username, written)
+    # Phrases stored while the LLM was down are translated later.
+    queue_translations(username, written, db_client)
+
+
+# Writes and reads never call the LLM; untranslated phrases go to the
+# backfill.
+def queue_translations(
+    username: str, phrases: Iterable[Phrase], db_client: StorageBackend
+) -> None:
+    untranslated = [phrase for phrase in phrases if phrase.needs_translation]
+    if not untranslated:
+        return
+    # Imported here: the backfill writes its results through this module.
+    from utils.translation_backfill import get_translation_backfill
+
+    backfill = get_translation_backfill()
+    for phrase in untranslated:
+        backfill.enqueue(username, phrase, db_client)
+
+
+def add_record(username: str, data: BaseModel, db_client: StorageBackend) -> None:
     logger.info(
         f"Adding record for user: {username}, collection: {data.COLLECTION_NAME}"
     )
-    try:
-        ref = (
-            db_client.collection(User.COLLECTION_NAME)
-            .document(username)
-            .collection(data.COLLECTION_NAME)
-            .document(data.phrase_id)
-        )
-        ref.set(data.model_dump())
+    if add_records(username, [data], db_client) == [True]:
         logger.info(f"Added {data} to {data.COLLECTION_NAME} for {username}")
-    except firebase_admin.exceptions.FirebaseError as e:
-        logger.error(
-            f"Failed to add to {data.COLLECTION_NAME} for {username}. Error: {e}"
+
+
+def add_records(
+    username: str, records: List[BaseModel], db_client: StorageBackend
+) -> List[bool]:
+    logger.info(f"Adding {len(records)} records in bulk for user: {username}")
+    outcomes = []
+    for chunk in batches(records, db_client):
+        changes = [pop_changes(data) for data in chunk]
+        delta = merge_deltas(
+            [
+                write_delta(data, data_changes)
+                for data, data_changes in zip(chunk, changes)
+            ]
+        )
+        try:
+            db_client.add_records(
+                username,
+                chunk[0].COLLECTION_NAME,
+                [data.model_dump() for data in chunk],
+                delta,
+            )
+        except DB_ERRORS as e:
+            for data, data_changes in zip(chunk, changes):
+                restore_changes(data, data_changes)
+            outcomes.extend([False] * len(chunk))
+            logger.error(
+                f"Failed to commit batch of {len(chunk)} records for {username}. Error: {e}"
+            )
+            continue
+        for data in chunk:
+            mark_persisted(data)
+        after_write(username, chunk, delta, db_client)
+        outcomes.extend([True] * len(chunk))
+        logger.info(f"Committed batch of {len(chunk)} records for {username}")
+    return outcomes
+
+
+def update_progress(username: str, phrase: Phrase, db_client: StorageBackend) -> bool:
+    return update_progress_batch(username, [phrase], db_client)[0]
+
+
+def update_progress_batch(
+    username: str, phrases: List[Phrase], db_client: StorageBackend
+) -> List[bool]:
+    logger.info(f"Updating progress of {len(phrases)} phrases for user: {username}")
+    outcomes = []
+    for chunk in batches(phrases, db_client):
+        changes = [phrase.pop_changes() for phrase in chunk]
+        if not any(changes):
+            outcomes.extend([True] * len(chunk))
+            continue
+
+        delta = merge_deltas(
+            [
+                phrase_write_delta(phrase, phrase_changes, inserted=False)
+                for phrase, phrase_changes in zip(chunk, changes)
+            ]
+        )
+        try:
+            db_client.update_records(
+                username,
+                Phrase.COLLECTION_NAME,
+                [
+                    (phrase.phrase_id, phrase_changes)
+                    for phrase, phrase_changes in zip(chunk, changes)
+                    if phrase_changes
+                ],
+                delta,
+            )
+        except DB_ERRORS as e:
+            for phrase, phrase_changes in zip(chunk, changes):
+                phrase.restore_changes(phrase_changes)
+            outcomes.extend([False] * len(chunk))
+            logger.error(
+                f"Failed to update progress of {len(chunk)} phrases for {username}. Error: {e}"
+            )
+            continue
+        after_write(username, chunk, delta, db_client)
+        outcomes.extend([True] * len(chunk))
+    return outcomes
+
+
+def load_record(
+    username: str, record_class: type, doc_data: Dict[str, Any], db_client
+) -> BaseModel:
+    record = record_class(**doc_data)
+    mark_persisted(record)
+    if isinstance(record, Phrase):
+        queue_translations(username, [record], db_client)
+    return record
+
+
+# Cached phrases are kept as compact records; only untranslated ones are
+# built as Phrase objects, for the translation backfill.
+def load_phrase_entries(
+    username: str, documents: Iterable[Dict[str, Any]], db_client: StorageBackend
+) -> List[CacheEntry]:
+    entries = []
+    for doc_data in documents:
+        if doc_data.get("translation") is None:
+            entries.append(load_record(username, Phrase, doc_data, db_client))
+        else:
+            entries.append(PhraseRecord.from_dict(doc_data))
+    return entries
+
+
+# Projected records are built without validation and hold defaults for the
+# fields that were not selected, so they are for reading only.
+def build_record(
+    username: str,
+    record_class: type,
+    doc_data: Dict[str, Any],
+    db_client: StorageBackend,
+    fields: Optional[List[str]] = None,
+) -> BaseModel:
+    if fields:
+        return record_class.model_construct(**doc_data)
+    return load_record(username, record_class, doc_data, db_client)
+
+
+def fetch_records(
+    username: str,
+    db_client: StorageBackend,
+    collection_name: Optional[str] = None,
+    where_field: Optional[str] = None,
+    where_value: Optional[Any] = None,
+    limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
+) -> List[BaseModel]:
+    record_class = collection_class_map.get(collection_name or User.COLLECTION_NAME)
+    if not record_class:
+        logger.error(f"No class found for collection name: {collection_name}")
+        return []
+    documents = db_client.get_records(
+        username, collection_name, where_field, where_value, limit, fields
+    )
+    doc_list = []
+    for doc_data in documents:
+        record_instance = build_record(
+            username, record_class, doc_data, db_client, fields
+        )
+        doc_list.append(record_instance)
+        logger.debug(
+            f"Retrieved from {collection_name or User.COLLECTION_NAME}: {doc_data.get('phrase_id')} => {record_instance}"
         )
+    logger.info(
+        f"Retrieved {len(doc_list)} records from {collection_name or User.COLLECTION_NAME} for {username}"
+    )
+    return doc_list
+
+
+def stream_records(
+    username: str,
+    db_client: StorageBackend,
+    collection_name: str,
+    where_field: Optional[str] = None,
+    where_value: Optional[Any] = None,
+    fields: Optional[List[str]] = None,
+    page_size: int = 500,
+) -> Iterator[BaseModel]:
+    logger.info(
+        f"Streaming records for user: {username}, collection: {collection_name}"
+    )
+    record_class = collection_class_map[collection_name]
+    for doc_data in db_client.stream_records(
+        username, collection_name, where_field, where_value, fields, page_size
+    ):
+        yield build_record(username, record_class, doc_data, db_client, fields)
+
+
+# A cache restored from the warm-state snapshot is only trusted once the
+# user's version in the database still matches it.
+def verify_phrase_cache(
+    username: str, cache: UserPhraseCache, db_client: StorageBackend
+) -> UserPhraseCache:
+    with cache.load_lock:
+        if cache.verified:
+            return cache
+        version = read_user_version(username, db_client)
+        if version is not None and version == cache.db_version:
+            logger.info(f"Restored phrase cache of {username} is current")
+            cache.verified = True
+            return cache
+    logger.info(
+        f"Restored phrase cache of {username} is stale ({cache.db_version} != {version})"
+    )
+    phrase_caches.drop(username)
+    return phrase_caches.get(username)
+
+
+# The whole phrase collection of a user is loaded once and then kept current
+# by the write paths above; None means queries must go to the backend.
+def get_phrase_cache(
+    username: str, db_client: StorageBackend
+) -> Optional[UserPhraseCache]:
+    if not PHRASE_CACHE_ENABLED:
+        return None
+    cache = phrase_caches.get(username)
+    if cache.loaded and not cache.verified:
+        cache = verify_phrase_cache(username, cache, db_client)
+    if cache.loaded:
+        return cache
+    if cache.oversized:
+        return None
+    with cache.load_lock:
+        if not cache.loaded:
+            logger.info(f"Loading phrase cache for user: {username}")
+            # Read before the phrases: a write in between leaves the recorded
+            # version behind, which only costs a reload after a restore.
+            cache.db_version = read_user_version(username, db_client)
+            try:
+                phrases = load_phrase_entries(
+                    username,
+                    db_client.get_records(username, Phrase.COLLECTION_NAME),
+                    db_client,
+                )
+            except DB_ERRORS as e:
+                logger.error(f"Failed to load phrase cache for {username}. Error: {e}")
+                return None
+            if not cache.load(phrases):
+                return None
+            logger.info(f"Cached {len(cache)} phrases for {username}")
+    return cache
 
 
 def get_records(
     username: str,
-    db_client: firestore.Client,
+    db_client: StorageBackend,
     collection_name: Optional[str] = None,
     where_field: Optional[str] = None,
     where_value: Optional[Any] = None,
     limit: Optional[int] = None,
+    fields: Optional[List[str]] = None,
 ) -> Dict[str, BaseModel]:
     logger.info(
         f"Retrieving records for user: {username}, collection: {collection_name}"
     )
-    doc_list = []
+    if collection_name == Phrase.COLLECTION_NAME:
+        cache = get_phrase_cache(username, db_client)
+        if cache is not None:
+            records = cache.query(where_field, where_value, fields)
+            logger.info(f"Retrieved {len(records)} cached phrases for {username}")
+            return records[:limit] if limit else records
 
     try:
-        ref = db_client.collection(User.COLLECTION_NAME).document(username)
-        if collection_name:
-            ref = ref.collection(collection_name)
-            if where_field and where_value is not None:
-                logger.info(f"Applying filter: {where_field} == {where_value}")
-                ref = ref.where(where_field, "==", where_value)
-            docs = ref.limit(limit).get() if limit else ref.get()
-        else:
-            docs = [ref.get()]
-
-        for doc in docs:
-            doc_data = doc.to_dict()
-            doc_data["phrase_id"] = doc.id
-            record_class = collection_class_map.get(
-                collection_name or User.COLLECTION_NAME
-            )
-            if record_class:
-                record_instance = record_class(**doc_data)
-                doc_list.append(record_instance)
-                logger.info(
-                    f"Retrieved from {collection_name or User.COLLECTION_NAME}: {doc.id} => {record_instance}"
-                )
-            else:
-                logger.error(f"No class found for collection name: {collection_name}")
-        return doc_list
-    except firebase_admin.exceptions.FirebaseError as e:
+        return fetch_records(
+            username,
+            db_client,
+            collection_name,
+            where_field,
+            where_value,
+            limit,
+            fields,
+        )
+    except DB_ERRORS as e:
         logger.error(
             f"Failed to retrieve documents from {collection_name} for {username}. Error: {e}"
         )
         return {}
 
 
-def get_user_languages(db_client: firestore.Client) -> Dict[str, str]:
+def get_user_languages(
+    db_client: StorageBackend, usernames: Optional[List[str]] = None
+) -> Dict[str, str]:
     logger.info("Retrieving user languages...")
-    user_languages = {}
-    allowed_users = get_allowed_users()
+    allowed_users = get_allowed_users() if usernames is None else usernames
     logger.info(f"Allowed users: {allowed_users}")
-    for user in allowed_users:
-        user_data = get_records(user, db_client)
-        user_languages[user] = user_data[0].language
-        logger.info(f"User: {user}, Language: {user_data[0].language}")
+    user_languages = {
+        user: User(**data).language
+        for user, data in db_client.get_users(allowed_users).items()
+    }
+    for user, language in user_languages.items():
+        logger.info(f"User: {user}, Language: {language}")
 
     return user_languages
 
 
+# Phrase counts by stage, active flag or in total come from the stage
+# summary, so /stats and these counts can't disagree; other filters are
+# counted by the backend.
 def count_records(
     username: str,
-    db_client: firestore.Client,
+    db_client: StorageBackend,
     collection_name: Optional[str] = None,
     where_field: Optional[str] = None,
     where_value: Optional[Any] = None,
 ) -> int:
     logger.info(f"Counting records for user: {username}, collection: {collection_name}")
+    if collection_name == Phrase.COLLECTION_NAME:
+        count = get_stage_summary(username, db_client).count(where_field, where_value)
+        if count is not None:
+            return count
+    return count_stored_records(
+        username, db_client, collection_name, where_field, where_value
+    )
+
 
+def count_stored_records(
+    username: str,
+    db_client: StorageBackend,
+    collection_name: Optional[str] = None,
+    where_field: Optional[str] = None,
+    where_value: Optional[Any] = None,
+) -> int:
     try:
-        ref = db_client.collection(User.COLLECTION_NAME).document(username)
-        if collection_name:
-            ref = ref.collection(collection_name)
-            if where_field and where_value is not None:
-                logger.info(f"Applying filter: {where_field} == {where_value}")
-                ref = ref.where(where_field, "==", where_value)
-        count_query = ref.count()
-        count_result = count_query.get()
-        count = count_result[0][0].value
+        count = db_client.count_records(
+            username, collection_name, where_field, where_value
+        )
         logger.info(f"Counted {count} records in {collection_name} for {username}")
         return count
-    except firebase_admin.exceptions.FirebaseError as e:
+    except DB_ERRORS as e:
         logger.error(
             f"Failed to count documents in {collection_name} for {username}. Error: {e}"
         )
@@ -133,7 +459,7 @@ def count_records(
 # get random records from the database, incl. where clause
 def get_random_record(
     username: str,
-    db_client: firestore.Client,
+    db_client: StorageBackend,
     collection_name: Optional[str] = None,
     where_field: Optional[str] = None,
     where_value: Optional[Any] = None,
@@ -141,30 +467,84 @@ def get_random_record(
     logger.info(
         f"Getting random record for user: {username}, collection: {collection_name}"
     )
+    if collection_name == Phrase.COLLECTION_NAME:
+        cache = get_phrase_cache(username, db_client)
+        if cache is not None:
+            return cache.random(where_field, where_value)
 
+    record_class = collection_class_map.get(collection_name or User.COLLECTION_NAME)
+    if not record_class:
+        logger.error(f"No class found for collection name: {collection_name}")
+        return None
     try:
-        ref = db_client.collection(User.COLLECTION_NAME).document(username)
-        if collection_name:
-            ref = ref.collection(collection_name)
-            if where_field and where_value is not None:
-                logger.info(f"Applying filter: {where_field} == {where_value}")
-                ref = ref.where(where_field, "==", where_value)
-        docs = ref.get()
-        random_doc = random.choice([doc for doc in docs])
-        doc_data = random_doc.to_dict()
-        doc_data["phrase_id"] = random_doc.id
-        record_class = collection_class_map.get(collection_name or User.COLLECTION_NAME)
-        if record_class:
-            record_instance = record_class(**doc_data)
-            logger.info(
-                f"Retrieved random record from {collection_name or User.COLLECTION_NAME}: {random_doc.id} => {record_instance}"
-            )
-            return record_instance
-        else:
-            logger.error(f"No class found for collection name: {collection_name}")
+        doc_data = db_client.get_random_record(
+            username, collection_name, where_field, where_value
+        )
+        if doc_data is None:
             return None
-    except firebase_admin.exceptions.FirebaseError as e:
+        record_instance = load_record(username, record_class, doc_data, db_client)
+        logger.info(
+            f"Retrieved random record from {collection_name or User.COLLECTION_NAME}: {doc_data.get('phrase_id')} => {record_instance}"
+        )
+        return record_instance
+    except DB_ERRORS as e:
         logger.error(
             f"Failed to retrieve random document from {collection_name} for {username}. Error: {e}"
         )
         return None
+
+
+# Reconciliation counts the stored phrases, never a worker's cached copy.
+def count_stage_summary(username: str, db_client: StorageBackend) -> StageSummary:
+    return StageSummary(
+        total=count_stored_records(username, db_client, Phrase.COLLECTION_NAME),
+        stages=[
+            count_stored_records(
+                username, db_client, Phrase.COLLECTION_NAME, "leitner_stage", stage
+            )
+            for stage in LEITNER_STAGES
+        ],
+        active=count_stored_records(
+            username, db_client, Phrase.COLLECTION_NAME, "leitner_current", True
+        ),
+    )
+
+
+def reconcile_stage_summary(username: str, db_client: StorageBackend) -> StageSummary:
+    logger.info(f"Reconciling stage summary for user: {username}")
+    summary = count_stage_summary(username, db_client)
+    try:
+        db_client.set_summary(
+            username,
+            {**summary.to_dict(), "reconciled_at": firestore.SERVER_TIMESTAMP},
+        )
+    except DB_ERRORS as e:
+        logger.error(f"Failed to store stage summary for {username}. Error: {e}")
+    store_summary(username, summary)
+    logger.info(f"Reconciled stage summary for {username}: {summary}")
+    return summary
+
+
+# The cached summary follows this worker's writes; once it is older than
+# SUMMARY_MAX_AGE the document is read again. A version other than the one
+# this worker last saw means another worker wrote in between, so the user's
+# phrase cache is checked against the database as well.
+def get_stage_summary(username: str, db_client: StorageBackend) -> StageSummary:
+    summary = cached_summary(username)
+    if summary is not None:
+        return summary
+
+    try:
+        data = db_client.get_summary(username)
+    except DB_ERRORS as e:
+        logger.error(f"Failed to read stage summary for {username}. Error: {e}")
+        data = None
+    # Increments can create the document before the first reconciliation, so
+    # only a reconciled document holds complete counts.
+    if not data or "reconciled_at" not in data:
+        return reconcile_stage_summary(username, db_client)
+
+    summary = StageSummary.from_dict(data)
+    phrase_caches.check_version(username, summary.version)
+    store_summary(username, summary)
+    return summary
@@ -1,15 +1,28 @@
+import json
+import random
 import uuid
 
 from firebase_admin import firestore
 from loguru import logger
-from pydantic import BaseModel, Field
-from typing import Optional, Any, ClassVar, Type, Dict
+from pydantic import BaseModel, Field, PrivateAttr
+from typing import Optional, Any, ClassVar, Type, Dict, List, Tuple
 
 from utils.models import get_model
+from utils.translation_cache import get_translation_cache
 
 
 class Phrase(BaseModel):
     COLLECTION_NAME: ClassVar[str] = "phrases"
+    TRACKED_FIELDS: ClassVar[Tuple[str, ...]] = (
+        "text",
+        "translation",
+        "leitner_stage",
+        "leitner_current",
+        "mistakes",
+        "correct_answers",
+        "next_review_at",
+    )
+    COUNTER_FIELDS: ClassVar[Tuple[str, ...]] = ("mistakes", "correct_answers")
     text: str
     phrase_id: Optional[str] = None
     translation: Optional[str] = None
@@ -17,20 +30,85 @@ class Phrase(BaseModel):
     leitner_current: bool = False
     mistakes: int = 0
     correct_answers: int = 0
+    random_key: float = Field(default_factory=random.random)
+    # Epoch seconds at which the phrase is next due; None means due now.
+    next_review_at: Optional[float] = None
     created_at: Optional[Any] = Field(
         default_factory=lambda: firestore.SERVER_TIMESTAMP
     )
     updated_at: Optional[Any] = Field(
         default_factory=lambda: firestore.SERVER_TIMESTAMP
     )
+    # Values of tracked fields as last written, keyed by field name.
+    _original: Dict[str, Any] = PrivateAttr(default_factory=dict)
+    # Whether the phrase document exists in the database.
+    _persisted: bool = PrivateAttr(default=False)
 
     def __init__(self, **data):
         super().__init__(**data)
-        if self.translation is None:
-            self.translation = translate_to_base_lang(self.text)
         if self.phrase_id is None:
             self.phrase_id = uuid.uuid4().hex[:20]
 
+    def __setattr__(self, name: str, value: Any) -> None:
+        if name in self.TRACKED_FIELDS and name not in self._original:
+            self._original[name] = getattr(self, name)
+        super().__setattr__(name, value)
+
+    def pop_changes(self) -> Dict[str, Tuple[Any, Any]]:
+        originals, self._original = self._original, {}
+        return {
+            name: (original, getattr(self, name))
+            for name, original in originals.items()
+            if getattr(self, name) != original
+        }
+
+    def restore_changes(self, changes: Dict[str, Tuple[Any, Any]]) -> None:
+        for name, (original, _) in changes.items():
+            self._original[name] = original
+
+    # Takes over the unsaved changes of another copy of this phrase: counters
+    # add up, other fields keep this copy's value if it changed them too.
+    def merge_changes(self, changes: Dict[str, Tuple[Any, Any]]) -> None:
+        for name, (original, value) in changes.items():
+            if name in self.COUNTER_FIELDS:
+                setattr(self, name, getattr(self, name) + value - original)
+            elif name not in self._original:
+                setattr(self, name, value)
+
+    # Applies stored values written elsewhere. Fields with unsaved local
+    # changes keep the local value, and nothing is marked as changed.
+    def apply_remote(self, data: Dict[str, Any]) -> None:
+        for name, value in data.items():
+            if name in type(self).model_fields and name != "phrase_id":
+                if name not in self._original:
+                    super().__setattr__(name, value)
+
+    # The phrase as last written, without unsaved local changes.
+    def stored_dump(self, **kwargs) -> Dict[str, Any]:
+        data = self.model_dump(**kwargs)
+        data.update(
+            {name: value for name, value in self._original.items() if name in data}
+        )
+        return data
+
+    @property
+    def persisted(self) -> bool:
+        return self._persisted
+
+    # Whether tracked fields differ from their values as last written.
+    @property
+    def has_changes(self) -> bool:
+        return any(
+            getattr(self, name) != original for name, original in self._original.items()
+        )
+
+    def mark_persisted(self) -> None:
+        self._persisted = True
+
+    @property
+    def needs_translation(self) -> bool:
+        return self.translation is None
+
     def add_correct_answer(self):
         if self.leitner_stage < 5:
             self.leitner_stage += 1
@@ -45,6 +123,65 @@ class Phrase(BaseModel):
         self.updated_at = firestore.SERVER_TIMESTAMP
 
 
+# Compact, unvalidated form of a stored phrase for large in-memory sets.
+# Callers get a Phrase copy, so pydantic stays at the db boundary.
+class PhraseRecord:
+    FIELDS: ClassVar[Tuple[str, ...]] = (
+        "phrase_id",
+        "text",
+        "translation",
+        "leitner_stage",
+        "leitner_current",
+        "mistakes",
+        "correct_answers",
+        "random_key",
+        "next_review_at",
+    )
+    __slots__ = FIELDS
+
+    def __init__(
+        self,
+        phrase_id: str,
+        text: str,
+        translation: Optional[str] = None,
+        leitner_stage: int = 0,
+        leitner_current: bool = False,
+        mistakes: int = 0,
+        correct_answers: int = 0,
+        random_key: Optional[float] = None,
+        next_review_at: Optional[float] = None,
+    ):
+        self.phrase_id = phrase_id
+        self.text = text
+        self.translation = translation
+        self.leitner_stage = leitner_stage
+        self.leitner_current = leitner_current
+        self.mistakes = mistakes
+        self.correct_answers = correct_answers
+        self.random_key = random.random() if random_key is None else random_key
+        self.next_review_at = next_review_at
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "PhraseRecord":
+        return cls(**{name: data[name] for name in cls.FIELDS if name in data})
+
+    @classmethod
+    def from_phrase(cls, phrase: Phrase) -> "PhraseRecord":
+        return cls(**{name: getattr(phrase, name) for name in cls.FIELDS})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+    @property
+    def needs_translation(self) -> bool:
+        return self.translation is None
+
+    def to_phrase(self) -> Phrase:
+        phrase = Phrase.model_construct(**self.to_dict())
+        phrase.mark_persisted()
+        return phrase
+
+
 class User(BaseModel):
     COLLECTION_NAME: ClassVar[str] = "users"
     language: str
@@ -59,8 +196,22 @@ collection_class_map: Dict[str, Type[BaseModel]] = {
 }
 
 
-def translate_to_base_lang(text: str, base_lang: str = "English") -> Optional[str]:
+# Both translation paths store the same form, so a cached translation
+# doesn't depend on which path filled it.
+def clean_translation(translation: str) -> str:
+    return translation.strip().replace('"', "'")
+
+
+def translate_to_base_lang(
+    text: str, base_lang: str = "English", model_name: str = "gpt-4o-mini"
+) -> Optional[str]:
     logger.info(f"Translating text: '{text}' to base language: '{base_lang}'")
+    cache = get_translation_cache()
+    cached = cache.get(text, base_lang, model_name)
+    if cached is not None:
+        logger.info(f"Translation cache hit: '{cached}'")
+        return clean_translation(cached)
+
     system_instruction = f"""You are an assistant that generates translations for language learning purposes, by translating an input phrase to {base_lang}. If the input is already in {base_lang}, just respond with the same phrase."""
 
     model = get_model("openai")
@@ -70,11 +221,95 @@ def translate_to_base_lang(text: str, base_lang: str = "English") -> Optional[st
         response = model.generate_response(
             system_prompt=system_instruction,
             user_prompt=user_instruction,
-            model_name="gpt-4o-mini",
+            model_name=model_name,
+            raw_response=True,
         )
+        response = clean_translation(response)
         logger.info(f"Translation successful: '{response}'")
+        cache.set(text, base_lang, model_name, response)
         return response
 
     except Exception as e:
         logger.error(f"Error generating translation: {e}")
         return None
+
+
+def chunk_by_token_budget(texts: List[str], max_tokens: int) -> List[List[int]]:
+    chunks = []
+    current = []
+    current_tokens = 0
+    for index, text in enumerate(texts):
+        # Rough estimate: ~4 characters per token plus JSON overhead per item.
+        tokens = len(text) // 4 + 10
+        if current and current_tokens + tokens > max_tokens:
+            chunks.append(current)
+            current = []
+            current_tokens = 0
+        current.append(index)
+        current_tokens += tokens
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def translate_batch_to_base_lang(
+    texts: List[str],
+    base_lang: str = "English",
+    model_name: str = "gpt-4o-mini",
+    max_tokens: int = 1500,
+) -> List[Optional[str]]:
+    logger.info(f"Translating {len(texts)} texts to base language: '{base_lang}'")
+    cache = get_translation_cache()
+    translations: List[Optional[str]] = [
+        cache.get(text, base_lang, model_name) for text in texts
+    ]
+    translations = [
+        clean_translation(translation) if translation is not None else None
+        for translation in translations
+    ]
+    missing = [i for i, translation in enumerate(translations) if translation is None]
+    logger.info(f"Translation cache hits: {len(texts) - len(missing)}/{len(texts)}")
+
+    system_instruction = f"""You are an assistant that generates translations for language learning purposes, by translating input phrases to {base_lang}. If an input is already in {base_lang}, just respond with the same phrase. You receive a JSON list of objects with "id" and "text". Respond in a json format {{"translations": [{{"id": 0, "translation": "..."}}, ...]}} with exactly one translation per id."""
+
+    model = get_model("openai")
+    missing_texts = [texts[i] for i in missing]
+    for chunk in chunk_by_token_budget(missing_texts, max_tokens):
+        items = [{"id": i, "text": missing_texts[i]} for i in chunk]
+        try:
+            response = model.generate_response(
+                system_prompt=system_instruction,
+                user_prompt=json.dumps(items, ensure_ascii=False),
+                model_name=model_name,
+                response_format={"type": "json_object"},
+                raw_response=True,
+            )
+            for item in json.loads(response)["translations"]:
+                item_id = int(item["id"])
+                if item_id in chunk and item.get("translation"):
+                    translation = clean_translation(item["translation"])
+                    translations[missing[item_id]] = translation
+                    cache.set(
+                        missing_texts[item_id], base_lang, model_name, translation
+                    )
+        except Exception as e:
+            logger.error(f"Error generating batch translation: {e}")
+
+    for i in missing:
+        if translations[i] is None:
+            logger.warning(f"Falling back to single translation for: '{texts[i]}'")
+            translations[i] = translate_to_base_lang(texts[i], base_lang, model_name)
+
+    return translations
+
+
+def create_phrase(text: str, base_lang: str = "English") -> Phrase:
+    return Phrase(text=text, translation=translate_to_base_lang(text, base_lang))
+
+
+def create_phrases(texts: List[str], base_lang: str = "English") -> List[Phrase]:
+    translations = translate_batch_to_base_lang(texts, base_lang=base_lang)
+    return [
+        Phrase(text=text, translation=translation)
+        for text, translation in zip(texts, translations)
+    ]
@@ -1,11 +1,10 @@
-from functools import lru_cache
-
 from loguru import logger
 
+from utils.lru_cache import exportable_lru_cache
 from utils.models import get_model
 
 
-@lru_cache(maxsize=50)
+@exportable_lru_cache(maxsize=50)
 def explain_grammar(
     language,
     correct_response,
@@ -0,0 +1,263 @@
+import os
+import random
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from firebase_admin import firestore
+from google.api_core.exceptions import FailedPrecondition
+from loguru import logger
+
+from utils.db_models import Phrase, User
+from utils.stage_summary import (
+    SUMMARY_COLLECTION_NAME,
+    SUMMARY_DOCUMENT_ID,
+    summary_increments,
+)
+from utils.storage import (
+    Changes,
+    PhrasesListener,
+    StorageBackend,
+    SummaryListener,
+)
+
+FIRESTORE_BATCH_LIMIT = 500
+RANDOM_SAMPLING_MODE = os.getenv("RANDOM_SAMPLING_MODE", "indexed")
+
+
+def document_data(doc: Any) -> Dict[str, Any]:
+    data = doc.to_dict() or {}
+    data["phrase_id"] = doc.id
+    return data
+
+
+def paginate(query: Any, page_size: int) -> Iterator[Any]:
+    query = query.order_by("__name__").limit(page_size)
+    last_doc = None
+    while True:
+        page = list((query.start_after(last_doc) if last_doc else query).get())
+        yield from page
+        if len(page) < page_size:
+            return
+        last_doc = page[-1]
+
+
+# Filtered sampling needs a composite index on (filter field, random_key);
+# documents without a random_key are invisible to it until
+# utils.migrations has backfilled them.
+def sample_by_random_key(query: Any) -> Optional[Any]:
+    pivot = random.random()
+    docs = list(
+        query.where("random_key", ">=", pivot).order_by("random_key").limit(1).get()
+    )
+    if not docs:
+        # Wrap around to the smallest key when the pivot lands past the last one.
+        docs = list(
+            query.where("random_key", ">=", 0).order_by("random_key").limit(1).get()
+        )
+    return docs[0] if docs else None
+
+
+def progress_fields(changes: Changes) -> Dict[str, Any]:
+    fields = {}
+    for name, (original, value) in changes.items():
+        if name in Phrase.COUNTER_FIELDS:
+            fields[name] = firestore.Increment(value - original)
+        else:
+            fields[name] = value
+    fields["updated_at"] = firestore.SERVER_TIMESTAMP
+    return fields
+
+
+class FirestoreBackend(StorageBackend):
+    max_batch_size = FIRESTORE_BATCH_LIMIT
+
+    def __init__(self, client: firestore.Client):
+        self.client = client
+
+    def user_ref(self, username: str) -> Any:
+        return self.client.collection(User.COLLECTION_NAME).document(username)
+
+    def summary_ref(self, username: str) -> Any:
+        return (
+            self.user_ref(username)
+            .collection(SUMMARY_COLLECTION_NAME)
+            .document(SUMMARY_DOCUMENT_ID)
+        )
+
+    def collection_query(
+        self,
+        username: str,
+        collection_name: str,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        fields: Optional[List[str]] = None,
+    ) -> Any:
+        ref = self.user_ref(username).collection(collection_name)
+        if where_field and where_value is not None:
+            logger.info(f"Applying filter: {where_field} == {where_value}")
+            ref = ref.where(where_field, "==", where_value)
+        if fields:
+            ref = ref.select(fields)
+        return ref
+
+    # Counter increments ride in the same batch as the documents, together
+    # with the version bump.
+    def _add_summary_delta(
+        self, batch: Any, username: str, delta: Optional[Dict[str, int]]
+    ) -> None:
+        batch.set(
+            self.summary_ref(username),
+            {**summary_increments(delta or {}), "version": firestore.Increment(1)},
+            merge=True,
+        )
+
+    def add_records(
+        self,
+        username: str,
+        collection_name: str,
+        documents: List[Dict[str, Any]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        collection = self.user_ref(username).collection(collection_name)
+        batch = self.client.batch()
+        for document in documents:
+            batch.set(collection.document(document["phrase_id"]), document)
+        self._add_summary_delta(batch, username, delta)
+        batch.commit()
+
+    def update_records(
+        self,
+        username: str,
+        collection_name: str,
+        updates: List[Tuple[str, Changes]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        collection = self.user_ref(username).collection(collection_name)
+        batch = self.client.batch()
+        for phrase_id, changes in updates:
+            batch.update(collection.document(phrase_id), progress_fields(changes))
+        self._add_summary_delta(batch, username, delta)
+        batch.commit()
+
+    def get_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        if not collection_name:
+            doc = self.user_ref(username).get()
+            return [document_data(doc)] if doc.exists else []
+        ref = self.collection_query(
+            username, collection_name, where_field, where_value, fields
+        )
+        docs = ref.limit(limit).get() if limit else ref.get()
+        return [document_data(doc) for doc in docs]
+
+    def stream_records(
+        self,
+        username: str,
+        collection_name: str,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        fields: Optional[List[str]] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        query = self.collection_query(
+            username, collection_name, where_field, where_value, fields
+        )
+        for doc in paginate(query, page_size):
+            yield document_data(doc)
+
+    def count_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> int:
+        if not collection_name:
+            return int(self.user_ref(username).get().exists)
+        query = self.collection_query(
+            username, collection_name, where_field, where_value
+        )
+        return query.count().get()[0][0].value
+
+    def get_random_record(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> Optional[Dict[str, Any]]:
+        if not collection_name:
+            documents = self.get_records(username)
+            return documents[0] if documents else None
+        query = self.collection_query(
+            username, collection_name, where_field, where_value
+        )
+        random_doc = None
+        if RANDOM_SAMPLING_MODE == "indexed":
+            try:
+                random_doc = sample_by_random_key(query)
+            except FailedPrecondition as e:
+                # The composite index is missing or still building.
+                logger.warning(
+                    f"Sampling {collection_name} of {username} without the "
+                    f"random_key index: {e}"
+                )
+        if random_doc is None:
+            docs = list(query.get())
+            random_doc = random.choice(docs) if docs else None
+        return document_data(random_doc) if random_doc is not None else None
+
+    def set_user(self, username: str, document: Dict[str, Any]) -> None:
+        self.user_ref(username).set(document, merge=True)
+
+    # One batched lookup for all user documents instead of a read per user.
+    def get_users(self, usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+        if not usernames:
+            return {}
+        docs = self.client.get_all([self.user_ref(username) for username in usernames])
+        return {doc.id: doc.to_dict() for doc in docs if doc.exists}
+
+    def get_summary(self, username: str) -> Optional[Dict[str, Any]]:
+        doc = self.summary_ref(username).get()
+        return doc.to_dict() if doc.exists else None
+
+    def set_summary(self, username: str, data: Dict[str, Any]) -> None:
+        self.summary_ref(username).set(data, merge=True)
+
+    def watch(
+        self,
+        username: str,
+        on_phrases: PhrasesListener,
+        on_summary: SummaryListener,
+    ) -> Optional[Callable[[], None]]:
+        def phrases_snapshot(docs, changes, read_time):
+            on_phrases(
+                [document_data(doc) for doc in docs],
+                [
+                    (change.type.name, document_data(change.document))
+                    for change in changes
+                ],
+            )
+
+        def summary_snapshot(docs, changes, read_time):
+            for doc in docs:
+                on_summary(doc.to_dict() if doc.exists else None)
+
+        watches = [
+            self.user_ref(username)
+            .collection(Phrase.COLLECTION_NAME)
+            .on_snapshot(phrases_snapshot),
+            self.summary_ref(username).on_snapshot(summary_snapshot),
+        ]
+
+        def unsubscribe() -> None:
+            for watch in watches:
+                watch.unsubscribe()
+
+        return unsubscribe
@@ -1,10 +1,7 @@
 import random
 from loguru import logger
-import google.generativeai as genai
-import os
 
-API_KEY = os.getenv("GOOGLE_AI_STUDIO_KEY")
-genai.configure(api_key=API_KEY)
+from utils.models import get_model
 
 
 def gen_case_identification_task(user_language="Czech"):
@@ -16,13 +13,11 @@ def gen_case_identification_task(user_language="Czech"):
     system_instruction = f"""Your task is to create a simple sentence using {case_or_preposition} in {user_language}. Respond with the sentence only, do not explain yourself. The user will have to guess the grammatical case used. Use basic vocabulary and always include subject, verb, and object in your sentence."""
 
     try:
-        model = genai.GenerativeModel(
-            "gemini-2.0-flash-exp", system_instruction=system_instruction
+        response = get_model("google").generate_response(
+            system_prompt=system_instruction, model_name="gemini-2.0-flash-exp"
         )
-        chat = model.start_chat()
-        response = chat.send_message(system_instruction)
         logger.info("Successfully generated verb declination prompt.")
-        return response.text.strip()
+        return response
     except Exception as e:
         logger.error(f"Error generating verb declination: {e}")
 
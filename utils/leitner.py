@@ -1,20 +1,117 @@
+import heapq
+import itertools
+import os
 import random
-from typing import Optional, List
+import threading
+import time
+from collections.abc import Mapping
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Container, Dict, Iterator, Optional, List, Tuple
 
 from loguru import logger
 import plotly.graph_objects as go
 
-from utils.models import get_model
-from utils.db_models import Phrase
+from utils.db_models import Phrase, PhraseRecord
+from utils.progress_writer import get_progress_writer
+from utils.phrase_sync import get_phrase_sync
+from utils.phrase_cache import CacheEntry, UserPhraseCache
+from utils.phrase_reservoir import phrase_reservoir
+from utils.text_utils import normalize_text
 from utils.db import (
     get_records,
-    count_records,
-    add_record,
+    add_records,
+    update_progress_batch,
     get_random_record,
     get_user_languages,
+    get_stage_summary,
+    get_phrase_cache,
 )
 
 
+# Seconds until a phrase is due again after being graded into each stage;
+# stage 5 holds mastered phrases that come back as occasional refreshers.
+STAGE_INTERVALS = {
+    0: 0,
+    1: 0,
+    2: 10 * 60,
+    3: 60 * 60,
+    4: 24 * 60 * 60,
+    5: 7 * 24 * 60 * 60,
+}
+# A served phrase that is never answered comes back after this delay.
+SERVE_BACKOFF = 60
+TRANSLATIONS_PENDING_MESSAGE = (
+    "Your new phrases are still being translated. Give me a minute and try again."
+)
+REFILL_FAILED_MESSAGE = (
+    "Well that was a disaster. First, I couldn't find enough phrases for you. "
+    "Then, I couldn't generate new phrases. What a day."
+)
+DEFAULT_LEVEL = "A2"
+REPORT_FIELDS = ["text", "leitner_stage", "mistakes", "correct_answers"]
+
+# Refills run on a small shared pool, so phrase generation for many users
+# can't pile up threads or LLM calls.
+refill_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("LEITNER_REFILL_WORKERS", 2)),
+    thread_name_prefix="leitner-refill",
+)
+
+
+class ReviewScheduler:
+    def __init__(self):
+        self._heap: List[Tuple[float, int, str]] = []
+        self._due_at: Dict[str, float] = {}
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._due_at)
+
+    def __contains__(self, phrase_id: object) -> bool:
+        return phrase_id in self._due_at
+
+    def schedule(self, phrase_id: str, due_at: float) -> None:
+        with self._lock:
+            self._due_at[phrase_id] = due_at
+            heapq.heappush(self._heap, (due_at, next(self._counter), phrase_id))
+            # Rescheduling leaves stale entries behind; drop them once they
+            # outnumber the live ones.
+            if len(self._heap) > 2 * len(self._due_at) + 64:
+                self._heap = [
+                    (due_at, next(self._counter), phrase_id)
+                    for phrase_id, due_at in self._due_at.items()
+                ]
+                heapq.heapify(self._heap)
+
+    def remove(self, phrase_id: str) -> None:
+        with self._lock:
+            self._due_at.pop(phrase_id, None)
+
+    # Returns the phrase due first, even when it is not due yet, so practice
+    # always has something to ask.
+    def pop(self) -> Optional[str]:
+        with self._lock:
+            while self._heap:
+                due_at, _, phrase_id = heapq.heappop(self._heap)
+                if self._due_at.get(phrase_id) == due_at:
+                    del self._due_at[phrase_id]
+                    return phrase_id
+            return None
+
+
+def review_due_at(phrase: CacheEntry, now: float) -> float:
+    if phrase.next_review_at is not None:
+        return phrase.next_review_at
+    # Mastered phrases without a schedule are spread over the refresher
+    # interval rather than all falling due at once. The spread stays in
+    # memory; grading the phrase stores its next review time.
+    if phrase.leitner_stage == 5:
+        return now + random.uniform(0, STAGE_INTERVALS[5])
+    return 0.0
+
+
 class Leitner:
     def __init__(
         self, username: str, db_client: object, user_language: str = "Spanish"
@@ -22,9 +119,58 @@ class Leitner:
         self.username = username
         self.db_client = db_client
         self.user_language = user_language
-        self.active_phrases = self.get_active_phrases()
+        self.level = DEFAULT_LEVEL
+        # Users too large for the shared phrase cache keep their active
+        # phrases and refreshers in one of their own.
+        self._own_phrases: Optional[UserPhraseCache] = None
+        self.scheduler = ReviewScheduler()
+        # The phrase cache whose updates the scheduler follows.
+        self._scheduled: Optional[UserPhraseCache] = None
+        # next_review_at each phrase was queued for, so an update that leaves
+        # it alone keeps a serve backoff in place.
+        self._queued_review_at: Dict[str, Optional[float]] = {}
+        # Held for every change to the scheduler, from requests, the refill
+        # thread and cache updates alike.
+        self._lock = threading.RLock()
         self.max_capacity = 30
-        self.min_capacity = 29
+        # Low-water mark: a background refill starts below this many active
+        # phrases.
+        self.min_capacity = int(os.getenv("LEITNER_LOW_WATER_MARK", 29))
+        self._refill: Optional[Future] = None
+        self._refill_lock = threading.Lock()
+        phrase_sync = get_phrase_sync(db_client)
+        if phrase_sync is not None:
+            phrase_sync.watch(username)
+        get_phrase_cache(self.username, self.db_client)
+
+    # The user's phrase cache, which every write keeps current and whose stage
+    # and active buckets the Leitner reads directly. Users too large to cache
+    # load their active phrases and refreshers into a cache of their own once
+    # and maintain them there.
+    @property
+    def phrases(self) -> UserPhraseCache:
+        cache = get_phrase_cache(self.username, self.db_client)
+        if cache is not None:
+            return cache
+        if self._own_phrases is None:
+            own_phrases = UserPhraseCache(max_entries=None)
+            own_phrases.load(
+                [
+                    PhraseRecord.from_phrase(phrase)
+                    for phrase in self.get_active_phrases() + self.get_refreshers()
+                ]
+            )
+            with self._lock:
+                if self._own_phrases is None:
+                    self._own_phrases = own_phrases
+        return self._own_phrases
+
+    @property
+    def active_phrases(self) -> List[Phrase]:
+        return self.phrases.query("leitner_current", True)
+
+    def count_active_phrases(self) -> int:
+        return self.phrases.count("leitner_current", True)
 
     def get_active_phrases(self) -> List[Phrase]:
         return get_records(
@@ -35,68 +181,148 @@ class Leitner:
             where_value=True,
         )
 
+    def get_refreshers(self) -> List[Phrase]:
+        return get_records(
+            username=self.username,
+            db_client=self.db_client,
+            collection_name="phrases",
+            where_field="leitner_stage",
+            where_value=5,
+        )
+
+    # Read-only copies of the active phrases with just what the reports show.
+    def get_report_phrases(self) -> List[Phrase]:
+        return self.phrases.query("leitner_current", True, fields=REPORT_FIELDS)
+
     def gen_translation_task(self) -> Optional[str]:
         logger.info(
             f"Generating translation task for user: {self.username}, language: {self.user_language}"
         )
 
-        if not self.active_phrases:
-            ct_current_phrases = count_records(
-                username=self.username,
-                db_client=self.db_client,
-                collection_name="phrases",
-                where_field="leitner_current",
-                where_value=True,
-            )
-        else:
-            ct_current_phrases = len(self.active_phrases)
+        ct_active_phrases = self.count_active_phrases()
+        logger.debug(f"Current phrases count: {ct_active_phrases}")
+
+        refill = self.refill_if_low(ct_active_phrases)
+        # A new user has nothing to practice until the first refill lands.
+        if refill is not None and not ct_active_phrases:
+            refill.result()
+            if not self.count_active_phrases():
+                return REFILL_FAILED_MESSAGE
+
+        return self.next_due_phrase()
+
+    # Active phrases and stage-5 refreshers share one heap ordered by due time.
+    # A phrase cache not seen before (the first one, a reloaded one, or the
+    # user's own) is scanned once; after that its updates keep the heap
+    # current.
+    def sync_scheduler(self) -> UserPhraseCache:
+        phrases = self.phrases
+        with self._lock:
+            if phrases is self._scheduled:
+                return phrases
+            self._scheduled = phrases
+            self.scheduler = ReviewScheduler()
+            self._queued_review_at = {}
+            phrases.subscribe(partial(self.on_phrase_changed, phrases))
+            for entry in phrases.entries("leitner_current", True) + phrases.entries(
+                "leitner_stage", 5
+            ):
+                self.track(phrases, entry.phrase_id, entry)
+            logger.debug(f"Scheduled {len(self.scheduler)} phrases for {self.username}")
+            return phrases
+
+    def on_phrase_changed(
+        self, phrases: UserPhraseCache, phrase_id: str, entry: Optional[CacheEntry]
+    ) -> None:
+        with self._lock:
+            if phrases is self._scheduled:
+                self.track(phrases, phrase_id, entry)
+
+    def track(
+        self, phrases: UserPhraseCache, phrase_id: str, entry: Optional[CacheEntry]
+    ) -> None:
+        if entry is None or not (entry.leitner_current or entry.leitner_stage == 5):
+            self.scheduler.remove(phrase_id)
+            self._queued_review_at.pop(phrase_id, None)
+        elif (
+            phrase_id not in self.scheduler
+            or self._queued_review_at.get(phrase_id) != entry.next_review_at
+        ):
+            self._queued_review_at[phrase_id] = entry.next_review_at
+            self.scheduler.schedule(phrase_id, review_due_at(entry, time.time()))
+
+    def next_due_phrase(self) -> Optional[Phrase]:
+        phrases = self.sync_scheduler()
+        with self._lock:
+            for _ in range(len(self.scheduler)):
+                phrase_id = self.scheduler.pop()
+                phrase = phrases.get(phrase_id)
+                if phrase is None or not (
+                    phrase.leitner_current or phrase.leitner_stage == 5
+                ):
+                    continue
+                self.scheduler.schedule(phrase_id, time.time() + SERVE_BACKOFF)
+                # Phrases waiting for the translation backfill can't be asked
+                # yet.
+                if phrase.needs_translation:
+                    continue
+                logger.debug(f"Next due phrase: {phrase}")
+                return phrase
+        return self.pick_random_phrase()
+
+    def reschedule(self, phrase: Phrase) -> None:
+        phrase.next_review_at = time.time() + STAGE_INTERVALS[phrase.leitner_stage]
+        # The cache buckets and the review heap follow the grade now, not when
+        # the writer flushes.
+        self.phrases.put(phrase)
+
+    def find_phrase(self, phrase_id: str) -> Optional[Phrase]:
+        phrase = self.phrases.get(phrase_id)
+        if phrase is None:
+            logger.warning(f"Phrase {phrase_id} not found for {self.username}")
+        return phrase
+
+    def refill_if_low(self, ct_current_phrases: int) -> Optional[Future]:
+        if ct_current_phrases < self.min_capacity:
+            return self.request_refill()
+        return None
 
-        logger.debug(f"Current phrases count: {ct_current_phrases}")
+    def request_refill(self) -> Future:
+        with self._refill_lock:
+            if self._refill is None or self._refill.done():
+                self._refill = refill_executor.submit(self._run_refill)
+            return self._refill
 
-        if ct_current_phrases < self.min_capacity:
-            return self.handle_insufficient_phrases(ct_current_phrases)
-        else:
-            if random.random() < 0.8:
-                return self.pick_random_phrase()
-            else:
-                try:
-                    return get_random_record(
-                        username=self.username,
-                        db_client=self.db_client,
-                        collection_name="phrases",
-                        where_field="leitner_stage",
-                        where_value=5,
-                    )
-                except Exception as e:
-                    logger.error(f"Error getting a phrase from stage 5: {e}")
-                    return get_random_record(
-                        username=self.username,
-                        db_client=self.db_client,
-                        collection_name="phrases"
-                    )
-
-    def handle_insufficient_phrases(self, ct_current_phrases) -> Optional[str]:
+    def _run_refill(self) -> None:
+        try:
+            self.refill()
+        except Exception as e:
+            logger.error(f"Failed to refill active phrases for {self.username}: {e}")
+
+    # Tops the active box back up to max_capacity, generating new phrases
+    # first when the backlog is too small.
+    def refill(self) -> int:
+        ct_current_phrases = self.count_active_phrases()
         logger.info(
-            f"Handling insufficient phrases for user: {self.username}, current phrases: {ct_current_phrases}"
+            f"Refilling active phrases for user: {self.username}, current phrases: {ct_current_phrases}"
         )
-        ct_stage_0_phrases = count_records(
-            username=self.username,
-            db_client=self.db_client,
-            collection_name="phrases",
-            where_field="leitner_stage",
-            where_value=0,
-        )
-        logger.debug(f"Stage 0 phrases count: {ct_stage_0_phrases}")
-
         nr_records_below_capacity = int(self.max_capacity - ct_current_phrases)
         logger.debug(f"Number of records below capacity: {nr_records_below_capacity}")
+        if nr_records_below_capacity <= 0:
+            return 0
 
         self.validate_capacity(nr_records_below_capacity)
 
-        if ct_stage_0_phrases >= nr_records_below_capacity:
-            return self.activate_phrases_from_backlog(nr_records_below_capacity)
-        else:
-            return self.generate_and_add_new_phrases(nr_records_below_capacity)
+        ct_stage_0_phrases = get_stage_summary(self.username, self.db_client).stages[0]
+        logger.debug(f"Stage 0 phrases count: {ct_stage_0_phrases}")
+        if ct_stage_0_phrases < nr_records_below_capacity:
+            self.generate_and_add_new_phrases(
+                nr_records_below_capacity - ct_stage_0_phrases
+            )
+
+        activated = self.activate_phrases_from_backlog(nr_records_below_capacity)
+        logger.info(f"Activated {len(activated)} phrases for {self.username}")
+        return len(activated)
 
     def validate_capacity(self, nr_records_below_capacity: int):
         logger.debug(f"Validating capacity: {nr_records_below_capacity}")
@@ -115,7 +341,7 @@ class Leitner:
 
     def activate_phrases_from_backlog(
         self, nr_records_below_capacity: int
-    ) -> Optional[str]:
+    ) -> List[Phrase]:
         logger.info(
             f"Activating phrases from backlog for user: {self.username}, count: {nr_records_below_capacity}"
         )
@@ -133,30 +359,73 @@ class Leitner:
         for phrase in phrases_to_activate:
             phrase.leitner_stage = 1
             phrase.leitner_current = True
-            add_record(self.username, phrase, self.db_client)
-            self.active_phrases.append(phrase)
 
-        return phrases_to_activate[0] if phrases_to_activate else None
+        outcomes = update_progress_batch(
+            self.username, phrases_to_activate, self.db_client
+        )
+        phrases = self.phrases
+        activated = []
+        for phrase, added in zip(phrases_to_activate, outcomes):
+            if added:
+                # Queued for review by the scheduler's cache listener, which
+                # takes the Leitner's lock on this refill thread.
+                phrases.put(phrase)
+                activated.append(phrase)
+
+        return activated
 
     def generate_and_add_new_phrases(
         self, nr_records_below_capacity: int
-    ) -> Optional[str]:
+    ) -> List[Phrase]:
         logger.info(
             f"Generating and adding new phrases for user: {self.username}, language: {self.user_language}, count: {nr_records_below_capacity}"
         )
-        new_phrases = self.generate_new_phrases(
-            user_lang=self.user_language, num_phrases=nr_records_below_capacity
+        known_texts = self.get_known_texts()
+        entries = phrase_reservoir.take(
+            self.user_language, self.level, nr_records_below_capacity, known_texts
         )
-        logger.debug(f"Generated new phrases: {new_phrases}")
-
-        if new_phrases:
-            for new_phrase in eval(new_phrases)["phrases"]:
-                phrase_to_add = Phrase(text=new_phrase)
-                add_record(self.username, phrase_to_add, self.db_client)
-            return phrase_to_add
+        if len(entries) < nr_records_below_capacity:
+            # The reservoir ran dry, e.g. right after a restart, or holds only
+            # phrases the user already has; this already runs in the
+            # background, so wait for a generation round, joining one that is
+            # already running for the language.
+            phrase_reservoir.request_refill(
+                self.user_language, self.level, force=True
+            ).result()
+            entries += phrase_reservoir.take(
+                self.user_language,
+                self.level,
+                nr_records_below_capacity - len(entries),
+                known_texts,
+            )
+        logger.debug(f"New phrases from the reservoir: {entries}")
+
+        if entries:
+            phrases_to_add = [
+                Phrase(text=text, translation=translation)
+                for text, translation in entries
+            ]
+            add_records(self.username, phrases_to_add, self.db_client)
+            return phrases_to_add
         else:
             logger.error("Failed to generate new phrases.")
-            return "Well that was a disaster. First, I couldn't find enough phrases for you. Then, I couldn't generate new phrases. What a day."
+            return []
+
+    # Normalized texts of all the user's phrases, as kept by the phrase cache;
+    # users too large to cache read them with a projected query.
+    def get_known_texts(self) -> Container[str]:
+        cache = get_phrase_cache(self.username, self.db_client)
+        if cache is not None:
+            return cache.texts
+        return {
+            normalize_text(phrase.text)
+            for phrase in get_records(
+                username=self.username,
+                db_client=self.db_client,
+                collection_name="phrases",
+                fields=["text"],
+            )
+        }
 
     def pick_random_phrase(
         self,
@@ -172,75 +441,52 @@ class Leitner:
                 where_value=True,
             )
         else:
-            random_index = random.randint(0, len(self.active_phrases) - 1)
-            random_phrase = self.active_phrases[random_index]
+            candidates = [
+                phrase for phrase in self.active_phrases if not phrase.needs_translation
+            ]
+            random_phrase = random.choice(candidates) if candidates else None
 
         logger.debug(f"Random phrase: {random_phrase}")
+        # Phrases waiting for the translation backfill can't be asked yet.
+        if self.active_phrases and (
+            random_phrase is None or random_phrase.needs_translation
+        ):
+            return TRANSLATIONS_PENDING_MESSAGE
         return random_phrase
 
-    def generate_new_phrases(
-        self, user_lang: str = "Spanish", num_phrases: int = 5, level: str = "A2"
-    ) -> Optional[str]:
-        logger.info(
-            f"Generating new phrases in {user_lang} at level {level}, count: {num_phrases}"
-        )
-        system_instruction = f"""Generate {num_phrases} new phrases in {user_lang} at level {level}. They should be max. 8 words long and cover common topics like work, food, or travel. Include a mix of questions, statements, and commands. Use vocabulary and grammar to match the {level} proficiency level. Respond in a json format {{"phrases": ["phrase1", "phrase2", ...]}}."""
-
-        model = get_model("openai")
-
-        try:
-            response = model.generate_response(
-                system_prompt=system_instruction,
-                user_prompt=None,
-                model_name="gpt-4o-mini",
-                response_format={"type": "json_object"},
-            )
-            logger.info(f"Generation successful: '{response}'")
-            return response
-
-        except Exception as e:
-            logger.error(f"Error generating new phrases: {e}")
-            return None
-
     def add_mistake(self, phrase_id: str) -> None:
         logger.info(f"Adding mistake for phrase: {phrase_id}")
-        for phrase in self.active_phrases:
-            if phrase.phrase_id == phrase_id:
-                phrase.add_mistake()
-                add_record(self.username, phrase, self.db_client)
+        phrase = self.find_phrase(phrase_id)
+        if phrase is None:
+            return
+        phrase.add_mistake()
+        # A forgotten refresher goes back into active practice.
+        phrase.leitner_current = True
+        self.reschedule(phrase)
+        get_progress_writer().record(self.username, phrase, self.db_client)
 
     def add_correct_answer(self, phrase_id: str) -> None:
         logger.info(f"Adding correct answer for phrase: {phrase_id}")
-        for phrase in self.active_phrases:
-            if phrase.phrase_id == phrase_id:
-                phrase.add_correct_answer()
-                add_record(self.username, phrase, self.db_client)
-                if phrase.leitner_stage == 5:
-                    self.active_phrases.remove(phrase)
-                    return "Success! You've mastered this phrase. I removed it from your active list from now on! 🎉"
+        phrase = self.find_phrase(phrase_id)
+        if phrase is None:
+            return
+        was_mastered = phrase.leitner_stage == 5
+        phrase.add_correct_answer()
+        if phrase.leitner_stage < 5:
+            phrase.leitner_current = True
+        self.reschedule(phrase)
+        get_progress_writer().record(self.username, phrase, self.db_client)
+        if phrase.leitner_stage == 5 and not was_mastered:
+            self.refill_if_low(self.count_active_phrases())
+            return "Success! You've mastered this phrase. I removed it from your active list from now on! 🎉"
 
     def get_stats(self) -> dict:
         logger.info(f"Getting stats for user: {self.username}")
 
-        total_records = count_records(
-            username=self.username, db_client=self.db_client, collection_name="phrases"
-        )
-
-        practiced_records = total_records - count_records(
-            username=self.username,
-            db_client=self.db_client,
-            collection_name="phrases",
-            where_field="leitner_stage",
-            where_value=0,
-        )
-
-        completed_records = count_records(
-            username=self.username,
-            db_client=self.db_client,
-            collection_name="phrases",
-            where_field="leitner_stage",
-            where_value=5,
-        )
+        summary = get_stage_summary(self.username, self.db_client)
+        total_records = summary.total
+        practiced_records = total_records - summary.stages[0]
+        completed_records = summary.stages[5]
 
         response = (
             f"Alright, {self.username}, here are your stats:\n"
@@ -261,7 +507,7 @@ class Leitner:
 
         stage_counts = [0, 0, 0, 0]
 
-        for phrase in self.active_phrases:
+        for phrase in self.get_report_phrases():
             stage_counts[phrase.leitner_stage - 1] += 1
 
         fig = go.Figure(data=[go.Bar(name="Phrases", x=stages, y=stage_counts)])
@@ -270,16 +516,72 @@ class Leitner:
         fig.show()
 
 
-def initialize_leitner(usernames: List[str], db_client: object) -> dict:
-    logger.info(f"Initializing Leitner objects for users: {usernames}")
-    leitner_dict = {}
-    user_languages = get_user_languages(db_client)
-    logger.debug(f"User languages: {user_languages}")
-    for username in usernames:
-        user_language = user_languages.get(username)
-        logger.debug(f"User language for {username}: {user_language}")
-        leitner_dict[username] = Leitner(
-            username=username, db_client=db_client, user_language=user_language
+# Builds each user's Leitner on first access, so startup does no reads and
+# an update only waits for its own user.
+class LeitnerRegistry(Mapping):
+    def __init__(self, usernames: List[str], db_client: object):
+        self.usernames = list(usernames)
+        self.db_client = db_client
+        self._leitners: Dict[str, Leitner] = {}
+        self._languages: Dict[str, Optional[str]] = {}
+        self._locks = {username: threading.Lock() for username in self.usernames}
+
+    def __contains__(self, username: object) -> bool:
+        return username in self._locks
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.usernames)
+
+    def __len__(self) -> int:
+        return len(self.usernames)
+
+    def __getitem__(self, username: str) -> Leitner:
+        leitner = self._leitners.get(username)
+        if leitner is not None:
+            return leitner
+        if username not in self._locks:
+            raise KeyError(username)
+        with self._locks[username]:
+            if username not in self._leitners:
+                self._leitners[username] = self._build(username)
+            return self._leitners[username]
+
+    def _build(self, username: str) -> Leitner:
+        if username not in self._languages:
+            self._languages.update(get_user_languages(self.db_client, [username]))
+        user_language = self._languages.get(username)
+        logger.info(f"Initializing Leitner for {username}, language: {user_language}")
+        return Leitner(
+            username=username, db_client=self.db_client, user_language=user_language
         )
 
-    return leitner_dict
+    def prewarm(self, max_workers: int = 4) -> None:
+        logger.info(f"Prewarming Leitner objects for users: {self.usernames}")
+        self._languages.update(get_user_languages(self.db_client, self.usernames))
+        for language in set(self._languages.values()) - {None}:
+            phrase_reservoir.warm(language, DEFAULT_LEVEL)
+        with ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="leitner-prewarm"
+        ) as executor:
+            for username, future in [
+                (username, executor.submit(self.__getitem__, username))
+                for username in self.usernames
+            ]:
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Failed to prewarm Leitner for {username}: {e}")
+        logger.info("Leitner prewarm finished")
+
+
+def initialize_leitner(usernames: List[str], db_client: object) -> LeitnerRegistry:
+    logger.info(f"Initializing Leitner registry for users: {usernames}")
+    registry = LeitnerRegistry(usernames, db_client)
+    if os.getenv("LEITNER_PREWARM", "off") == "background":
+        threading.Thread(
+            target=registry.prewarm,
+            kwargs={"max_workers": int(os.getenv("LEITNER_PREWARM_WORKERS", 4))},
+            name="leitner-prewarm",
+            daemon=True,
+        ).start()
+    return registry
@@ -0,0 +1,68 @@
+import functools
+import json
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Tuple
+
+
+class LRUCache:
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def set(self, key: str, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def export(self) -> List[Tuple[str, Any]]:
+        with self._lock:
+            return list(self._entries.items())
+
+    def load(self, entries: List[Tuple[str, Any]]) -> None:
+        for key, value in entries:
+            self.set(key, value)
+
+
+# Like functools.lru_cache, but keys are JSON strings so the entries can be
+# exported to and restored from the warm-state snapshot.
+def exportable_lru_cache(maxsize: int = 128) -> Callable:
+    sentinel = object()
+
+    def decorator(func: Callable) -> Callable:
+        cache = LRUCache(maxsize=maxsize)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = json.dumps([args, sorted(kwargs.items())], default=str)
+            value = cache.get(key, sentinel)
+            if value is sentinel:
+                value = func(*args, **kwargs)
+                cache.set(key, value)
+            return value
+
+        wrapper.cache = cache
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
@@ -0,0 +1,43 @@
+import random
+
+from loguru import logger
+
+from utils.config_utils import get_allowed_users
+from utils.db import firebase_connection, reconcile_stage_summary
+from utils.db_models import Phrase
+from utils.firestore_storage import FIRESTORE_BATCH_LIMIT, FirestoreBackend, paginate
+
+
+def backfill_random_keys(username: str, db_client: FirestoreBackend) -> int:
+    logger.info(f"Backfilling random keys for user: {username}")
+    query = db_client.collection_query(
+        username, Phrase.COLLECTION_NAME, fields=["random_key"]
+    )
+    docs = paginate(query, FIRESTORE_BATCH_LIMIT)
+
+    updated = 0
+    batch = db_client.client.batch()
+    batch_size = 0
+    for doc in docs:
+        if (doc.to_dict() or {}).get("random_key") is not None:
+            continue
+        batch.update(doc.reference, {"random_key": random.random()})
+        batch_size += 1
+        if batch_size == FIRESTORE_BATCH_LIMIT:
+            batch.commit()
+            updated += batch_size
+            batch = db_client.client.batch()
+            batch_size = 0
+    if batch_size:
+        batch.commit()
+        updated += batch_size
+
+    logger.info(f"Backfilled random keys for {updated} phrases of {username}")
+    return updated
+
+
+if __name__ == "__main__":
+    db_client = FirestoreBackend(firebase_connection())
+    for username in get_allowed_users():
+        backfill_random_keys(username, db_client)
+        reconcile_stage_summary(username, db_client)
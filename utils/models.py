@@ -1,8 +1,14 @@
 from abc import ABC, abstractmethod
 import os
+import threading
+from typing import Dict
 
+import httpx
 import openai
 import google.generativeai as genai
+from loguru import logger
+
+HTTP_POOL_SIZE = int(os.getenv("LLM_HTTP_POOL_SIZE", 20))
 
 
 class ModelInterface(ABC):
@@ -20,6 +26,12 @@ class OpenAIModel(ModelInterface):
         self.client = openai.OpenAI(
             api_key=os.getenv("OPENAI_API_KEY"),
             base_url=os.getenv("OPENAI_BASE_URL"),
+            http_client=openai.DefaultHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=HTTP_POOL_SIZE,
+                    max_keepalive_connections=HTTP_POOL_SIZE,
+                )
+            ),
         )
 
     def generate_response(self, system_prompt, user_prompt, **kwargs):
@@ -41,7 +53,10 @@ class OpenAIModel(ModelInterface):
             messages=msgs,
         )
 
-        clean_response = response.choices[0].message.content.strip().replace('"', "'")
+        content = response.choices[0].message.content.strip()
+        if kwargs.get("raw_response", False):
+            return content
+        clean_response = content.replace('"', "'")
         return clean_response
 
 
@@ -60,14 +75,26 @@ class GoogleModel(ModelInterface):
         return clean_response
 
 
+model_classes = {
+    "openai": OpenAIModel,
+    "google": GoogleModel,
+}
+_models: Dict[str, ModelInterface] = {}
+_models_lock = threading.Lock()
+
+
 def get_model(model_type):
-    if model_type == "openai":
-        model = OpenAIModel()
-        model.configure()
+    model = _models.get(model_type)
+    if model is not None:
         return model
-    elif model_type == "google":
-        model = GoogleModel()
-        model.configure()
+
+    with _models_lock:
+        model = _models.get(model_type)
+        if model is None:
+            if model_type not in model_classes:
+                raise ValueError(f"Unknown model type: {model_type}")
+            logger.info(f"Configuring {model_type} model client")
+            model = model_classes[model_type]()
+            model.configure()
+            _models[model_type] = model
         return model
-    else:
-        raise ValueError(f"Unknown model type: {model_type}")
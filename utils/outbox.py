@@ -0,0 +1,241 @@
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+import requests
+from loguru import logger
+from requests.adapters import HTTPAdapter
+from telebot import apihelper, types
+from telebot.apihelper import ApiTelegramException
+
+MAX_MESSAGE_LENGTH = 4096
+MESSAGE_SEPARATOR = "\n\n"
+
+
+def configure_session(pool_size: int = 16) -> requests.Session:
+    logger.info(f"Configuring pooled Bot API session, pool size: {pool_size}")
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    # telebot reuses apihelper.session on every thread once it is set.
+    apihelper.session = session
+    return session
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.capacity, self._tokens + (now - self._updated_at) * self.rate
+        )
+        self._updated_at = now
+
+    def acquire(self) -> float:
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+@dataclass
+class OutgoingMessage:
+    chat_id: Any
+    text: Optional[str] = None
+    photo: Any = None
+    reply_markup: Any = None
+    reply_to_message_id: Optional[int] = None
+    kwargs: Dict[str, Any] = field(default_factory=dict)
+
+    def can_merge(self, other: "OutgoingMessage") -> bool:
+        return (
+            self.text is not None
+            and other.text is not None
+            and not self.kwargs
+            and not other.kwargs
+            and self.chat_id == other.chat_id
+            and self.reply_markup is None
+            and other.reply_to_message_id in (None, self.reply_to_message_id)
+            and len(self.text) + len(MESSAGE_SEPARATOR) + len(other.text)
+            <= MAX_MESSAGE_LENGTH
+        )
+
+    def merge(self, other: "OutgoingMessage") -> None:
+        self.text = f"{self.text}{MESSAGE_SEPARATOR}{other.text}"
+        self.reply_markup = other.reply_markup
+
+
+def coalesce(messages: List[OutgoingMessage]) -> List[OutgoingMessage]:
+    merged: List[OutgoingMessage] = []
+    last_by_chat: Dict[Any, OutgoingMessage] = {}
+    for message in messages:
+        last = last_by_chat.get(message.chat_id)
+        if last is not None and last.can_merge(message):
+            last.merge(message)
+        else:
+            merged.append(message)
+            last_by_chat[message.chat_id] = message
+    return merged
+
+
+class Outbox:
+    def __init__(
+        self,
+        bot,
+        per_chat_rate: float = 1.0,
+        per_chat_burst: float = 3,
+        global_rate: float = 30.0,
+        max_retries: int = 3,
+        max_chats: int = 10000,
+    ):
+        self.bot = bot
+        self.per_chat_rate = per_chat_rate
+        self.per_chat_burst = per_chat_burst
+        self.max_retries = max_retries
+        self.max_chats = max_chats
+        self._global_bucket = TokenBucket(rate=global_rate, capacity=global_rate)
+        self._chat_buckets: "OrderedDict[Any, TokenBucket]" = OrderedDict()
+        self._buckets_lock = threading.Lock()
+        self._local = threading.local()
+
+    @contextmanager
+    def turn(self):
+        if getattr(self._local, "pending", None) is not None:
+            yield
+            return
+        self._local.pending = []
+        try:
+            yield
+        finally:
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush queued messages: {e}")
+            finally:
+                self._local.pending = None
+
+    def flush(self) -> None:
+        pending = getattr(self._local, "pending", None)
+        if not pending:
+            return
+        self._local.pending = []
+        messages = coalesce(pending)
+        logger.debug(f"Coalesced {len(pending)} queued messages into {len(messages)}")
+        errors = []
+        for message in messages:
+            try:
+                self._deliver(message)
+            except Exception as e:
+                logger.error(f"Failed to send message to {message.chat_id}: {e}")
+                errors.append(e)
+        if errors:
+            raise errors[0]
+
+    def send_message(
+        self,
+        chat_id: Any,
+        text: str,
+        reply_markup: Any = None,
+        reply_to_message_id: Optional[int] = None,
+        **kwargs,
+    ) -> None:
+        self._enqueue(
+            OutgoingMessage(
+                chat_id=chat_id,
+                text=text,
+                reply_markup=reply_markup,
+                reply_to_message_id=reply_to_message_id,
+                kwargs=kwargs,
+            )
+        )
+
+    def reply_to(self, message: Any, text: str, **kwargs) -> None:
+        self.send_message(
+            message.chat.id, text, reply_to_message_id=message.message_id, **kwargs
+        )
+
+    def send_photo(self, chat_id: Any, photo: Any, **kwargs) -> None:
+        self._enqueue(OutgoingMessage(chat_id=chat_id, photo=photo, kwargs=kwargs))
+
+    def _enqueue(self, message: OutgoingMessage) -> None:
+        pending = getattr(self._local, "pending", None)
+        if pending is None:
+            self._deliver(message)
+        else:
+            pending.append(message)
+
+    def _chat_bucket(self, chat_id: Any) -> TokenBucket:
+        with self._buckets_lock:
+            bucket = self._chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(
+                    rate=self.per_chat_rate, capacity=self.per_chat_burst
+                )
+                self._chat_buckets[chat_id] = bucket
+                while len(self._chat_buckets) > self.max_chats:
+                    self._chat_buckets.popitem(last=False)
+            else:
+                self._chat_buckets.move_to_end(chat_id)
+            return bucket
+
+    def _deliver(self, message: OutgoingMessage) -> Any:
+        for attempt in range(self.max_retries + 1):
+            waited = self._chat_bucket(message.chat_id).acquire()
+            waited += self._global_bucket.acquire()
+            if waited:
+                logger.debug(
+                    f"Rate limited message to {message.chat_id} for {waited:.2f}s"
+                )
+            try:
+                if message.photo is not None:
+                    return self.bot.send_photo(
+                        message.chat_id, message.photo, **message.kwargs
+                    )
+                kwargs = dict(message.kwargs)
+                if message.reply_to_message_id is not None:
+                    kwargs["reply_parameters"] = types.ReplyParameters(
+                        message.reply_to_message_id
+                    )
+                return self.bot.send_message(
+                    message.chat_id,
+                    message.text,
+                    reply_markup=message.reply_markup,
+                    **kwargs,
+                )
+            except ApiTelegramException as e:
+                # Merged messages share one parse mode; rather than losing
+                # the whole message and its keyboard to bad markup in one
+                # part, send it as plain text.
+                if (
+                    e.error_code == 400
+                    and "can't parse entities" in e.description
+                    and message.kwargs.get("parse_mode") != ""
+                ):
+                    logger.warning(
+                        f"Markdown rejected for {message.chat_id}, sending as plain text"
+                    )
+                    message.kwargs["parse_mode"] = ""
+                    continue
+                if e.error_code != 429 or attempt == self.max_retries:
+                    raise
+                retry_after = e.result_json.get("parameters", {}).get("retry_after", 1)
+                logger.warning(
+                    f"Telegram rate limit hit for {message.chat_id}, retrying in {retry_after}s"
+                )
+                time.sleep(retry_after)
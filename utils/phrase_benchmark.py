@@ -0,0 +1,78 @@
+import gc
+import random
+import sys
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+from utils.db_models import Phrase, PhraseRecord
+from utils.phrase_cache import UserPhraseCache
+
+# Compares pydantic phrases with compact records for the in-memory phrase
+# cache: python -m utils.phrase_benchmark [size ...]
+
+
+def stored_documents(size: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "phrase_id": f"phrase{i:08d}",
+            "text": f"Esta es la frase número {i}",
+            "translation": f"This is phrase number {i}",
+            "leitner_stage": i % 6,
+            "leitner_current": i % 6 in (1, 2, 3, 4) and i % 50 == 0,
+            "mistakes": i % 3,
+            "correct_answers": i % 7,
+            "random_key": random.random(),
+            "next_review_at": None,
+        }
+        for i in range(size)
+    ]
+
+
+def build_phrases(documents: List[Dict[str, Any]]) -> List[Phrase]:
+    phrases = [Phrase(**data) for data in documents]
+    for phrase in phrases:
+        phrase.mark_persisted()
+    return phrases
+
+
+def build_records(documents: List[Dict[str, Any]]) -> List[PhraseRecord]:
+    return [PhraseRecord.from_dict(data) for data in documents]
+
+
+def load_cache(build: Callable, documents: List[Dict[str, Any]]) -> UserPhraseCache:
+    cache = UserPhraseCache(max_entries=len(documents))
+    cache.load(build(documents))
+    return cache
+
+
+def measure(func: Callable, *args) -> Tuple[float, float]:
+    gc.collect()
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func(*args)
+    elapsed = time.perf_counter() - started
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return size / 2**20, elapsed
+
+
+def run(size: int) -> None:
+    documents = stored_documents(size)
+    print(f"{size} phrases")
+    for name, build in (("pydantic", build_phrases), ("record", build_records)):
+        memory, elapsed = measure(load_cache, build, documents)
+        print(f"  {name:<10}{memory:>10.1f} MiB{elapsed:>10.3f} s")
+    cache = load_cache(build_records, documents)
+    started = time.perf_counter()
+    active = cache.query("leitner_current", True)
+    print(
+        f"  active query on records: {len(active)} phrases "
+        f"in {time.perf_counter() - started:.4f} s"
+    )
+
+
+if __name__ == "__main__":
+    for size in [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]:
+        run(size)
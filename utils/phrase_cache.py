@@ -0,0 +1,323 @@
+import os
+import random
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set, Tuple, Union
+
+from loguru import logger
+
+from utils.db_models import Phrase, PhraseRecord
+from utils.text_utils import normalize_text
+
+# Entries are compact records. Readers get Phrase copies, and only a put
+# changes an entry. A phrase put with unsaved changes is kept as it is until
+# its write lands; the put after that write folds it back into a record.
+CacheEntry = Union[Phrase, PhraseRecord]
+# Called with the phrase id and its new entry, or None once it is removed.
+CacheListener = Callable[[str, Optional[CacheEntry]], None]
+
+
+def project(entry: CacheEntry, fields: List[str]) -> Phrase:
+    return Phrase.model_construct(
+        phrase_id=entry.phrase_id,
+        **{name: getattr(entry, name) for name in fields if hasattr(entry, name)},
+    )
+
+
+class UserPhraseCache:
+    # max_entries of None leaves the cache unbounded.
+    def __init__(self, max_entries: Optional[int] = 20000):
+        self.max_entries = max_entries
+        self.loaded = False
+        self.oversized = False
+        self.version = 0
+        # Value of the user's version counter in the database that the cached
+        # state matches; None when unknown.
+        self.db_version: Optional[int] = None
+        self.verified = True
+        self.load_lock = threading.Lock()
+        self._phrases: Dict[str, CacheEntry] = {}
+        # Index position and normalized text of each phrase, so a re-put can
+        # move it between buckets after the phrase object was mutated in place.
+        self._indexed: Dict[str, Tuple[int, bool, str]] = {}
+        self._by_stage: Dict[int, Set[str]] = defaultdict(set)
+        self._active: Set[str] = set()
+        # Normalized texts of the cached phrases, counted since two phrases
+        # can share one.
+        self.texts: "Counter[str]" = Counter()
+        self._listeners: List[CacheListener] = []
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._phrases)
+
+    def _full(self, size: int) -> bool:
+        return self.max_entries is not None and size > self.max_entries
+
+    def _index(self, phrase: CacheEntry) -> None:
+        self._unindex(phrase.phrase_id)
+        text = normalize_text(phrase.text)
+        self._indexed[phrase.phrase_id] = (
+            phrase.leitner_stage,
+            phrase.leitner_current,
+            text,
+        )
+        self._by_stage[phrase.leitner_stage].add(phrase.phrase_id)
+        self.texts[text] += 1
+        if phrase.leitner_current:
+            self._active.add(phrase.phrase_id)
+
+    def _unindex(self, phrase_id: str) -> None:
+        position = self._indexed.pop(phrase_id, None)
+        if position is None:
+            return
+        stage, _, text = position
+        self._by_stage[stage].discard(phrase_id)
+        self._active.discard(phrase_id)
+        self.texts[text] -= 1
+        if not self.texts[text]:
+            del self.texts[text]
+
+    def subscribe(self, listener: CacheListener) -> None:
+        with self._lock:
+            self._listeners.append(listener)
+
+    # Runs once the lock is released, so listeners may hold locks of their own
+    # while they read the cache.
+    def _notify(self, changes: List[Tuple[str, Optional[CacheEntry]]]) -> None:
+        for listener in list(self._listeners):
+            for phrase_id, entry in changes:
+                try:
+                    listener(phrase_id, entry)
+                except Exception as e:
+                    logger.error(f"Phrase cache listener failed for {phrase_id}: {e}")
+
+    def _mark_oversized(self) -> None:
+        logger.warning(
+            f"Phrase cache exceeded {self.max_entries} entries, falling back to queries"
+        )
+        self.oversized = True
+        self.loaded = False
+        self._phrases.clear()
+        self._indexed.clear()
+        self._by_stage.clear()
+        self._active.clear()
+        self.texts.clear()
+        self.version += 1
+
+    def load(self, phrases: List[CacheEntry]) -> bool:
+        with self._lock:
+            if self.oversized or self._full(len(phrases)):
+                self._mark_oversized()
+                return False
+            # Phrases written while the load was in flight are newer than the
+            # fetched copies.
+            loaded = []
+            for phrase in phrases:
+                if phrase.phrase_id not in self._phrases:
+                    self._phrases[phrase.phrase_id] = phrase
+                    self._index(phrase)
+                    loaded.append((phrase.phrase_id, phrase))
+            self.loaded = True
+            self.version += 1
+        self._notify(loaded)
+        return True
+
+    def put(self, phrase: Phrase) -> None:
+        with self._lock:
+            if self.oversized:
+                return
+            if phrase.phrase_id not in self._phrases and self._full(
+                len(self._phrases) + 1
+            ):
+                self._mark_oversized()
+                return
+            if phrase.persisted and not phrase.has_changes:
+                entry = PhraseRecord.from_phrase(phrase)
+            else:
+                entry = phrase
+            self._phrases[phrase.phrase_id] = entry
+            self._index(phrase)
+            self.version += 1
+        self._notify([(phrase.phrase_id, entry)])
+
+    def remove(self, phrase_id: str) -> None:
+        with self._lock:
+            if self._phrases.pop(phrase_id, None) is None:
+                return
+            self._unindex(phrase_id)
+            self.version += 1
+        self._notify([(phrase_id, None)])
+
+    def _phrase(self, phrase_id: str) -> Phrase:
+        entry = self._phrases[phrase_id]
+        return entry.to_phrase() if isinstance(entry, PhraseRecord) else entry
+
+    def get(self, phrase_id: str) -> Optional[Phrase]:
+        with self._lock:
+            if phrase_id not in self._phrases:
+                return None
+            return self._phrase(phrase_id)
+
+    def bump_db_version(self) -> None:
+        with self._lock:
+            if self.db_version is not None:
+                self.db_version += 1
+
+    def export(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "version": self.version,
+                "db_version": self.db_version,
+                "phrases": [
+                    entry.to_dict()
+                    if isinstance(entry, PhraseRecord)
+                    else entry.stored_dump(exclude={"created_at", "updated_at"})
+                    for entry in self._phrases.values()
+                ],
+            }
+
+    def restore(self, state: Dict[str, Any]) -> None:
+        phrases = [PhraseRecord.from_dict(data) for data in state["phrases"]]
+        with self._lock:
+            self.db_version = state["db_version"]
+            self.verified = False
+        self.load(phrases)
+        with self._lock:
+            self.version = max(self.version, state["version"])
+
+    def _candidate_ids(
+        self, where_field: Optional[str], where_value: Any
+    ) -> Iterable[str]:
+        if where_field == "leitner_stage":
+            return list(self._by_stage.get(where_value, ()))
+        if where_field == "leitner_current" and where_value is True:
+            return list(self._active)
+        return list(self._phrases)
+
+    def _matching_ids(
+        self, where_field: Optional[str], where_value: Optional[Any]
+    ) -> List[str]:
+        phrase_ids = self._candidate_ids(where_field, where_value)
+        if not where_field or where_value is None:
+            return list(phrase_ids)
+        # Phrases mutated since their last put may sit in a stale bucket.
+        return [
+            phrase_id
+            for phrase_id in phrase_ids
+            if getattr(self._phrases[phrase_id], where_field) == where_value
+        ]
+
+    # With fields, the matches come back as read-only projections, like
+    # projected reads from the database, and the entries stay as they are.
+    def query(
+        self,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Phrase]:
+        with self._lock:
+            phrase_ids = self._matching_ids(where_field, where_value)
+            if fields:
+                return [
+                    project(self._phrases[phrase_id], fields)
+                    for phrase_id in phrase_ids
+                ]
+            return [self._phrase(phrase_id) for phrase_id in phrase_ids]
+
+    # The stored entries themselves, for read-only scans that shouldn't pay
+    # for a Phrase copy each.
+    def entries(
+        self, where_field: Optional[str] = None, where_value: Optional[Any] = None
+    ) -> List[CacheEntry]:
+        with self._lock:
+            return [
+                self._phrases[phrase_id]
+                for phrase_id in self._matching_ids(where_field, where_value)
+            ]
+
+    def count(
+        self, where_field: Optional[str] = None, where_value: Optional[Any] = None
+    ) -> int:
+        with self._lock:
+            return len(self._matching_ids(where_field, where_value))
+
+    def random(
+        self, where_field: Optional[str] = None, where_value: Optional[Any] = None
+    ) -> Optional[Phrase]:
+        with self._lock:
+            phrase_ids = self._matching_ids(where_field, where_value)
+            return self._phrase(random.choice(phrase_ids)) if phrase_ids else None
+
+
+class PhraseCacheRegistry:
+    def __init__(self, max_users: int = 100, max_phrases: int = 20000):
+        self.max_users = max_users
+        self.max_phrases = max_phrases
+        self._caches: "OrderedDict[str, UserPhraseCache]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, username: str) -> UserPhraseCache:
+        with self._lock:
+            cache = self._caches.get(username)
+            if cache is None:
+                cache = UserPhraseCache(max_entries=self.max_phrases)
+                self._caches[username] = cache
+                while len(self._caches) > self.max_users:
+                    evicted, _ = self._caches.popitem(last=False)
+                    logger.info(f"Evicted phrase cache of {evicted}")
+            else:
+                self._caches.move_to_end(username)
+            return cache
+
+    def peek(self, username: str) -> Optional[UserPhraseCache]:
+        return self._caches.get(username)
+
+    def refresh(self, username: str, phrases: Iterable[Phrase]) -> None:
+        cache = self.peek(username)
+        if cache is not None:
+            for phrase in phrases:
+                cache.put(phrase)
+
+    def bump_db_version(self, username: str) -> None:
+        cache = self.peek(username)
+        if cache is not None:
+            cache.bump_db_version()
+
+    # A database version other than the cached one means another process
+    # wrote since; the cache is verified again before its next use.
+    def check_version(self, username: str, version: Optional[int]) -> None:
+        cache = self.peek(username)
+        if (
+            cache is not None
+            and cache.loaded
+            and version is not None
+            and cache.db_version != version
+        ):
+            logger.info(
+                f"Phrase cache of {username} is behind ({cache.db_version} != {version})"
+            )
+            cache.verified = False
+
+    def drop(self, username: str) -> None:
+        with self._lock:
+            self._caches.pop(username, None)
+
+    def export(self) -> Dict[str, Dict[str, Any]]:
+        with self._lock:
+            caches = list(self._caches.items())
+        return {
+            username: cache.export()
+            for username, cache in caches
+            if cache.loaded and cache.db_version is not None
+        }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._caches.clear()
+
+
+phrase_caches = PhraseCacheRegistry(
+    max_users=int(os.getenv("PHRASE_CACHE_MAX_USERS", 100)),
+    max_phrases=int(os.getenv("PHRASE_CACHE_MAX_PHRASES", 20000)),
+)
@@ -0,0 +1,173 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Container, Dict, Iterable, List, Tuple
+
+from loguru import logger
+
+from utils.db_models import translate_batch_to_base_lang
+from utils.models import get_model
+from utils.text_utils import normalize_text
+
+
+def generate_phrase_texts(
+    language: str, level: str, num_phrases: int, model_name: str = "gpt-4o-mini"
+) -> List[str]:
+    logger.info(
+        f"Generating new phrases in {language} at level {level}, count: {num_phrases}"
+    )
+    system_instruction = f"""Generate {num_phrases} new phrases in {language} at level {level}. They should be max. 8 words long and cover common topics like work, food, or travel. Include a mix of questions, statements, and commands. Use vocabulary and grammar to match the {level} proficiency level. Respond in a json format {{"phrases": ["phrase1", "phrase2", ...]}}."""
+
+    model = get_model("openai")
+    try:
+        response = model.generate_response(
+            system_prompt=system_instruction,
+            user_prompt=None,
+            model_name=model_name,
+            response_format={"type": "json_object"},
+            raw_response=True,
+        )
+        phrases = json.loads(response)["phrases"]
+    except Exception as e:
+        logger.error(f"Error generating new phrases: {e}")
+        return []
+    return [phrase.strip() for phrase in phrases if isinstance(phrase, str)]
+
+
+# Generated and translated phrases shared by every user learning the same
+# language at the same level, so a refill doesn't wait on the LLM.
+class PhraseReservoir:
+    def __init__(
+        self,
+        min_size: int = 60,
+        batch_size: int = 30,
+        max_size: int = 300,
+        max_workers: int = 1,
+    ):
+        self.min_size = min_size
+        self.batch_size = batch_size
+        self.max_size = max_size
+        # Normalized text -> (text, translation) per (language, level), oldest
+        # first.
+        self._pools: Dict[Tuple[str, str], "OrderedDict[str, Tuple[str, str]]"] = {}
+        self._refills: Dict[Tuple[str, str], Future] = {}
+        self._forced_refills: Dict[Tuple[str, str], Future] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="phrase-reservoir"
+        )
+
+    def _pool(self, language: str, level: str) -> "OrderedDict[str, Tuple[str, str]]":
+        return self._pools.setdefault((language, level), OrderedDict())
+
+    def size(self, language: str, level: str) -> int:
+        with self._lock:
+            return len(self._pools.get((language, level), ()))
+
+    def add(self, language: str, level: str, entries: Iterable[Tuple[str, str]]) -> int:
+        added = 0
+        with self._lock:
+            pool = self._pool(language, level)
+            for text, translation in entries:
+                key = normalize_text(text)
+                if key and key not in pool:
+                    pool[key] = (text, translation)
+                    added += 1
+            while len(pool) > self.max_size:
+                pool.popitem(last=False)
+        return added
+
+    # Hands out up to count phrases, skipping texts in exclude (normalized)
+    # so they stay available to other users. exclude is only probed, so a
+    # user's cached text set can be passed without copying it.
+    def take(
+        self, language: str, level: str, count: int, exclude: Container[str] = ()
+    ) -> List[Tuple[str, str]]:
+        taken = []
+        with self._lock:
+            pool = self._pool(language, level)
+            for key in list(pool):
+                if len(taken) >= count:
+                    break
+                if key not in exclude:
+                    taken.append(pool.pop(key))
+        self.warm(language, level)
+        return taken
+
+    def warm(self, language: str, level: str) -> None:
+        if self.size(language, level) < self.min_size:
+            self.request_refill(language, level)
+
+    def refill(self, language: str, level: str) -> int:
+        texts = generate_phrase_texts(language, level, self.batch_size)
+        with self._lock:
+            pool = self._pool(language, level)
+            fresh: Dict[str, str] = {}
+            for text in texts:
+                key = normalize_text(text)
+                if key and key not in pool:
+                    fresh.setdefault(key, text)
+        if not fresh:
+            return 0
+        texts = list(fresh.values())
+        translations = translate_batch_to_base_lang(texts)
+        added = self.add(
+            language,
+            level,
+            [
+                (text, translation)
+                for text, translation in zip(texts, translations)
+                if translation
+            ],
+        )
+        logger.info(
+            f"Added {added} phrases to the {language}/{level} reservoir, "
+            f"size: {self.size(language, level)}"
+        )
+        return added
+
+    # A forced refill generates one batch whatever the pool size, for a user
+    # who already has every phrase the pool holds.
+    def request_refill(self, language: str, level: str, force: bool = False) -> Future:
+        refills = self._forced_refills if force else self._refills
+        with self._lock:
+            refill = refills.get((language, level))
+            if refill is None or refill.done():
+                refill = self._executor.submit(self._run_refill, language, level, force)
+                refills[(language, level)] = refill
+            return refill
+
+    def _run_refill(self, language: str, level: str, force: bool = False) -> None:
+        try:
+            if force:
+                self.refill(language, level)
+            while self.size(language, level) < self.min_size:
+                if not self.refill(language, level):
+                    break
+        except Exception as e:
+            logger.error(f"Failed to refill the {language}/{level} reservoir: {e}")
+
+    def export(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [
+                {"language": language, "level": level, "phrases": list(pool.values())}
+                for (language, level), pool in self._pools.items()
+                if pool
+            ]
+
+    def load(self, pools: List[Dict[str, Any]]) -> None:
+        for pool in pools:
+            self.add(pool["language"], pool["level"], pool["phrases"])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._pools.clear()
+
+
+phrase_reservoir = PhraseReservoir(
+    min_size=int(os.getenv("PHRASE_RESERVOIR_MIN_SIZE", 60)),
+    batch_size=int(os.getenv("PHRASE_RESERVOIR_BATCH_SIZE", 30)),
+    max_size=int(os.getenv("PHRASE_RESERVOIR_MAX_SIZE", 300)),
+)
@@ -0,0 +1,106 @@
+import os
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils import db
+from utils.db_models import Phrase
+from utils.phrase_cache import phrase_caches
+from utils.stage_summary import StageSummary, store_summary
+from utils.storage import StorageBackend
+
+SYNC_MODES = ("off", "listener")
+
+
+class PhraseSync:
+    def __init__(self, db_client: StorageBackend):
+        self.db_client = db_client
+        self._watches: Dict[str, Callable[[], None]] = {}
+        self._initialized: Dict[str, bool] = {}
+        self._lock = threading.Lock()
+
+    def watch(self, username: str) -> None:
+        with self._lock:
+            if username in self._watches:
+                return
+            logger.info(f"Subscribing to phrase changes of {username}")
+            unsubscribe = self.db_client.watch(
+                username,
+                lambda documents, changes: self.on_phrases_snapshot(
+                    username, documents, changes
+                ),
+                lambda data: self.on_summary_snapshot(username, data),
+            )
+            if unsubscribe is None:
+                logger.warning(
+                    f"{type(self.db_client).__name__} has no snapshot listeners"
+                )
+                return
+            self._watches[username] = unsubscribe
+
+    def on_phrases_snapshot(
+        self,
+        username: str,
+        documents: List[Dict[str, Any]],
+        changes: List[Tuple[str, Dict[str, Any]]],
+    ) -> None:
+        try:
+            cache = phrase_caches.get(username)
+            # The first snapshot holds the whole collection.
+            if not self._initialized.get(username):
+                self._initialized[username] = True
+                if not cache.loaded:
+                    cache.load(
+                        db.load_phrase_entries(username, documents, self.db_client)
+                    )
+                    logger.info(
+                        f"Loaded {len(cache)} phrases of {username} from snapshot"
+                    )
+                    return
+
+            for kind, document in changes:
+                if kind == "REMOVED":
+                    cache.remove(document["phrase_id"])
+                    continue
+                phrase = cache.get(document["phrase_id"])
+                if phrase is None:
+                    phrase = db.load_record(username, Phrase, document, self.db_client)
+                else:
+                    phrase.apply_remote(document)
+                cache.put(phrase)
+            logger.debug(f"Applied {len(changes)} phrase changes for {username}")
+        except Exception as e:
+            logger.error(f"Failed to apply phrase snapshot for {username}: {e}")
+
+    def on_summary_snapshot(
+        self, username: str, data: Optional[Dict[str, Any]]
+    ) -> None:
+        if data and "reconciled_at" in data:
+            store_summary(username, StageSummary.from_dict(data))
+
+    def close(self) -> None:
+        with self._lock:
+            for username, unsubscribe in self._watches.items():
+                logger.info(f"Unsubscribing from phrase changes of {username}")
+                unsubscribe()
+            self._watches.clear()
+            self._initialized.clear()
+
+
+_phrase_sync: Optional[PhraseSync] = None
+_phrase_sync_lock = threading.Lock()
+
+
+def get_phrase_sync(db_client: StorageBackend) -> Optional[PhraseSync]:
+    global _phrase_sync
+    mode = os.getenv("PHRASE_SYNC_MODE", "off")
+    if mode not in SYNC_MODES:
+        raise ValueError(f"Unknown phrase sync mode: {mode}")
+    if mode == "off":
+        return None
+    if _phrase_sync is None:
+        with _phrase_sync_lock:
+            if _phrase_sync is None:
+                _phrase_sync = PhraseSync(db_client)
+    return _phrase_sync
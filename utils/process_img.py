@@ -1,10 +1,7 @@
-import openai
-import os
 import base64
 import logging
 
-API_KEY = os.getenv("OPENAI_API_KEY")
-openai.api_key = API_KEY
+from utils.models import get_model
 
 
 def encode_img(image_path):
@@ -34,7 +31,7 @@ def process_img(file, language):
     Be exhaustive (do not skip any phrases) and do not add any extra phrases that are not in the image."""
 
     try:
-        client = openai.OpenAI()
+        client = get_model("openai").client
         logging.info("Sending request to OpenAI API")
         # Send the image and prompt to the OpenAI API
         response = client.chat.completions.create(
@@ -0,0 +1,174 @@
+import atexit
+import os
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.db import update_progress, update_progress_batch
+from utils.db_models import Phrase
+from utils.phrase_cache import phrase_caches
+
+WRITE_MODES = ("sync", "buffered")
+
+
+class ProgressWriter:
+    def __init__(
+        self,
+        mode: str = "buffered",
+        flush_interval: float = 5.0,
+        max_pending: int = 50,
+        max_attempts: int = 5,
+    ):
+        if mode not in WRITE_MODES:
+            raise ValueError(f"Unknown progress write mode: {mode}")
+        self.mode = mode
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self._pending: "OrderedDict[Tuple[str, str], Tuple[Phrase, Any]]" = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        # Failed writes per pending phrase, touched only under the flush lock.
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def record(self, username: str, phrase: Phrase, db_client: Any) -> None:
+        if self.mode == "sync":
+            update_progress(username, phrase, db_client)
+            return
+
+        # Cached stage and active indexes follow the phrase right away rather
+        # than after the flush.
+        phrase_caches.refresh(username, [phrase])
+        with self._lock:
+            # Repeated updates to one phrase collapse into a single write of
+            # its latest state.
+            self._pending[(username, phrase.phrase_id)] = (phrase, db_client)
+            pending = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="progress-writer", daemon=True
+                )
+                self._thread.start()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._stopped.is_set():
+            self._wake.wait(timeout=self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"Progress flush failed: {e}")
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                entries = list(self._pending.items())
+                self._pending.clear()
+            if not entries:
+                return 0
+
+            by_user: Dict[str, List[Phrase]] = defaultdict(list)
+            db_clients: Dict[str, Any] = {}
+            for (username, _), (phrase, db_client) in entries:
+                by_user[username].append(phrase)
+                db_clients[username] = db_client
+
+            written = 0
+            for username, phrases in by_user.items():
+                db_client = db_clients[username]
+                failed = self._write(username, phrases, db_client)
+                # A phrase on its last attempt is written on its own, so one
+                # bad document can't keep failing the batch around it.
+                if len(failed) > 1 and any(
+                    self._attempts.get((username, phrase.phrase_id), 0) + 1
+                    >= self.max_attempts
+                    for phrase in failed
+                ):
+                    failed = [
+                        phrase
+                        for phrase in failed
+                        if self._write(username, [phrase], db_client)
+                    ]
+                failed_ids = {phrase.phrase_id for phrase in failed}
+                for phrase in phrases:
+                    if phrase.phrase_id in failed_ids:
+                        self._retry(username, phrase, db_client)
+                    else:
+                        self._attempts.pop((username, phrase.phrase_id), None)
+                        written += 1
+
+            logger.info(f"Flushed {written}/{len(entries)} progress updates")
+            return written
+
+    # Returns the phrases whose write failed.
+    def _write(
+        self, username: str, phrases: List[Phrase], db_client: Any
+    ) -> List[Phrase]:
+        try:
+            outcomes = update_progress_batch(username, phrases, db_client)
+        except Exception as e:
+            logger.error(f"Failed to flush progress for {username}: {e}")
+            outcomes = [False] * len(phrases)
+        return [
+            phrase for phrase, written_ok in zip(phrases, outcomes) if not written_ok
+        ]
+
+    def _retry(self, username: str, phrase: Phrase, db_client: Any) -> None:
+        key = (username, phrase.phrase_id)
+        attempts = self._attempts.pop(key, 0) + 1
+        if attempts >= self.max_attempts:
+            logger.error(
+                f"Dropping progress of phrase {phrase.phrase_id} for {username} "
+                f"after {attempts} failed writes"
+            )
+            return
+        self._attempts[key] = attempts
+        self._requeue(username, phrase, db_client)
+
+    def _requeue(self, username: str, phrase: Phrase, db_client: Any) -> None:
+        with self._lock:
+            pending = self._pending.get((username, phrase.phrase_id))
+            if pending is None:
+                self._pending[(username, phrase.phrase_id)] = (phrase, db_client)
+            elif pending[0] is not phrase:
+                # A newer copy was recorded meanwhile; its write carries the
+                # failed changes as well.
+                pending[0].merge_changes(phrase.pop_changes())
+
+    def close(self) -> None:
+        logger.info(f"Closing progress writer with {self.pending} pending updates")
+        self._stopped.set()
+        self._wake.set()
+        self.flush()
+
+
+_progress_writer: Optional[ProgressWriter] = None
+_progress_writer_lock = threading.Lock()
+
+
+def get_progress_writer() -> ProgressWriter:
+    global _progress_writer
+    if _progress_writer is None:
+        with _progress_writer_lock:
+            if _progress_writer is None:
+                _progress_writer = ProgressWriter(
+                    mode=os.getenv("PROGRESS_WRITE_MODE", "buffered"),
+                    flush_interval=float(os.getenv("PROGRESS_FLUSH_INTERVAL", 5.0)),
+                    max_pending=int(os.getenv("PROGRESS_FLUSH_MAX_PENDING", 50)),
+                    max_attempts=int(os.getenv("PROGRESS_FLUSH_MAX_ATTEMPTS", 5)),
+                )
+                atexit.register(_progress_writer.close)
+    return _progress_writer
@@ -14,7 +14,7 @@ def generate_report(leitnerobject) -> None:
     stage_texts = [[], [], [], []]
     stage_colors = [[], [], [], []]
 
-    for phrase in leitnerobject.active_phrases:
+    for phrase in leitnerobject.get_report_phrases():
         stage_index = phrase.leitner_stage - 1
         stage_texts[stage_index].append(phrase.text)
         if phrase.mistakes > 0:
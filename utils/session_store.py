@@ -0,0 +1,184 @@
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Any, Hashable, List, Optional, Tuple
+
+from loguru import logger
+
+from utils.sqlite_utils import connect_sqlite
+
+
+class SessionStore(ABC):
+    def __init__(self, ttl_seconds: float = 86400, max_entries: int = 10000):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+
+    @abstractmethod
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        pass
+
+    @abstractmethod
+    def set(
+        self, namespace: str, key: Hashable, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def delete(self, namespace: str, key: Hashable) -> None:
+        pass
+
+    # Durable stores survive restarts on their own and export nothing.
+    def export_entries(self) -> List[Tuple[str, str, float, Any]]:
+        return []
+
+    def import_entries(self, entries: List[Tuple[str, str, float, Any]]) -> None:
+        pass
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(self, ttl_seconds: float = 86400, max_entries: int = 10000):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self._entries: "OrderedDict[Tuple[str, str], Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        entry_key = (namespace, str(key))
+        with self._lock:
+            entry = self._entries.get(entry_key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[entry_key]
+                return default
+            self._entries.move_to_end(entry_key)
+            return value
+
+    def set(
+        self, namespace: str, key: Hashable, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        entry_key = (namespace, str(key))
+        expires_at = time.time() + (ttl or self.ttl_seconds)
+        with self._lock:
+            self._entries[entry_key] = (expires_at, value)
+            self._entries.move_to_end(entry_key)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                logger.debug(f"Evicted session entry {evicted}")
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        with self._lock:
+            self._entries.pop((namespace, str(key)), None)
+
+    def export_entries(self) -> List[Tuple[str, str, float, Any]]:
+        now = time.time()
+        with self._lock:
+            return [
+                (namespace, key, expires_at, value)
+                for (namespace, key), (expires_at, value) in self._entries.items()
+                if expires_at >= now
+            ]
+
+    def import_entries(self, entries: List[Tuple[str, str, float, Any]]) -> None:
+        now = time.time()
+        with self._lock:
+            for namespace, key, expires_at, value in entries:
+                if expires_at >= now:
+                    self._entries[(namespace, key)] = (expires_at, value)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class SqliteSessionStore(SessionStore):
+    def __init__(
+        self,
+        path: str = "data/sessions.db",
+        ttl_seconds: float = 86400,
+        max_entries: int = 10000,
+    ):
+        super().__init__(ttl_seconds=ttl_seconds, max_entries=max_entries)
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "namespace TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+            "expires_at REAL NOT NULL, accessed_at REAL NOT NULL, "
+            "PRIMARY KEY (namespace, key))"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_sessions_accessed_at "
+            "ON sessions (accessed_at)"
+        )
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    def get(self, namespace: str, key: Hashable, default: Any = None) -> Any:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM sessions "
+                "WHERE namespace = ? AND key = ? AND expires_at >= ?",
+                (namespace, str(key), now),
+            ).fetchone()
+            if row is None:
+                return default
+            self._conn.execute(
+                "UPDATE sessions SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, namespace, str(key)),
+            )
+        return json.loads(row[0])
+
+    def set(
+        self, namespace: str, key: Hashable, value: Any, ttl: Optional[float] = None
+    ) -> None:
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions "
+                "(namespace, key, value, expires_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (
+                    namespace,
+                    str(key),
+                    json.dumps(value),
+                    now + (ttl or self.ttl_seconds),
+                    now,
+                ),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict(now)
+
+    def delete(self, namespace: str, key: Hashable) -> None:
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM sessions WHERE namespace = ? AND key = ?",
+                (namespace, str(key)),
+            )
+
+    def _evict(self, now: float) -> None:
+        self._conn.execute("DELETE FROM sessions WHERE expires_at < ?", (now,))
+        self._conn.execute(
+            "DELETE FROM sessions WHERE rowid NOT IN ("
+            "SELECT rowid FROM sessions ORDER BY accessed_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+
+def get_session_store() -> SessionStore:
+    backend = os.getenv("SESSION_STORE_BACKEND", "memory")
+    ttl_seconds = float(os.getenv("SESSION_TTL", 86400))
+    max_entries = int(os.getenv("SESSION_MAX_ENTRIES", 10000))
+    logger.info(f"Using {backend} session store")
+    if backend == "memory":
+        return MemorySessionStore(ttl_seconds=ttl_seconds, max_entries=max_entries)
+    elif backend == "sqlite":
+        return SqliteSessionStore(
+            path=os.getenv("SESSION_STORE_PATH", "data/sessions.db"),
+            ttl_seconds=ttl_seconds,
+            max_entries=max_entries,
+        )
+    else:
+        raise ValueError(f"Unknown session store backend: {backend}")
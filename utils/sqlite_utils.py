@@ -0,0 +1,19 @@
+import os
+import sqlite3
+
+from loguru import logger
+
+
+def connect_sqlite(path: str, timeout: float = 5.0) -> sqlite3.Connection:
+    logger.info(f"Opening SQLite database: {path}")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(
+        path, timeout=timeout, check_same_thread=False, isolation_level=None
+    )
+    # WAL lets several processes read while one writes.
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(timeout * 1000)}")
+    return conn
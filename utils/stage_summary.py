@@ -0,0 +1,133 @@
+import os
+import threading
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from firebase_admin import firestore
+
+LEITNER_STAGES = range(0, 6)
+SUMMARY_COLLECTION_NAME = "summaries"
+SUMMARY_DOCUMENT_ID = "stages"
+# Seconds a worker serves its cached summary before re-reading the document,
+# which picks up writes made by other workers.
+SUMMARY_MAX_AGE = float(os.getenv("STAGE_SUMMARY_MAX_AGE", 60))
+
+
+class StageSummary:
+    def __init__(
+        self,
+        total: int = 0,
+        stages: Optional[List[int]] = None,
+        active: int = 0,
+        version: Optional[int] = None,
+    ):
+        self.total = total
+        self.stages = list(stages) if stages else [0 for _ in LEITNER_STAGES]
+        self.active = active
+        # The user's version counter the counts belong to; None when unknown.
+        self.version = version
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "StageSummary":
+        return cls(
+            total=data.get("total", 0),
+            stages=[data.get(f"stage_{stage}", 0) for stage in LEITNER_STAGES],
+            active=data.get("active", 0),
+            version=data.get("version"),
+        )
+
+    # Count for a phrase filter the summary answers; None for other filters.
+    def count(self, where_field: Optional[str], where_value: Any) -> Optional[int]:
+        if not where_field or where_value is None:
+            return self.total
+        if where_field == "leitner_stage" and where_value in LEITNER_STAGES:
+            return self.stages[where_value]
+        if where_field == "leitner_current" and where_value is True:
+            return self.active
+        return None
+
+    def to_dict(self) -> Dict[str, int]:
+        data = {"total": self.total, "active": self.active}
+        for stage in LEITNER_STAGES:
+            data[f"stage_{stage}"] = self.stages[stage]
+        return data
+
+    # Every write bumps the version once, whether or not it moved a phrase.
+    def apply(self, delta: Dict[str, int]) -> None:
+        self.total += delta.get("total", 0)
+        self.active += delta.get("active", 0)
+        for stage in LEITNER_STAGES:
+            self.stages[stage] += delta.get(f"stage_{stage}", 0)
+        if self.version is not None:
+            self.version += 1
+
+    def __repr__(self) -> str:
+        return f"StageSummary({self.to_dict()})"
+
+
+def stage_delta(
+    old_stage: Optional[int], old_active: bool, new_stage: int, new_active: bool
+) -> Dict[str, int]:
+    delta = defaultdict(int)
+    if old_stage is None:
+        delta["total"] += 1
+        delta[f"stage_{new_stage}"] += 1
+        delta["active"] += int(new_active)
+    else:
+        if old_stage != new_stage:
+            delta[f"stage_{old_stage}"] -= 1
+            delta[f"stage_{new_stage}"] += 1
+        if old_active != new_active:
+            delta["active"] += 1 if new_active else -1
+    return {key: value for key, value in delta.items() if value}
+
+
+def phrase_write_delta(
+    phrase: Any, changes: Dict[str, Tuple[Any, Any]], inserted: bool
+) -> Dict[str, int]:
+    if inserted:
+        return stage_delta(None, False, phrase.leitner_stage, phrase.leitner_current)
+    old_stage = changes.get("leitner_stage", (phrase.leitner_stage,))[0]
+    old_active = changes.get("leitner_current", (phrase.leitner_current,))[0]
+    return stage_delta(
+        old_stage, old_active, phrase.leitner_stage, phrase.leitner_current
+    )
+
+
+def merge_deltas(deltas: List[Dict[str, int]]) -> Dict[str, int]:
+    merged = defaultdict(int)
+    for delta in deltas:
+        for key, value in delta.items():
+            merged[key] += value
+    return {key: value for key, value in merged.items() if value}
+
+
+def summary_increments(delta: Dict[str, int]) -> Dict[str, Any]:
+    return {key: firestore.Increment(value) for key, value in delta.items()}
+
+
+# Username -> (summary, monotonic time it was read or counted).
+_summaries: Dict[str, Tuple[StageSummary, float]] = {}
+_summaries_lock = threading.Lock()
+
+
+def cached_summary(
+    username: str, max_age: float = SUMMARY_MAX_AGE
+) -> Optional[StageSummary]:
+    entry = _summaries.get(username)
+    if entry is None or time.monotonic() - entry[1] >= max_age:
+        return None
+    return entry[0]
+
+
+def store_summary(username: str, summary: StageSummary) -> None:
+    with _summaries_lock:
+        _summaries[username] = (summary, time.monotonic())
+
+
+def apply_summary_delta(username: str, delta: Dict[str, int]) -> None:
+    with _summaries_lock:
+        entry = _summaries.get(username)
+        if entry is not None:
+            entry[0].apply(delta)
@@ -0,0 +1,561 @@
+import json
+import random
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from firebase_admin import firestore
+from loguru import logger
+
+from utils.sqlite_utils import connect_sqlite
+
+# Documents are plain dicts keyed by phrase_id; user documents live under
+# collection_name None, matching how utils.db addresses Firestore.
+#
+# Every write also applies a stage summary delta and bumps the user's version
+# in the same transaction, so the summary document never drifts from the
+# phrases and a restored warm state can tell whether it is still current.
+
+# Field name -> (value before, value after) for each changed field.
+Changes = Dict[str, Tuple[Any, Any]]
+# Called with all documents and (change type, document) pairs on each
+# snapshot; change types are ADDED, MODIFIED and REMOVED.
+PhrasesListener = Callable[
+    [List[Dict[str, Any]], List[Tuple[str, Dict[str, Any]]]], None
+]
+SummaryListener = Callable[[Optional[Dict[str, Any]]], None]
+
+
+class StorageError(Exception):
+    pass
+
+
+class StorageBackend(ABC):
+    # Most documents written in one transaction; None means no limit.
+    max_batch_size: Optional[int] = None
+
+    @abstractmethod
+    def add_records(
+        self,
+        username: str,
+        collection_name: str,
+        documents: List[Dict[str, Any]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def update_records(
+        self,
+        username: str,
+        collection_name: str,
+        updates: List[Tuple[str, Changes]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        pass
+
+    @abstractmethod
+    def get_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        pass
+
+    # Yields documents page by page, so bulk work holds one page at a time.
+    @abstractmethod
+    def stream_records(
+        self,
+        username: str,
+        collection_name: str,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        fields: Optional[List[str]] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def count_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> int:
+        pass
+
+    @abstractmethod
+    def get_random_record(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def set_user(self, username: str, document: Dict[str, Any]) -> None:
+        pass
+
+    def get_users(self, usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+        users = {}
+        for username in usernames:
+            documents = self.get_records(username)
+            if documents:
+                users[username] = documents[0]
+        return users
+
+    # The stage summary document, holding the stage counters, the version and,
+    # once counted in full, reconciled_at; None if it doesn't exist yet.
+    @abstractmethod
+    def get_summary(self, username: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def set_summary(self, username: str, data: Dict[str, Any]) -> None:
+        pass
+
+    # Subscribes to changes of the user's phrases and summary; returns a
+    # function that unsubscribes, or None if the backend can't notify.
+    def watch(
+        self,
+        username: str,
+        on_phrases: PhrasesListener,
+        on_summary: SummaryListener,
+    ) -> Optional[Callable[[], None]]:
+        return None
+
+
+def matches(document: Dict[str, Any], where_field: Optional[str], where_value: Any):
+    return (
+        not where_field
+        or where_value is None
+        or document.get(where_field) == where_value
+    )
+
+
+def project(document: Dict[str, Any], fields: Optional[List[str]]) -> Dict[str, Any]:
+    if not fields:
+        return document
+    return {
+        name: value
+        for name, value in document.items()
+        if name in fields or name == "phrase_id"
+    }
+
+
+# Local documents store the write time where Firestore would fill it in.
+def local_document(document: Dict[str, Any]) -> Dict[str, Any]:
+    now = datetime.now(timezone.utc).isoformat()
+    return {
+        name: now if value is firestore.SERVER_TIMESTAMP else value
+        for name, value in document.items()
+    }
+
+
+def changed_fields(changes: Changes) -> Dict[str, Any]:
+    return local_document(
+        {
+            **{name: value for name, (_, value) in changes.items()},
+            "updated_at": firestore.SERVER_TIMESTAMP,
+        }
+    )
+
+
+def bump_summary(
+    summary: Optional[Dict[str, Any]], delta: Optional[Dict[str, int]]
+) -> Dict[str, Any]:
+    summary = dict(summary or {})
+    for key, value in (delta or {}).items():
+        summary[key] = summary.get(key, 0) + value
+    summary["version"] = summary.get("version", 0) + 1
+    return summary
+
+
+class MemoryBackend(StorageBackend):
+    def __init__(self):
+        self._collections: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
+        self._users: Dict[str, Dict[str, Any]] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def add_records(
+        self,
+        username: str,
+        collection_name: str,
+        documents: List[Dict[str, Any]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        with self._lock:
+            collection = self._collections.setdefault((username, collection_name), {})
+            for document in documents:
+                collection[document["phrase_id"]] = local_document(document)
+            self._summaries[username] = bump_summary(
+                self._summaries.get(username), delta
+            )
+
+    def update_records(
+        self,
+        username: str,
+        collection_name: str,
+        updates: List[Tuple[str, Changes]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        with self._lock:
+            collection = self._collections.setdefault((username, collection_name), {})
+            for phrase_id, changes in updates:
+                if phrase_id not in collection:
+                    raise StorageError(f"No document {phrase_id} in {collection_name}")
+            for phrase_id, changes in updates:
+                collection[phrase_id].update(changed_fields(changes))
+            self._summaries[username] = bump_summary(
+                self._summaries.get(username), delta
+            )
+
+    def get_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            if not collection_name:
+                user = self._users.get(username)
+                return [dict(user)] if user is not None else []
+            collection = self._collections.get((username, collection_name), {})
+            documents = [
+                dict(project(document, fields))
+                for document in collection.values()
+                if matches(document, where_field, where_value)
+            ]
+        return documents[:limit] if limit else documents
+
+    def stream_records(
+        self,
+        username: str,
+        collection_name: str,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        fields: Optional[List[str]] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            phrase_ids = list(self._collections.get((username, collection_name), {}))
+        for start in range(0, len(phrase_ids), page_size):
+            with self._lock:
+                collection = self._collections.get((username, collection_name), {})
+                page = [
+                    dict(project(collection[phrase_id], fields))
+                    for phrase_id in phrase_ids[start : start + page_size]
+                    if phrase_id in collection
+                    and matches(collection[phrase_id], where_field, where_value)
+                ]
+            yield from page
+
+    def count_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> int:
+        return len(
+            self.get_records(username, collection_name, where_field, where_value)
+        )
+
+    def get_random_record(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> Optional[Dict[str, Any]]:
+        documents = self.get_records(
+            username, collection_name, where_field, where_value
+        )
+        return random.choice(documents) if documents else None
+
+    def set_user(self, username: str, document: Dict[str, Any]) -> None:
+        with self._lock:
+            self._users[username] = local_document(document)
+
+    def get_summary(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            summary = self._summaries.get(username)
+            return dict(summary) if summary is not None else None
+
+    def set_summary(self, username: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._summaries.setdefault(username, {}).update(local_document(data))
+
+
+class SqliteBackend(StorageBackend):
+    # Fields stored in their own indexed columns; other filters go through
+    # json_extract on the document.
+    INDEXED_FIELDS = ("leitner_stage", "leitner_current")
+
+    def __init__(self, path: str = "data/phrases.db"):
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS documents ("
+            "username TEXT NOT NULL, collection TEXT NOT NULL, "
+            "phrase_id TEXT NOT NULL, leitner_stage INTEGER, "
+            "leitner_current INTEGER, random_key REAL, data TEXT NOT NULL, "
+            "PRIMARY KEY (username, collection, phrase_id))"
+        )
+        for field in self.INDEXED_FIELDS + ("random_key",):
+            self._conn.execute(
+                f"CREATE INDEX IF NOT EXISTS idx_documents_{field} "
+                f"ON documents (username, collection, {field})"
+            )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS users ("
+            "username TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS summaries ("
+            "username TEXT PRIMARY KEY, data TEXT NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _row(username: str, collection_name: str, document: Dict[str, Any]) -> tuple:
+        return (
+            username,
+            collection_name,
+            document["phrase_id"],
+            document.get("leitner_stage"),
+            document.get("leitner_current"),
+            document.get("random_key"),
+            json.dumps(document, default=str),
+        )
+
+    def _where(
+        self,
+        username: str,
+        collection_name: str,
+        where_field: Optional[str],
+        where_value: Any,
+    ) -> Tuple[str, list]:
+        clause = "username = ? AND collection = ?"
+        params = [username, collection_name]
+        if where_field and where_value is not None:
+            if where_field in self.INDEXED_FIELDS:
+                clause += f" AND {where_field} = ?"
+            else:
+                clause += " AND json_extract(data, ?) = ?"
+                params.append(f"$.{where_field}")
+            params.append(where_value)
+        return clause, params
+
+    def _read_summary(self, username: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT data FROM summaries WHERE username = ?", (username,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _write_summary(self, username: str, summary: Dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO summaries (username, data) VALUES (?, ?)",
+            (username, json.dumps(summary, default=str)),
+        )
+
+    def _write_documents(
+        self,
+        username: str,
+        collection_name: str,
+        documents: List[Dict[str, Any]],
+        delta: Optional[Dict[str, int]],
+    ) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO documents (username, collection, "
+            "phrase_id, leitner_stage, leitner_current, random_key, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [self._row(username, collection_name, document) for document in documents],
+        )
+        self._write_summary(username, bump_summary(self._read_summary(username), delta))
+
+    def add_records(
+        self,
+        username: str,
+        collection_name: str,
+        documents: List[Dict[str, Any]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        documents = [local_document(document) for document in documents]
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._write_documents(username, collection_name, documents, delta)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def update_records(
+        self,
+        username: str,
+        collection_name: str,
+        updates: List[Tuple[str, Changes]],
+        delta: Optional[Dict[str, int]] = None,
+    ) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                documents = []
+                for phrase_id, changes in updates:
+                    row = self._conn.execute(
+                        "SELECT data FROM documents "
+                        "WHERE username = ? AND collection = ? AND phrase_id = ?",
+                        (username, collection_name, phrase_id),
+                    ).fetchone()
+                    if row is None:
+                        raise StorageError(
+                            f"No document {phrase_id} in {collection_name}"
+                        )
+                    document = json.loads(row[0])
+                    document.update(changed_fields(changes))
+                    documents.append(document)
+                self._write_documents(username, collection_name, documents, delta)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def get_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        limit: Optional[int] = None,
+        fields: Optional[List[str]] = None,
+    ) -> List[Dict[str, Any]]:
+        with self._lock:
+            if not collection_name:
+                row = self._conn.execute(
+                    "SELECT data FROM users WHERE username = ?", (username,)
+                ).fetchone()
+                return [json.loads(row[0])] if row else []
+            clause, params = self._where(
+                username, collection_name, where_field, where_value
+            )
+            query = f"SELECT data FROM documents WHERE {clause}"
+            if limit:
+                query += " LIMIT ?"
+                params.append(limit)
+            rows = self._conn.execute(query, params).fetchall()
+        return [project(json.loads(row[0]), fields) for row in rows]
+
+    # Keyset pagination on the primary key, so each page is an index seek.
+    def stream_records(
+        self,
+        username: str,
+        collection_name: str,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+        fields: Optional[List[str]] = None,
+        page_size: int = 500,
+    ) -> Iterator[Dict[str, Any]]:
+        clause, params = self._where(
+            username, collection_name, where_field, where_value
+        )
+        query = (
+            f"SELECT phrase_id, data FROM documents WHERE {clause} "
+            "AND phrase_id > ? ORDER BY phrase_id LIMIT ?"
+        )
+        last_id = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    query, params + [last_id, page_size]
+                ).fetchall()
+            for _, data in rows:
+                yield project(json.loads(data), fields)
+            if len(rows) < page_size:
+                return
+            last_id = rows[-1][0]
+
+    def count_records(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> int:
+        if not collection_name:
+            return len(self.get_records(username))
+        clause, params = self._where(
+            username, collection_name, where_field, where_value
+        )
+        with self._lock:
+            return self._conn.execute(
+                f"SELECT COUNT(*) FROM documents WHERE {clause}", params
+            ).fetchone()[0]
+
+    def get_random_record(
+        self,
+        username: str,
+        collection_name: Optional[str] = None,
+        where_field: Optional[str] = None,
+        where_value: Optional[Any] = None,
+    ) -> Optional[Dict[str, Any]]:
+        if not collection_name:
+            records = self.get_records(username)
+            return records[0] if records else None
+        clause, params = self._where(
+            username, collection_name, where_field, where_value
+        )
+        query = (
+            f"SELECT data FROM documents WHERE {clause} AND random_key >= ? "
+            "ORDER BY random_key LIMIT 1"
+        )
+        with self._lock:
+            row = self._conn.execute(query, params + [random.random()]).fetchone()
+            if row is None:
+                # Wrap around to the smallest key, as the Firestore backend does.
+                row = self._conn.execute(query, params + [0]).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set_user(self, username: str, document: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO users (username, data) VALUES (?, ?)",
+                (username, json.dumps(local_document(document), default=str)),
+            )
+
+    def get_summary(self, username: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._read_summary(username)
+
+    def set_summary(self, username: str, data: Dict[str, Any]) -> None:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                summary = self._read_summary(username) or {}
+                summary.update(local_document(data))
+                self._write_summary(username, summary)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+
+def get_storage_backend(backend: str, path: str = "data/phrases.db") -> StorageBackend:
+    logger.info(f"Using {backend} storage backend")
+    if backend == "memory":
+        return MemoryBackend()
+    elif backend == "sqlite":
+        return SqliteBackend(path=path)
+    else:
+        raise ValueError(f"Unknown storage backend: {backend}")
@@ -0,0 +1,9 @@
+import re
+import unicodedata
+
+
+# One form per phrase text, shared by every cache and duplicate check, so
+# they agree on which texts are the same.
+def normalize_text(text: str) -> str:
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
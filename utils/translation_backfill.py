@@ -0,0 +1,154 @@
+import os
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+from utils import db
+from utils.db_models import Phrase, translate_batch_to_base_lang
+from utils.phrase_cache import phrase_caches
+
+
+class TranslationBackfill:
+    def __init__(
+        self, batch_size: int = 20, interval: float = 5.0, max_backoff: float = 600.0
+    ):
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self._pending: "OrderedDict[Tuple[str, str], Tuple[Phrase, Any]]" = (
+            OrderedDict()
+        )
+        # Failed attempts and earliest retry time of phrases queued again.
+        self._attempts: Dict[Tuple[str, str], int] = {}
+        self._retry_at: Dict[Tuple[str, str], float] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def enqueue(self, username: str, phrase: Phrase, db_client: Any) -> None:
+        key = (username, phrase.phrase_id)
+        with self._lock:
+            if key in self._pending:
+                return
+            self._pending[key] = (phrase, db_client)
+            pending = len(self._pending)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="translation-backfill", daemon=True
+                )
+                self._thread.start()
+        logger.info(
+            f"Queued phrase {phrase.phrase_id} of {username} for translation backfill"
+        )
+        if pending >= self.batch_size:
+            self._wake.set()
+
+    @property
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def _take_batch(self) -> List[Tuple[Tuple[str, str], Phrase, Any]]:
+        now = time.time()
+        with self._lock:
+            batch = []
+            for key in list(self._pending):
+                if len(batch) >= self.batch_size:
+                    break
+                if self._retry_at.get(key, 0.0) > now:
+                    continue
+                phrase, db_client = self._pending.pop(key)
+                batch.append((key, phrase, db_client))
+            return batch
+
+    # Failed phrases are tried again after a delay that doubles per attempt,
+    # up to max_backoff, so a down LLM or database doesn't lose them.
+    def _retry_later(
+        self, key: Tuple[str, str], phrase: Phrase, db_client: Any
+    ) -> None:
+        with self._lock:
+            attempts = self._attempts.get(key, 0) + 1
+            self._attempts[key] = attempts
+            self._retry_at[key] = time.time() + min(
+                self.interval * 2**attempts, self.max_backoff
+            )
+            self._pending.setdefault(key, (phrase, db_client))
+
+    def _forget(self, key: Tuple[str, str]) -> None:
+        with self._lock:
+            self._attempts.pop(key, None)
+            self._retry_at.pop(key, None)
+
+    def _run(self) -> None:
+        while True:
+            self._wake.wait(timeout=self.interval)
+            self._wake.clear()
+            batch = self._take_batch()
+            while batch:
+                self.process_batch(batch)
+                batch = self._take_batch()
+
+    def process_batch(self, batch: List[Tuple[Tuple[str, str], Phrase, Any]]) -> None:
+        logger.info(f"Backfilling translations for {len(batch)} phrases")
+        try:
+            translations = translate_batch_to_base_lang(
+                [phrase.text for _, phrase, _ in batch]
+            )
+        except Exception as e:
+            logger.error(f"Translation backfill failed: {e}")
+            for key, phrase, db_client in batch:
+                self._retry_later(key, phrase, db_client)
+            return
+
+        by_user: Dict[str, List[Tuple[Tuple[str, str], Phrase, Any]]] = defaultdict(
+            list
+        )
+        for (key, phrase, db_client), translation in zip(batch, translations):
+            username, phrase_id = key
+            if translation is None:
+                logger.warning(f"No translation for phrase {phrase_id} of {username}")
+                self._retry_later(key, phrase, db_client)
+                continue
+            # The cached copy may have moved on since the phrase was queued,
+            # e.g. it was activated; writing the queued one would put its
+            # stale progress back into the cache.
+            cache = phrase_caches.peek(username)
+            cached = cache.get(phrase_id) if cache is not None else None
+            if cached is not None:
+                phrase = cached
+            phrase.translation = translation
+            by_user[username].append((key, phrase, db_client))
+
+        for username, items in by_user.items():
+            phrases = [phrase for _, phrase, _ in items]
+            try:
+                outcomes = db.update_progress_batch(username, phrases, items[0][2])
+            except Exception as e:
+                logger.error(f"Failed to store translations for {username}: {e}")
+                outcomes = [False] * len(items)
+            for (key, phrase, db_client), written in zip(items, outcomes):
+                if written:
+                    self._forget(key)
+                else:
+                    self._retry_later(key, phrase, db_client)
+
+
+_translation_backfill: Optional[TranslationBackfill] = None
+_translation_backfill_lock = threading.Lock()
+
+
+def get_translation_backfill() -> TranslationBackfill:
+    global _translation_backfill
+    if _translation_backfill is None:
+        with _translation_backfill_lock:
+            if _translation_backfill is None:
+                _translation_backfill = TranslationBackfill(
+                    batch_size=int(os.getenv("TRANSLATION_BACKFILL_BATCH_SIZE", 20)),
+                    interval=float(os.getenv("TRANSLATION_BACKFILL_INTERVAL", 5.0)),
+                    max_backoff=float(
+                        os.getenv("TRANSLATION_BACKFILL_MAX_BACKOFF", 600.0)
+                    ),
+                )
+    return _translation_backfill
@@ -0,0 +1,104 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+from loguru import logger
+
+from utils.sqlite_utils import connect_sqlite
+from utils.text_utils import normalize_text
+
+
+class TranslationCache:
+    def __init__(
+        self,
+        path: str = "data/translation_cache.db",
+        max_entries: int = 50000,
+        log_every: int = 100,
+    ):
+        self.max_entries = max_entries
+        self.log_every = log_every
+        self.hits = 0
+        self.misses = 0
+        self._writes = 0
+        self._lock = threading.Lock()
+        self._conn = connect_sqlite(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS translations ("
+            "key TEXT PRIMARY KEY, translation TEXT NOT NULL, "
+            "accessed_at REAL NOT NULL)"
+        )
+        self._conn.execute(
+            "CREATE INDEX IF NOT EXISTS idx_translations_accessed_at "
+            "ON translations (accessed_at)"
+        )
+
+    @staticmethod
+    def make_key(text: str, base_lang: str, model_name: str) -> str:
+        raw = "\x1f".join([normalize_text(text), base_lang.casefold(), model_name])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, text: str, base_lang: str, model_name: str) -> Optional[str]:
+        key = self.make_key(text, base_lang, model_name)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT translation FROM translations WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._conn.execute(
+                    "UPDATE translations SET accessed_at = ? WHERE key = ?",
+                    (time.time(), key),
+                )
+            lookups = self.hits + self.misses
+        if lookups % self.log_every == 0:
+            logger.info(f"Translation cache stats: {self.stats()}")
+        return row[0] if row else None
+
+    def set(self, text: str, base_lang: str, model_name: str, translation: str) -> None:
+        key = self.make_key(text, base_lang, model_name)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO translations (key, translation, accessed_at) "
+                "VALUES (?, ?, ?)",
+                (key, translation, time.time()),
+            )
+            self._writes += 1
+            if self._writes % 100 == 0:
+                self._evict()
+
+    def _evict(self) -> None:
+        self._conn.execute(
+            "DELETE FROM translations WHERE key NOT IN ("
+            "SELECT key FROM translations ORDER BY accessed_at DESC LIMIT ?)",
+            (self.max_entries,),
+        )
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+_translation_cache: Optional[TranslationCache] = None
+_translation_cache_lock = threading.Lock()
+
+
+def get_translation_cache() -> TranslationCache:
+    global _translation_cache
+    if _translation_cache is None:
+        with _translation_cache_lock:
+            if _translation_cache is None:
+                _translation_cache = TranslationCache(
+                    path=os.getenv(
+                        "TRANSLATION_CACHE_PATH", "data/translation_cache.db"
+                    ),
+                    max_entries=int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", 50000)),
+                )
+    return _translation_cache
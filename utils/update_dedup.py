@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from loguru import logger
+
+from utils.sqlite_utils import connect_sqlite
+
+
+class SeenUpdates:
+    def __init__(
+        self,
+        max_size: int = 10000,
+        ttl_seconds: float = 3600,
+        db_path: Optional[str] = None,
+    ):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.suppressed = 0
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            self._conn = connect_sqlite(db_path)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS seen_updates ("
+                "update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_seen_updates_seen_at "
+                "ON seen_updates (seen_at)"
+            )
+
+    def _evict(self, now: float) -> None:
+        cutoff = now - self.ttl_seconds
+        while self._seen:
+            update_id, seen_at = next(iter(self._seen.items()))
+            if seen_at >= cutoff and len(self._seen) <= self.max_size:
+                break
+            del self._seen[update_id]
+
+    def _check_persistent(self, update_id: int, now: float) -> bool:
+        cutoff = now - self.ttl_seconds
+        cursor = self._conn.execute(
+            "INSERT INTO seen_updates (update_id, seen_at) VALUES (?, ?) "
+            "ON CONFLICT(update_id) DO UPDATE SET seen_at = excluded.seen_at "
+            "WHERE seen_updates.seen_at < ?",
+            (update_id, now, cutoff),
+        )
+        if cursor.rowcount and update_id % 100 == 0:
+            self._conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (cutoff,))
+            self._conn.execute(
+                "DELETE FROM seen_updates WHERE update_id NOT IN ("
+                "SELECT update_id FROM seen_updates ORDER BY seen_at DESC LIMIT ?)",
+                (self.max_size,),
+            )
+        return cursor.rowcount > 0
+
+    def check_and_add(self, update_id: int) -> bool:
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            is_new = update_id not in self._seen
+            if is_new and self._conn is not None:
+                is_new = self._check_persistent(update_id, now)
+            if is_new:
+                self._seen[update_id] = now
+            else:
+                self.suppressed += 1
+                logger.info(
+                    f"Suppressed duplicate update {update_id} ({self.suppressed} so far)"
+                )
+            return is_new
+
+    def discard(self, update_id: int) -> None:
+        with self._lock:
+            self._seen.pop(update_id, None)
+            if self._conn is not None:
+                self._conn.execute(
+                    "DELETE FROM seen_updates WHERE update_id = ?", (update_id,)
+                )
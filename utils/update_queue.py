@@ -0,0 +1,104 @@
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Hashable, Optional
+
+from loguru import logger
+
+USER_EVENT_FIELDS = (
+    "message",
+    "edited_message",
+    "callback_query",
+    "inline_query",
+    "chosen_inline_result",
+    "my_chat_member",
+    "chat_member",
+)
+
+
+def update_user_key(update: Any) -> Hashable:
+    for field in USER_EVENT_FIELDS:
+        event = getattr(update, field, None)
+        from_user = getattr(event, "from_user", None) if event is not None else None
+        if from_user is not None:
+            return from_user.id
+    return f"update:{update.update_id}"
+
+
+class UpdateDispatcher:
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        max_workers: int = 8,
+        max_pending: int = 1000,
+    ):
+        self.handler = handler
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="update-worker"
+        )
+        self._queues: Dict[Hashable, Deque[Any]] = {}
+        self._pending = 0
+        self._closed = False
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, update: Any) -> bool:
+        key = update_user_key(update)
+        with self._lock:
+            if self._closed:
+                logger.warning(
+                    f"Dispatcher closed, rejecting update {update.update_id}"
+                )
+                return False
+            if self._pending >= self.max_pending:
+                logger.warning(
+                    f"Dispatcher full ({self._pending} pending), rejecting update {update.update_id}"
+                )
+                return False
+            self._pending += 1
+            queue = self._queues.get(key)
+            if queue is not None:
+                queue.append(update)
+                return True
+            self._queues[key] = deque([update])
+
+        self._executor.submit(self._drain, key)
+        return True
+
+    def _drain(self, key: Hashable) -> None:
+        while True:
+            with self._lock:
+                queue = self._queues[key]
+                if not queue:
+                    del self._queues[key]
+                    return
+                # The head stays queued while it runs so that new updates for
+                # the same user are appended behind it instead of starting a
+                # second drain.
+                update = queue[0]
+
+            try:
+                self.handler(update)
+            except Exception as e:
+                logger.error(f"Error processing update {update.update_id}: {e}")
+            finally:
+                with self._lock:
+                    queue.popleft()
+                    self._pending -= 1
+                    if self._pending == 0:
+                        self._idle.notify_all()
+
+    def shutdown(self, timeout: Optional[float] = None) -> bool:
+        logger.info(f"Shutting down dispatcher with {self._pending} pending updates")
+        with self._lock:
+            self._closed = True
+            drained = self._idle.wait_for(lambda: self._pending == 0, timeout=timeout)
+        self._executor.shutdown(wait=drained)
+        if not drained:
+            logger.warning(f"Dispatcher shut down with {self._pending} updates left")
+        return drained
@@ -0,0 +1,131 @@
+import gzip
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from loguru import logger
+
+from utils.db import get_phrase_cache
+from utils.explain_grammar import explain_grammar
+from utils.phrase_cache import phrase_caches
+from utils.phrase_reservoir import phrase_reservoir
+from utils.session_store import SessionStore
+
+SNAPSHOT_FORMAT = 1
+
+
+class WarmState:
+    def __init__(
+        self,
+        sessions: SessionStore,
+        db_client: Any,
+        path: str = "data/warm_state.json.gz",
+        interval: float = 300.0,
+    ):
+        self.sessions = sessions
+        self.db_client = db_client
+        self.path = path
+        self.interval = interval
+        self._write_lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._restored: List[str] = []
+
+    def capture(self) -> Dict[str, Any]:
+        return {
+            "format": SNAPSHOT_FORMAT,
+            "written_at": time.time(),
+            "phrase_caches": phrase_caches.export(),
+            "explain_grammar": explain_grammar.cache.export(),
+            "phrase_reservoir": phrase_reservoir.export(),
+            "sessions": self.sessions.export_entries(),
+        }
+
+    def write(self) -> None:
+        with self._write_lock:
+            started = time.perf_counter()
+            state = self.capture()
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with gzip.open(tmp_path, "wt", encoding="utf-8") as f:
+                json.dump(state, f, separators=(",", ":"), default=str)
+            os.replace(tmp_path, self.path)
+            logger.info(
+                f"Wrote warm state for {len(state['phrase_caches'])} users "
+                f"in {time.perf_counter() - started:.3f}s"
+            )
+
+    def restore(self) -> bool:
+        if not os.path.exists(self.path):
+            logger.info("No warm state snapshot to restore")
+            return False
+        started = time.perf_counter()
+        try:
+            with gzip.open(self.path, "rt", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to read warm state snapshot: {e}")
+            return False
+        if state.get("format") != SNAPSHOT_FORMAT:
+            logger.warning(f"Ignoring warm state snapshot format {state.get('format')}")
+            return False
+
+        for username, cache_state in state["phrase_caches"].items():
+            phrase_caches.get(username).restore(cache_state)
+            self._restored.append(username)
+        explain_grammar.cache.load(state["explain_grammar"])
+        phrase_reservoir.load(state.get("phrase_reservoir", []))
+        self.sessions.import_entries(state["sessions"])
+        logger.info(
+            f"Restored warm state for {len(state['phrase_caches'])} users "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+        return True
+
+    # Checks each restored user against its database version ahead of the
+    # first update, reloading the users whose data moved on.
+    def reconcile(self) -> None:
+        restored, self._restored = self._restored, []
+        for username in restored:
+            get_phrase_cache(username, self.db_client)
+
+    def start(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="warm-state", daemon=True
+            )
+            self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self.reconcile()
+        except Exception as e:
+            logger.error(f"Warm state reconciliation failed: {e}")
+        while not self._stopped.wait(timeout=self.interval):
+            try:
+                self.write()
+            except Exception as e:
+                logger.error(f"Failed to write warm state: {e}")
+
+    def close(self) -> None:
+        self._stopped.set()
+        try:
+            self.write()
+        except Exception as e:
+            logger.error(f"Failed to write warm state on shutdown: {e}")
+
+
+def get_warm_state(sessions: SessionStore, db_client: Any) -> Optional[WarmState]:
+    path = os.getenv("WARM_STATE_PATH", "data/warm_state.json.gz")
+    if not path:
+        return None
+    return WarmState(
+        sessions,
+        db_client,
+        path=path,
+        interval=float(os.getenv("WARM_STATE_INTERVAL", 300)),
+    )